@@ -0,0 +1,558 @@
+'''
+Instruction-set simulator for the QRAcc command stream.
+
+Executes the same commands.txt that tb_qracc_top's bus_write_loop consumes
+(LOAD, LOADBURST, WAITBUSY, WAITREAD, INFO/ENDINFO, END) against a transaction-level
+model of qracc_top. The CSR and trigger words produced by
+bundle_config_into_write and make_trigger_write are decoded exactly as
+qracc_csr.sv does, and the controller states are modelled per transaction
+instead of per cycle, so a whole network runs in seconds.
+
+Bit-accuracy follows the RTL datapath:
+    ACTMEM byte layout       (ram_2w2r, external writes MSB first)
+    feature loader windows   (channel-minor im2col, padding with padding_value)
+    analog MAC               (qracc_model: twos_to_bipolar -> ts_qracc MBL -> 4b ADC -> seq_acc)
+    partial sums             (psum_buffer, row tiles of layers longer than the SRAM)
+    digital MAC              (wsacc_pe_cluster)
+    output scaler            (output_scaler, mm_output_aligner, piso_write_queue)
+
+Usage:
+    iss = QrAccIss().run_file('tb/qracc_top/inputs/commands.txt')
+    iss.ofmaps['node_name']     # Ofmap of each node as it sits in ACTMEM (HWC)
+    iss.readouts                # List of (node_name, bytes) read out by WAITREAD
+'''
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .qracc_model import wrap_signed, qracc_mac
+
+# Mirrors qracc_pkg.svh / qracc_csr.sv
+CSR_BASE_ADDR = 0x10
+ACC_BASE_ADDR = 0x100
+
+CSR_REG_MAIN        = 0
+CSR_REG_CONFIG      = 1
+CSR_REG_IFMAP_DIMS  = 2
+CSR_REG_OFMAP_DIMS  = 3
+CSR_REG_CHANNELS    = 4
+CSR_REG_OFFSETS     = 5
+CSR_REG_PADDING     = 6
+CSR_REG_LOAD_WINDOW = 7
+CSR_REG_OFMAP_LAYOUT = 8
+CSR_REG_IFMAP_LAYOUT = 9
+CSR_REG_IFMAP_ADDR  = 10
+CSR_REG_OFMAP_ADDR  = 11
+NUM_CSR             = 16
+
+# psum_mode_t, CSR 1 bits 3:2
+PSUM_OFF        = 0
+PSUM_FIRST      = 1
+PSUM_ACCUMULATE = 2
+PSUM_LAST       = 3
+
+TRIGGER_IDLE                = 0
+TRIGGER_LOAD_ACTIVATION     = 1
+TRIGGER_LOADWEIGHTS         = 2
+TRIGGER_COMPUTE_ANALOG      = 3
+TRIGGER_COMPUTE_DIGITAL     = 4
+TRIGGER_READ_ACTIVATION     = 5
+TRIGGER_LOADWEIGHTS_DIGITAL = 6
+TRIGGER_LOAD_SCALER         = 7
+
+# qracc_controller states that consume data words from the bus
+S_IDLE                 = 'S_IDLE'
+S_LOADACTS             = 'S_LOADACTS'
+S_LOADWEIGHTS          = 'S_LOADWEIGHTS'
+S_LOAD_DIGITAL_WEIGHTS = 'S_LOAD_DIGITAL_WEIGHTS'
+S_LOADSCALER           = 'S_LOADSCALER'
+S_LOADBIAS             = 'S_LOADBIAS'
+# States the ISS finishes within the trigger transaction
+S_COMPUTE_ANALOG       = 'S_COMPUTE_ANALOG'
+S_COMPUTE_DIGITAL      = 'S_COMPUTE_DIGITAL'
+S_READACTS             = 'S_READACTS'
+
+def decode_csr_config(csr):
+    '''
+    Decodes the CSR register file into a config dict.
+    Keys are the same as QrAccNodeCode.config().
+    '''
+    config_word   = int(csr[CSR_REG_CONFIG])
+    ifmap_word    = int(csr[CSR_REG_IFMAP_DIMS])
+    ofmap_word    = int(csr[CSR_REG_OFMAP_DIMS])
+    channels_word = int(csr[CSR_REG_CHANNELS])
+    offsets_word  = int(csr[CSR_REG_OFFSETS])
+    padding_word  = int(csr[CSR_REG_PADDING])
+    window_word   = int(csr[CSR_REG_LOAD_WINDOW])
+    layout_word   = int(csr[CSR_REG_OFMAP_LAYOUT])
+    ifmap_layout_word = int(csr[CSR_REG_IFMAP_LAYOUT])
+    ifmap_addr_word = int(csr[CSR_REG_IFMAP_ADDR])
+    ofmap_addr_word = int(csr[CSR_REG_OFMAP_ADDR])
+
+    return {
+        "n_input_bits_cfg":       (config_word >> 24) & 0xF,
+        "n_output_bits_cfg":      (config_word >> 28) & 0xF,
+        "unsigned_acts":          (config_word >> 1) & 0x1,
+        "binary_cfg":             (config_word >> 0) & 0x1,
+        "psum_mode":              (config_word >> 2) & 0x3,
+        "adc_ref_range_shifts":   (config_word >> 4) & 0xF,
+        "filter_size_y":          (config_word >> 8) & 0xF,
+        "filter_size_x":          (config_word >> 12) & 0xF,
+        "input_fmap_dimx":        ifmap_word & 0xFFFF,
+        "input_fmap_dimy":        (ifmap_word >> 16) & 0xFFFF,
+        "output_fmap_dimx":       ofmap_word & 0xFFFF,
+        "output_fmap_dimy":       (ofmap_word >> 16) & 0xFFFF,
+        "stride_x":               (config_word >> 16) & 0xF,
+        "stride_y":               (config_word >> 20) & 0xF,
+        "num_input_channels":     channels_word & 0xFFFF,
+        "num_output_channels":    (channels_word >> 16) & 0xFFFF,
+        "mapped_matrix_offset_x": offsets_word & 0xFFFF,
+        "mapped_matrix_offset_y": (offsets_word >> 16) & 0xFFFF,
+        "padding":                padding_word & 0xF,
+        "padding_value":          (padding_word >> 4) & 0xFF,
+        "load_window_start":      window_word & 0xFFFF,
+        "load_window_count":      (window_word >> 16) & 0xFFFF,
+        "ofmap_channel_offset":   layout_word & 0xFFFF,
+        "ofmap_pixel_stride":     (layout_word >> 16) & 0xFFFF,
+        "ifmap_channel_offset":   ifmap_layout_word & 0xFFFF,
+        "ifmap_pixel_stride":     (ifmap_layout_word >> 16) & 0xFFFF,
+        "ifmap_addr":             ifmap_addr_word & 0x3FFFF,
+        "ifmap_addr_en":          (ifmap_addr_word >> 31) & 0x1,
+        "ofmap_addr":             ofmap_addr_word & 0x3FFFF,
+        "ofmap_addr_en":          (ofmap_addr_word >> 31) & 0x1,
+    }
+
+def output_scaler(wx, scale, shift, offset, bias, n_output_bits, unsigned_acts):
+    '''
+    output_scaler.sv model, broadcast over the last axis (columns).
+    '''
+    wx = np.asarray(wx, dtype=np.int64)
+    biased = wrap_signed(wx + bias, 32)
+    neg_magnitude = (-biased) & 0xFFFF
+    scaled = np.where(biased < 0, -(neg_magnitude * scale), biased * scale)
+    presat = ((scaled >> 16) >> shift) + offset
+    if unsigned_acts:
+        low, high = 0, (1 << n_output_bits) - 1
+    else:
+        low, high = -(1 << (n_output_bits - 1)), (1 << (n_output_bits - 1)) - 1
+    return np.clip(presat, low, high)
+
+class QrAccIss(object):
+    '''
+    Transaction-level, bit-accurate simulator of qracc_top driven by
+    the compiler's command stream.
+    '''
+
+    def __init__(
+        self,
+        sram_rows = 256,
+        sram_cols = 256,
+        num_cols_per_bank = 32,
+        num_adc_bits = 4,
+        accumulator_bits = 16,
+        psum_bits = 24,
+        psum_depth = 256,
+        ws_num_pes = 32,
+        ws_window_elements = 9,
+        globalbuffer_depth = 2**21,
+        interface_width = 32,
+        verbose = False
+    ):
+        self.sram_rows = sram_rows
+        self.sram_cols = sram_cols
+        self.num_cols_per_bank = num_cols_per_bank
+        self.num_banks = sram_cols // num_cols_per_bank
+        self.num_adc_bits = num_adc_bits
+        self.accumulator_bits = accumulator_bits
+        self.psum_bits = psum_bits
+        self.psum_depth = psum_depth
+        self.ws_num_pes = ws_num_pes
+        self.ws_window_elements = ws_window_elements
+        self.feature_loader_elements = ws_num_pes * ws_window_elements
+        self.interface_width = interface_width
+        self.verbose = verbose
+
+        self.csr = np.zeros(NUM_CSR, dtype=np.uint32)
+        self.actmem = np.zeros(globalbuffer_depth, dtype=np.uint8)
+        self.weights = np.zeros((sram_rows, sram_cols), dtype=np.int8)
+        self.digital_weights = np.zeros((ws_num_pes, ws_window_elements), dtype=np.int8)
+        self.scaler_words = np.zeros(sram_cols, dtype=np.int64)
+        self.bias_words = np.zeros(sram_cols, dtype=np.int64)
+        self.psums = np.zeros((psum_depth, sram_cols), dtype=np.int64)  # psum_buffer
+
+        self.state = S_IDLE
+        self.ptr = 0
+        self.ifmap_start_addr = 0
+        self.ofmap_start_addr = 0
+        self.last_ofmap_addr = 0
+
+        self.node_name = None
+        self.ofmaps = {}
+        self.readouts = []
+        self.word_counts = {}
+
+    def log(self, msg):
+        if self.verbose:
+            print(f'[QRACC_ISS] {msg}')
+
+    @property
+    def config(self):
+        return decode_csr_config(self.csr)
+
+    def run_file(self, path):
+        with open(path, 'r') as f:
+            return self.run(f.read().splitlines())
+
+    def run(self, commands):
+        '''
+        Executes a list of command lines. Returns self for chaining.
+        Consecutive writes to the data port are executed as one block.
+        '''
+        lines = iter(commands)
+        data_words = []
+        for line in lines:
+            tokens = line.split()
+            if not tokens:
+                continue
+            op = tokens[0]
+            if op == 'LOAD':
+                addr = int(tokens[1], 16)
+                if addr >= ACC_BASE_ADDR:
+                    data_words.append(int(tokens[2], 16))
+                    continue
+                self.flush_data_writes(data_words)
+                self.bus_write(addr, int(tokens[2], 16))
+                continue
+            if op == 'LOADBURST':
+                addr, n = int(tokens[1], 16), int(tokens[2], 16)
+                words = [int(next(lines), 16) for _ in range(n)]
+                if addr >= ACC_BASE_ADDR:
+                    data_words += words
+                    continue
+                self.flush_data_writes(data_words)
+                for word in words:
+                    self.bus_write(addr, word)
+                continue
+            self.flush_data_writes(data_words)
+            if op == 'INFO':
+                self.node_name = next(lines).strip()
+                for info_line in lines:
+                    if info_line.strip() == 'ENDINFO':
+                        break
+            elif op == 'WAITBUSY':
+                self.snoop_ofmap()
+            elif op == 'WAITREAD':
+                pass
+            elif op == 'END':
+                break
+            else:
+                raise ValueError(f'Unknown command: {line}')
+        self.flush_data_writes(data_words)
+        return self
+
+    def flush_data_writes(self, data_words):
+        if data_words:
+            self.data_write(np.array(data_words, dtype=np.int64))
+            data_words.clear()
+
+    def bus_write(self, addr, data):
+        if addr >= ACC_BASE_ADDR:
+            self.data_write(np.array([data], dtype=np.int64))
+        elif addr >= CSR_BASE_ADDR:
+            csr_addr = addr - CSR_BASE_ADDR
+            self.csr[csr_addr] = data
+            if csr_addr == CSR_REG_MAIN:
+                self.trigger(data)
+        else:
+            raise ValueError(f'Write to unmapped address {addr:08x}')
+
+    def trigger(self, main_word):
+        '''
+        Controller transitions out of S_IDLE on a trigger write.
+        Compute and readout finish within the same transaction.
+        '''
+        trigger = main_word & 0x7
+        preserve_ifmap = (main_word >> 12) & 0x1
+
+        if self.state != S_IDLE or trigger == TRIGGER_IDLE:
+            return
+        self.ptr = 0
+        if trigger == TRIGGER_LOAD_ACTIVATION:
+            cfg = self.config
+            self.ifmap_start_addr = cfg['ifmap_addr'] if cfg['ifmap_addr_en'] else 0
+            self.state = S_LOADACTS
+        elif trigger == TRIGGER_LOADWEIGHTS:
+            self.ptr = self.weight_load_window()[0]
+            self.state = S_LOADWEIGHTS
+        elif trigger == TRIGGER_LOADWEIGHTS_DIGITAL:
+            self.state = S_LOAD_DIGITAL_WEIGHTS
+        elif trigger == TRIGGER_LOAD_SCALER:
+            self.ptr = self.load_window(self.sram_cols)[0]
+            self.state = S_LOADSCALER
+        elif trigger == TRIGGER_COMPUTE_ANALOG:
+            self.compute(analog=True, preserve_ifmap=preserve_ifmap)
+        elif trigger == TRIGGER_COMPUTE_DIGITAL:
+            self.compute(analog=False, preserve_ifmap=preserve_ifmap)
+        elif trigger == TRIGGER_READ_ACTIVATION:
+            self.read_activation()
+
+    def data_write(self, words):
+        '''
+        Writes a block of words to the accelerator data port.
+        Each state consumes as many words as it expects, the rest
+        go to the next state. Writes in S_IDLE are dropped, as in the RTL.
+        '''
+        while len(words):
+            state = self.state
+            if state == S_IDLE:
+                taken = len(words)
+            elif state == S_LOADACTS:
+                taken = self.load_activation_words(words)
+            elif state == S_LOADWEIGHTS:
+                taken = self.load_weight_words(words)
+            elif state == S_LOAD_DIGITAL_WEIGHTS:
+                taken = self.load_digital_weight_words(words)
+            elif state in (S_LOADSCALER, S_LOADBIAS):
+                taken = self.load_scaler_words(words)
+            self.word_counts[state] = self.word_counts.get(state, 0) + taken
+            words = words[taken:]
+
+    def load_activation_words(self, words):
+        cfg = self.config
+        elements_per_word = self.interface_width // cfg['n_input_bits_cfg']
+        ifmap_size = cfg['input_fmap_dimx'] * cfg['input_fmap_dimy'] * cfg['num_input_channels']
+        remaining = max(-(-(ifmap_size - self.ptr) // elements_per_word), 1)
+        taken = min(len(words), remaining)
+
+        # ram_2w2r external port writes the MSB byte first
+        word_bytes = words[:taken].astype('>u4').view(np.uint8).reshape(taken, 4)
+        addrs = self.ifmap_start_addr + self.ptr + elements_per_word * np.arange(taken)[:, None] + np.arange(4)
+        self.actmem[addrs] = word_bytes
+
+        last_ptr = self.ptr + elements_per_word * (taken - 1)
+        if last_ptr + elements_per_word < ifmap_size:
+            self.ptr = last_ptr + elements_per_word
+        else:
+            self.ofmap_start_addr = self.ifmap_start_addr + last_ptr + elements_per_word
+            self.state = S_IDLE
+        return taken
+
+    def load_window(self, total):
+        '''
+        (start, end) words of a weight or scaler load. CSR_REG_LOAD_WINDOW
+        holds start[15:0] and count[31:16], a count of 0 loads all total words.
+        '''
+        window_word = int(self.csr[CSR_REG_LOAD_WINDOW])
+        start = window_word & 0xFFFF
+        count = (window_word >> 16) & 0xFFFF
+        if count == 0:
+            return 0, total
+        return start, start + count
+
+    def weight_load_window(self):
+        return self.load_window(self.sram_rows * self.num_banks)
+
+    def load_weight_words(self, words):
+        total = self.weight_load_window()[1]
+        taken = min(len(words), total - self.ptr)
+        word_ids = self.ptr + np.arange(taken)
+        bits = (words[:taken, None] >> np.arange(self.num_cols_per_bank)) & 1
+        rows = word_ids // self.num_banks
+        cols = (word_ids % self.num_banks)[:, None] * self.num_cols_per_bank + np.arange(self.num_cols_per_bank)
+        self.weights[rows[:, None], cols] = bits
+        self.ptr += taken
+        if self.ptr >= total:
+            self.state = S_IDLE
+        return taken
+
+    def load_digital_weight_words(self, words):
+        num_write_sets = self.ws_num_pes // 4
+        total = self.ws_num_pes * self.ws_window_elements // 4
+        taken = min(len(words), total - self.ptr)
+        word_ids = self.ptr + np.arange(taken)
+        byte_values = (words[:taken, None] >> (8 * np.arange(4))) & 0xFF
+        pes = 4 * (word_ids % num_write_sets)[:, None] + np.arange(4)
+        elements = np.repeat((word_ids // num_write_sets)[:, None], 4, axis=1)
+        self.digital_weights[pes, elements] = wrap_signed(byte_values, 8)
+        self.ptr += taken
+        if self.ptr >= total:
+            self.state = S_IDLE
+        return taken
+
+    def load_scaler_words(self, words):
+        start, end = self.load_window(self.sram_cols)
+        taken = min(len(words), end - self.ptr)
+        if self.state == S_LOADSCALER:
+            self.scaler_words[self.ptr:self.ptr + taken] = words[:taken]
+        else:
+            self.bias_words[self.ptr:self.ptr + taken] = wrap_signed(words[:taken], 32)
+        self.ptr += taken
+        if self.ptr >= end:
+            self.ptr = start  # Biases use the same window
+            self.state = S_LOADBIAS if self.state == S_LOADSCALER else S_IDLE
+        return taken
+
+    def load_windows(self, cfg):
+        '''
+        Feature loader + padder. Returns the (npix, feature_loader_elements)
+        staging contents for every output pixel, x-inner.
+        '''
+        C = cfg['num_input_channels']
+        dimx, dimy = cfg['input_fmap_dimx'], cfg['input_fmap_dimy']
+        fx, fy = cfg['filter_size_x'], cfg['filter_size_y']
+        sx, sy = cfg['stride_x'], cfg['stride_y']
+        odx, ody = cfg['output_fmap_dimx'], cfg['output_fmap_dimy']
+        pad = cfg['padding']
+
+        # Row tiles and channel groups read C channels out of a wider ifmap (CSR_REG_IFMAP_LAYOUT)
+        stride = cfg['ifmap_pixel_stride'] or C
+        channel_offset = cfg['ifmap_channel_offset']
+        ifmap = self.actmem[self.ifmap_start_addr:self.ifmap_start_addr + dimx * dimy * stride]
+        ifmap = ifmap.reshape(dimy, dimx, stride)[:, :, channel_offset:channel_offset + C]
+        ifmap = np.pad(ifmap, ((pad, pad), (pad, pad), (0, 0)), constant_values=cfg['padding_value'])
+
+        windows = sliding_window_view(ifmap, (fy, fx), axis=(0, 1))  # (Y, X, C, fy, fx)
+        windows = windows[:(ody - 1) * sy + 1:sy, :(odx - 1) * sx + 1:sx]
+        windows = windows.transpose(0, 1, 3, 4, 2).reshape(ody * odx, -1)  # Channel-minor
+
+        offset_y = cfg['mapped_matrix_offset_y']
+        window_len = min(windows.shape[1], self.feature_loader_elements - offset_y)
+        staging = np.zeros((windows.shape[0], self.feature_loader_elements), dtype=np.int64)
+        staging[:, offset_y:offset_y + window_len] = windows[:, :window_len]
+        return staging
+
+    def analog_mac(self, x, cfg):
+        '''
+        Bit-serial charge-redistribution MAC over all 256 rows (qracc_model.qracc_mac).
+        x: (npix, sram_rows) activations as presented to twos_to_bipolar.
+        '''
+        return qracc_mac(
+            x, self.weights,
+            adc_ref_range_shifts = cfg['adc_ref_range_shifts'],
+            n_input_bits         = cfg['n_input_bits_cfg'],
+            unsigned_acts        = cfg['unsigned_acts'],
+            binary               = cfg['binary_cfg'],
+            num_adc_bits         = self.num_adc_bits,
+            accumulator_bits     = self.accumulator_bits,
+        )
+
+    def digital_mac(self, staging, cfg):
+        '''
+        wsacc_pe_cluster: PE i takes window elements i + j*C.
+        '''
+        C = cfg['num_input_channels']
+        pe = np.arange(self.ws_num_pes)[:, None]
+        j = np.arange(self.ws_window_elements)[None, :]
+        idx = pe + j * C
+        valid = idx < self.feature_loader_elements
+        x = staging[:, np.where(valid, idx, 0)] * valid  # (npix, pe, j)
+        out = (x * self.digital_weights.astype(np.int64)).sum(axis=-1)
+        out = wrap_signed(out, self.accumulator_bits)
+        wx = np.zeros((staging.shape[0], self.sram_cols), dtype=np.int64)
+        wx[:, :self.ws_num_pes] = out
+        return wx
+
+    def scale_outputs(self, wx, cfg):
+        scale = (self.scaler_words >> 4) & 0xFFFF
+        shift = self.scaler_words & 0xF
+        offset = (self.scaler_words >> 20) & 0xFF
+        return output_scaler(wx, scale, shift, offset, self.bias_words,
+                             cfg['n_output_bits_cfg'], cfg['unsigned_acts'])
+
+    def compute(self, analog, preserve_ifmap):
+        cfg = self.config
+        # Tensors placed by the ACTMEM allocator (CSR_REG_IFMAP_ADDR, CSR_REG_OFMAP_ADDR)
+        if cfg['ifmap_addr_en']:
+            self.ifmap_start_addr = cfg['ifmap_addr']
+        if cfg['ofmap_addr_en']:
+            self.ofmap_start_addr = cfg['ofmap_addr']
+        staging = self.load_windows(cfg)
+        if analog:
+            wx = self.analog_mac(staging[:, :self.sram_rows], cfg)
+            wx = self.accumulate_psums(wx, cfg)
+        else:
+            wx = self.digital_mac(staging, cfg)
+        y = self.scale_outputs(wx, cfg).astype(np.int64) & 0xFF
+
+        # mm_output_aligner
+        offset_x = cfg['mapped_matrix_offset_x']
+        aligned = np.zeros_like(y)
+        aligned[:, :self.sram_cols - offset_x] = y[:, offset_x:]
+
+        # piso_write_queue writes whole banks, the tail of each pixel is
+        # overwritten by later writes except for the last one. A tiled ofmap
+        # (CSR_REG_OFMAP_LAYOUT) is written ofmap_pixel_stride channels per pixel.
+        K = cfg['num_output_channels']
+        stride = self.ofmap_pixel_stride(cfg)
+        npix = aligned.shape[0]
+        written_banks = -(-K // self.num_cols_per_bank)
+        bank_bytes = written_banks * self.num_cols_per_bank
+        base = self.ofmap_start_addr
+        pixel_addrs = base + cfg['ofmap_channel_offset'] + stride * np.arange(npix)
+        if not (analog and cfg['psum_mode'] in (PSUM_FIRST, PSUM_ACCUMULATE)):
+            self.actmem[pixel_addrs[:, None] + np.arange(bank_bytes)] = aligned[:, :bank_bytes]
+            self.actmem[pixel_addrs[:, None] + np.arange(K)] = aligned[:, :K]
+
+        self.log(f'{self.node_name}: computed {npix}x{K} ofmap at {base:08x}')
+        self.last_ofmap_addr = base
+        if not preserve_ifmap:
+            self.ifmap_start_addr = self.ofmap_start_addr
+            self.ofmap_start_addr = self.ofmap_start_addr + npix * stride + K
+
+    def accumulate_psums(self, wx, cfg):
+        '''
+        psum_buffer: row tiles before the last add their MAC outputs into
+        the partial sums, the last one adds them and saturates the total
+        to the accumulator width for the output scaler.
+        '''
+        mode = cfg['psum_mode']
+        if mode == PSUM_OFF:
+            return wx
+        npix = wx.shape[0]
+        if npix > self.psum_depth:
+            raise ValueError(f'{self.node_name}: {npix} output pixels do not fit in the {self.psum_depth} partial sums.')
+        total = wx if mode == PSUM_FIRST else wrap_signed(self.psums[:npix] + wx, self.psum_bits)
+        if mode != PSUM_LAST:
+            self.psums[:npix] = total
+            return wx
+        half = 1 << (self.accumulator_bits - 1)
+        return np.clip(total, -half, half - 1)
+
+    def ofmap_pixel_stride(self, cfg=None):
+        cfg = self.config if cfg is None else cfg
+        return cfg['ofmap_pixel_stride'] or cfg['num_output_channels']
+
+    def ofmap_size(self, cfg=None):
+        cfg = self.config if cfg is None else cfg
+        return cfg['output_fmap_dimx'] * cfg['output_fmap_dimy'] * self.ofmap_pixel_stride(cfg)
+
+    def snoop_ofmap(self):
+        '''
+        Same role as SNOOP_OFMAP in the tb, but exports the ofmap
+        even when the ifmap was preserved.
+        '''
+        cfg = self.config
+        stride = self.ofmap_pixel_stride(cfg)
+        size = self.ofmap_size(cfg)
+        ofmap = self.actmem[self.last_ofmap_addr:self.last_ofmap_addr + size].copy()
+        self.ofmaps[self.node_name] = ofmap.reshape(
+            cfg['output_fmap_dimy'], cfg['output_fmap_dimx'], stride)
+
+    def read_activation(self):
+        size = self.ofmap_size()
+        data = self.actmem[self.ifmap_start_addr:self.ifmap_start_addr + size].copy()
+        self.readouts.append((self.node_name, data))
+
+if __name__ == '__main__':
+    import os
+    import sys
+
+    commands_path = sys.argv[1] if len(sys.argv) > 1 else 'tb/qracc_top/inputs/commands.txt'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+
+    iss = QrAccIss(verbose=True).run_file(commands_path)
+    print(f'[QRACC_ISS] Executed {len(iss.ofmaps)} nodes, {len(iss.readouts)} readouts')
+
+    if output_path is not None:
+        os.makedirs(output_path, exist_ok=True)
+        for name, ofmap in iss.ofmaps.items():
+            np.savetxt(os.path.join(output_path, f'{name}.txt'), ofmap.reshape(-1), fmt='%d')
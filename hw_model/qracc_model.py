@@ -0,0 +1,163 @@
+'''
+Bit-accurate model of the analog QR MAC, vectorized over a batch of
+input vectors.
+
+Follows the RTL of one seq_acc:
+    twos_to_bipolar      sign and magnitude of each activation
+    bit planes           one trit per cycle, LSB first (seq_acc PISO buffers)
+    switch matrix + MBL  charge redistribution on each column: rows storing
+                         a 1 drive the PSM side, rows storing a 0 the NSM
+                         side, which stays at VRST in binary mode (ts_qracc)
+    ADC                  2**numAdcBits-1 comparators over the reference range
+                         set by adc_ref_range_shifts, thermometer code encoded
+                         back to -8..7 (qr_acc_wrapper AdcEncoderLogic)
+    accumulation         shift-add of the planes, << adc_ref_range_shifts (seq_acc)
+
+Usage:
+    y = qracc_mac(x, weights, adc_ref_range_shifts=2)   # (batch, cols)
+    ideal = ideal_mac(x, weights)
+
+Every stage works on whole arrays, so SNR sweeps over thousands of
+vectors run without AMS simulation. QrAccIss uses qracc_mac for its
+analog computes.
+'''
+
+import numpy as np
+
+def wrap_signed(x, bits):
+    '''
+    Two's complement wraparound of an integer array to the given width
+    '''
+    x = np.asarray(x, dtype=np.int64)
+    half = 1 << (bits - 1)
+    return ((x + half) & ((1 << bits) - 1)) - half
+
+def twos_to_bipolar(x, input_bits, lane_bits = 8):
+    '''
+    twos_to_bipolar.sv: (p, n) magnitudes of x, one of them 0.
+    x holds lane_bits-wide two's complement values (or their signed value).
+    Unsigned activations use input_bits = n_input_bits + 1, their sign bit
+    is past the lane and never set.
+    '''
+    mask = (1 << lane_bits) - 1
+    x = np.asarray(x, dtype=np.int64) & mask
+    sign_bit = input_bits - 1
+    if sign_bit < lane_bits:
+        is_neg = ((x >> sign_bit) & 1).astype(bool)
+    else:
+        is_neg = np.zeros(x.shape, dtype=bool)
+    p = np.where(is_neg, 0, x)
+    n = np.where(is_neg, (-x) & mask, 0)
+    return p, n
+
+def input_trits(p, n, num_planes):
+    '''
+    (planes, ...) trits driven on the rows, plane 0 first: +1 where the p bit
+    is set (VDR on PSM), -1 where the n bit is (VSS on PSM), 0 on VRST.
+    '''
+    planes = np.arange(num_planes).reshape((-1,) + (1,) * np.ndim(p))
+    return ((p[None] >> planes) & 1) - ((n[None] >> planes) & 1)
+
+def column_mbl(trits, weights, binary = False):
+    '''
+    ts_qracc toMBL: MBL value of each column for each plane, (..., cols).
+    weights: (rows, cols), the SRAM bits (1 or +1 is a set bit).
+    Bipolar mode drives the NSM with the opposite trit, so cleared bits
+    count -1. Binary mode leaves the NSM on VRST, so they count 0.
+    '''
+    bits = (np.asarray(weights) > 0).astype(np.float32)
+    w = bits if binary else 2 * bits - 1
+    # Sums of at most rows trits, exact in float32
+    return np.rint(np.asarray(trits, dtype=np.float32) @ w).astype(np.int64)
+
+def adc_levels(mbl, adc_ref_range_shifts, num_adc_bits = 4):
+    '''
+    ts_qracc adc_out: signed num_adc_bits level of each MBL value.
+    Out-of-range values saturate, in-range values keep bits [s+3:s], plus
+    a roundup from bit s-1 when s > 1, wrapped to num_adc_bits.
+    '''
+    s = adc_ref_range_shifts
+    mbl = np.asarray(mbl, dtype=np.int64)
+    adc_max = (1 << (num_adc_bits - 1 + s)) - 1
+    adc_min = -(1 << (num_adc_bits - 1 + s))
+
+    raw = (mbl >> s) & ((1 << num_adc_bits) - 1)
+    if s > 1:
+        raw = raw + ((mbl >> (s - 1)) & 1)
+    raw = wrap_signed(raw, num_adc_bits)
+
+    out = np.where(mbl > adc_max, (1 << (num_adc_bits - 1)) - 1, raw)
+    out = np.where(mbl < adc_min, -(1 << (num_adc_bits - 1)), out)
+    return out
+
+def adc_comparators(levels, num_adc_bits = 4):
+    '''
+    ts_qracc ADC_OUT: (..., 2**num_adc_bits - 1) comparator outputs,
+    comparator i is set when level + 2**(num_adc_bits-1) > i.
+    '''
+    comp_count = (1 << num_adc_bits) - 1
+    levels = np.asarray(levels, dtype=np.int64)[..., None] + (1 << (num_adc_bits - 1))
+    return levels > np.arange(comp_count)
+
+def adc_encode(comparators, num_adc_bits = 4):
+    '''
+    qr_acc_wrapper AdcEncoderLogic: the highest set comparator gives the
+    level, lower ones are don't-cares. No comparator set is the lowest level.
+    '''
+    comparators = np.asarray(comparators, dtype=bool)
+    comp_count = comparators.shape[-1]
+    highest = comp_count - np.argmax(comparators[..., ::-1], axis=-1)
+    highest = np.where(comparators.any(axis=-1), highest, 0)
+    return highest - (1 << (num_adc_bits - 1))
+
+def seq_accumulate(adc, adc_ref_range_shifts, accumulator_bits = 16):
+    '''
+    seq_acc accumulator: sum of plane p << p over the planes (axis 0),
+    then << adc_ref_range_shifts, both wrapped to accumulator_bits.
+    '''
+    adc = np.asarray(adc, dtype=np.int64)
+    planes = np.arange(adc.shape[0]).reshape((-1,) + (1,) * (adc.ndim - 1))
+    acc = wrap_signed((adc << planes).sum(axis=0), accumulator_bits)
+    return wrap_signed(acc << adc_ref_range_shifts, accumulator_bits)
+
+def qracc_mac(
+    x,
+    weights,
+    adc_ref_range_shifts,
+    n_input_bits     = 8,
+    unsigned_acts    = False,
+    binary           = False,
+    num_adc_bits     = 4,
+    accumulator_bits = 16,
+    lane_bits        = 8,
+    batch_chunk      = 4096
+):
+    '''
+    MAC outputs of a batch of input vectors, as seq_acc's mac_data_o.
+    x: (batch, rows) activations, weights: (rows, cols) SRAM bits.
+    Returns (batch, cols). Batches are processed batch_chunk vectors at a
+    time to bound the size of the comparator outputs.
+    '''
+    x = np.asarray(x)
+    input_bits = n_input_bits + 1 if unsigned_acts else n_input_bits
+    num_planes = input_bits - 1
+    p, n = twos_to_bipolar(x, input_bits, lane_bits)
+
+    out = np.empty((x.shape[0], np.shape(weights)[1]), dtype=np.int64)
+    for start in range(0, x.shape[0], batch_chunk):
+        stop = start + batch_chunk
+        trits = input_trits(p[start:stop], n[start:stop], num_planes)
+        mbl = column_mbl(trits, weights, binary)  # (planes, batch, cols)
+        levels = adc_levels(mbl, adc_ref_range_shifts, num_adc_bits)
+        adc = adc_encode(adc_comparators(levels, num_adc_bits), num_adc_bits)
+        out[start:stop] = seq_accumulate(adc, adc_ref_range_shifts, accumulator_bits)
+    return out
+
+def ideal_mac(x, weights, binary = False):
+    '''
+    Unquantized x @ w of the same weights and mode, to compare qracc_mac against.
+    x: (batch, rows) signed activations.
+    '''
+    bits = (np.asarray(weights) > 0).astype(np.int64)
+    w = bits if binary else 2 * bits - 1
+    return np.asarray(x, dtype=np.int64) @ w
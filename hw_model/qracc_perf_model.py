@@ -0,0 +1,356 @@
+'''
+Static cycle and latency estimator for the QRAcc command stream.
+
+Walks the same commands.txt that tb_qracc_top consumes without executing
+any datapath, and predicts the cycles qracc_controller spends in each state
+for every node. Each state's cycles are a linear function of features taken
+from the CSR config and the data words written (see node_features):
+
+    cycles[state] = sum(coefficients[state][feature] * features[state][feature])
+
+The default coefficients follow the RTL: one bus word per cycle for the
+load states, one ACTMEM read per read set and n_input_bits cycles of
+seq_acc per window for compute. results/calibrate_perf_model.py refits
+them to qracc_statistics.csv runs.
+
+Rows use the same columns as append_stats_to_csv in qracc_pkg.svh, so
+estimates can be compared with, or stand in for, RTL statistics.
+
+Usage:
+    model = QrAccPerfModel()
+    rows = model.estimate(commands)
+    model.latency_ms(rows)
+    model.images_per_million_cycles(rows, batch_size)
+    python -m hw_model.qracc_perf_model <commands.txt> [statistics.csv] [coefficients.json]
+'''
+
+import csv
+import json
+from .qracc_iss import (
+    CSR_BASE_ADDR, ACC_BASE_ADDR, CSR_REG_MAIN, NUM_CSR,
+    TRIGGER_LOAD_ACTIVATION, TRIGGER_LOADWEIGHTS, TRIGGER_COMPUTE_ANALOG,
+    TRIGGER_COMPUTE_DIGITAL, TRIGGER_READ_ACTIVATION,
+    TRIGGER_LOADWEIGHTS_DIGITAL, TRIGGER_LOAD_SCALER,
+    S_IDLE, S_LOADACTS, S_LOADWEIGHTS, S_LOAD_DIGITAL_WEIGHTS,
+    S_LOADSCALER, S_LOADBIAS, S_COMPUTE_ANALOG, S_COMPUTE_DIGITAL, S_READACTS,
+    PSUM_FIRST, PSUM_ACCUMULATE,
+    decode_csr_config,
+)
+
+# Header of qracc_statistics.csv, in order
+STATS_COLUMNS = [
+    'EventName', 'Time',
+    'ActmemExtReads', 'ActmemExtWrites', 'ActmemIntReads', 'ActmemIntWrites',
+    'FLReads', 'FLWrites',
+    'SeqAccWeightWrites', 'SeqAccOperations', 'SeqAccMacs',
+    'WQWrites', 'WQReads',
+    'cyclesIdle', 'cyclesLoadActivation', 'cyclesLoadScaler', 'cyclesLoadWeights',
+    'cyclesComputeAnalog', 'cyclesReadActivation', 'cyclesLoadBias',
+    'cyclesComputeDigital', 'cyclesLoadWeightsDigital',
+]
+
+STATE_CYCLE_COLUMNS = {
+    S_IDLE:                 'cyclesIdle',
+    S_LOADACTS:             'cyclesLoadActivation',
+    S_LOADSCALER:           'cyclesLoadScaler',
+    S_LOADWEIGHTS:          'cyclesLoadWeights',
+    S_COMPUTE_ANALOG:       'cyclesComputeAnalog',
+    S_READACTS:             'cyclesReadActivation',
+    S_LOADBIAS:             'cyclesLoadBias',
+    S_COMPUTE_DIGITAL:      'cyclesComputeDigital',
+    S_LOAD_DIGITAL_WEIGHTS: 'cyclesLoadWeightsDigital',
+}
+
+# Features of each state. 'entries' counts how many times the state was entered.
+STATE_FEATURES = {
+    S_IDLE:                 ['entries', 'csr_writes'],
+    S_LOADACTS:             ['entries', 'words'],
+    S_LOADSCALER:           ['entries', 'words'],
+    S_LOADWEIGHTS:          ['entries', 'words'],
+    S_COMPUTE_ANALOG:       ['entries', 'windows', 'window_reads', 'mac_cycles', 'ofmap_writes'],
+    S_READACTS:             ['entries', 'words'],
+    S_LOADBIAS:             ['entries', 'words'],
+    S_COMPUTE_DIGITAL:      ['entries', 'windows', 'window_reads', 'ofmap_writes'],
+    S_LOAD_DIGITAL_WEIGHTS: ['entries', 'words'],
+}
+
+DEFAULT_COEFFICIENTS = {
+    S_IDLE:                 {'entries': 2, 'csr_writes': 1},
+    S_LOADACTS:             {'entries': 1, 'words': 1},
+    S_LOADSCALER:           {'entries': 0, 'words': 1},
+    S_LOADWEIGHTS:          {'entries': 1, 'words': 1},
+    S_COMPUTE_ANALOG:       {'entries': 8, 'windows': 2, 'window_reads': 1, 'mac_cycles': 1, 'ofmap_writes': 0},
+    S_READACTS:             {'entries': 1, 'words': 1},
+    S_LOADBIAS:             {'entries': 1, 'words': 1},
+    S_COMPUTE_DIGITAL:      {'entries': 8, 'windows': 2, 'window_reads': 1, 'ofmap_writes': 0},
+    S_LOAD_DIGITAL_WEIGHTS: {'entries': 1, 'words': 1},
+}
+
+def load_coefficients(path):
+    '''
+    Reads coefficients saved by results/calibrate_perf_model.py.
+    '''
+    with open(path, 'r') as f:
+        return json.load(f)
+
+class QrAccPerfModel(object):
+    '''
+    Per-state linear cycle model of qracc_top driven by a command stream.
+    '''
+
+    def __init__(
+        self,
+        coefficients = None,
+        sram_rows = 256,
+        sram_cols = 256,
+        num_cols_per_bank = 32,
+        interface_width = 32,
+        internal_interface_width = 256,
+        ws_num_pes = 32,
+        ws_window_elements = 9,
+        clk_period_ns = 20, # CLK_PERIOD of tb_qracc_top
+    ):
+        self.coefficients = DEFAULT_COEFFICIENTS if coefficients is None else coefficients
+        self.sram_rows = sram_rows
+        self.sram_cols = sram_cols
+        self.num_cols_per_bank = num_cols_per_bank
+        self.num_banks = sram_cols // num_cols_per_bank
+        self.interface_width = interface_width
+        self.internal_interface_elements = internal_interface_width // 8
+        self.num_ws_acc_writes = ws_num_pes * ws_window_elements // 4
+        self.clk_period_ns = clk_period_ns
+
+    def node_features(self, commands):
+        '''
+        Walks the command list and returns one entry per node (INFO block):
+            {'EventName': name, 'config': cfg at the last compute,
+             'features': {state: {feature: value}}, 'counts': {stat column: value}}
+        '''
+        nodes = []
+        csr = [0] * NUM_CSR
+        state = S_IDLE
+        remaining = 0
+        node = self._new_node(None)
+
+        lines = iter(commands)
+        for line in lines:
+            tokens = line.split()
+            if not tokens:
+                continue
+            op = tokens[0]
+            if op == 'INFO':
+                # First token of the next line, as tb_qracc_top reads the node name
+                name = next(lines).split()[0]
+                for info_line in lines:
+                    if info_line.strip() == 'ENDINFO':
+                        break
+                if node['EventName'] is not None:
+                    nodes.append(node)
+                node = self._new_node(name)
+                continue
+            if op in ('WAITBUSY', 'WAITREAD'):
+                continue
+            if op == 'END':
+                break
+            if op == 'LOAD':
+                writes = [(int(tokens[1], 16), int(tokens[2], 16))]
+            elif op == 'LOADBURST':
+                addr, n = int(tokens[1], 16), int(tokens[2], 16)
+                words = [int(next(lines), 16) for _ in range(n)]
+                if addr >= ACC_BASE_ADDR:
+                    state, remaining = self._data_words(node, state, remaining, n, csr)
+                    continue
+                writes = [(addr, word) for word in words]
+            else:
+                raise ValueError(f'Unknown command: {line}')
+
+            for addr, data in writes:
+                if addr >= ACC_BASE_ADDR:
+                    state, remaining = self._data_words(node, state, remaining, 1, csr)
+                    continue
+                csr[addr - CSR_BASE_ADDR] = data
+                node['features'][S_IDLE]['csr_writes'] += 1
+                if addr - CSR_BASE_ADDR == CSR_REG_MAIN and state == S_IDLE:
+                    state, remaining = self._trigger(node, data, csr)
+
+        if node['EventName'] is not None:
+            nodes.append(node)
+        return nodes
+
+    def _new_node(self, name):
+        return {
+            'EventName': name,
+            'config': None,
+            'features': {state: dict.fromkeys(features, 0) for state, features in STATE_FEATURES.items()},
+            'counts': dict.fromkeys(STATS_COLUMNS[2:13], 0),
+        }
+
+    def _capacity(self, state, cfg):
+        '''
+        Data words a state takes before the controller leaves it.
+        '''
+        if state == S_LOADACTS:
+            elements_per_word = self.interface_width // max(cfg['n_input_bits_cfg'], 1)
+            ifmap_size = cfg['input_fmap_dimx'] * cfg['input_fmap_dimy'] * cfg['num_input_channels']
+            return max(-(-ifmap_size // elements_per_word), 1)
+        if state == S_LOADWEIGHTS:
+            if cfg['load_window_count']:
+                return cfg['load_window_count']
+            return self.sram_rows * self.num_banks
+        if state == S_LOAD_DIGITAL_WEIGHTS:
+            return self.num_ws_acc_writes
+        if state in (S_LOADSCALER, S_LOADBIAS):
+            if cfg['load_window_count']:
+                return cfg['load_window_count']
+            return self.sram_cols
+        return 0
+
+    def _data_words(self, node, state, remaining, n, csr):
+        '''
+        Hands n data-port words to the current state. Words left
+        over when a state finishes go to the next one, as in the ISS.
+        '''
+        while n > 0 and state != S_IDLE:
+            taken = min(n, remaining)
+            node['features'][state]['words'] += taken
+            if state == S_LOADACTS:
+                node['counts']['ActmemExtWrites'] += taken
+            elif state == S_LOADWEIGHTS:
+                node['counts']['SeqAccWeightWrites'] += taken
+            n -= taken
+            remaining -= taken
+            if remaining == 0:
+                state = S_LOADBIAS if state == S_LOADSCALER else S_IDLE
+                remaining = self._capacity(state, decode_csr_config(csr))
+                if state != S_IDLE:
+                    node['features'][state]['entries'] += 1
+        return state, remaining
+
+    def _trigger(self, node, main_word, csr):
+        '''
+        Leaves S_IDLE on a trigger write. Compute and readout are
+        accounted for here, load states wait for their data words.
+        '''
+        trigger = main_word & 0x7
+        cfg = decode_csr_config(csr)
+        states = {
+            TRIGGER_LOAD_ACTIVATION:     S_LOADACTS,
+            TRIGGER_LOADWEIGHTS:         S_LOADWEIGHTS,
+            TRIGGER_LOADWEIGHTS_DIGITAL: S_LOAD_DIGITAL_WEIGHTS,
+            TRIGGER_LOAD_SCALER:         S_LOADSCALER,
+        }
+        if trigger in states:
+            state = states[trigger]
+            node['features'][state]['entries'] += 1
+            node['features'][S_IDLE]['entries'] += 1
+            return state, self._capacity(state, cfg)
+
+        if trigger in (TRIGGER_COMPUTE_ANALOG, TRIGGER_COMPUTE_DIGITAL):
+            self._compute(node, cfg, analog=trigger == TRIGGER_COMPUTE_ANALOG)
+            node['features'][S_IDLE]['entries'] += 1
+        elif trigger == TRIGGER_READ_ACTIVATION:
+            pixel_stride = cfg['ofmap_pixel_stride'] or cfg['num_output_channels']
+            ofmap_size = cfg['output_fmap_dimx'] * cfg['output_fmap_dimy'] * pixel_stride
+            words = -(-ofmap_size // 4)
+            node['features'][S_READACTS]['entries'] += 1
+            node['features'][S_READACTS]['words'] += words
+            node['counts']['ActmemExtReads'] += words
+            node['features'][S_IDLE]['entries'] += 1
+        return S_IDLE, 0
+
+    def _compute(self, node, cfg, analog):
+        state = S_COMPUTE_ANALOG if analog else S_COMPUTE_DIGITAL
+        windows = cfg['output_fmap_dimx'] * cfg['output_fmap_dimy']
+        num_read_sets = (cfg['num_input_channels'] * cfg['filter_size_x'] - 1) // self.internal_interface_elements + 1
+        window_reads = windows * cfg['filter_size_y'] * num_read_sets
+        written_banks = -(-cfg['num_output_channels'] // self.num_cols_per_bank)
+        if analog and cfg['psum_mode'] in (PSUM_FIRST, PSUM_ACCUMULATE):
+            written_banks = 0  # Only the partial sums are updated
+
+        features = node['features'][state]
+        features['entries'] += 1
+        features['windows'] += windows
+        features['window_reads'] += window_reads
+        features['ofmap_writes'] += windows * written_banks
+        if analog:
+            features['mac_cycles'] += windows * cfg['n_input_bits_cfg']
+
+        counts = node['counts']
+        counts['ActmemIntReads'] += window_reads
+        counts['ActmemIntWrites'] += windows * written_banks
+        counts['FLWrites'] += window_reads
+        counts['WQWrites'] += windows * written_banks * self.num_cols_per_bank
+        counts['WQReads'] += windows * written_banks
+        if analog:
+            counts['SeqAccOperations'] += windows
+            counts['SeqAccMacs'] += windows * cfg['n_input_bits_cfg']
+        node['config'] = cfg
+
+    def predict_cycles(self, features):
+        '''
+        Cycles per state of one node from its features.
+        '''
+        return {
+            state: int(round(sum(
+                self.coefficients[state].get(name, 0) * value
+                for name, value in state_features.items()
+            )))
+            for state, state_features in features.items()
+        }
+
+    def estimate(self, commands):
+        '''
+        Returns one dict per node with the qracc_statistics.csv columns.
+        Time is the cumulative simulated time in ns at the end of the node.
+        '''
+        rows = []
+        time_ns = 0
+        for node in self.node_features(commands):
+            cycles = self.predict_cycles(node['features'])
+            time_ns += sum(cycles.values()) * self.clk_period_ns
+            row = {'EventName': node['EventName'], 'Time': time_ns}
+            row.update(node['counts'])
+            for state, column in STATE_CYCLE_COLUMNS.items():
+                row[column] = cycles[state]
+            rows.append(row)
+        return rows
+
+    def estimate_file(self, path):
+        with open(path, 'r') as f:
+            return self.estimate(f.read().splitlines())
+
+    def total_cycles(self, rows):
+        return sum(row[column] for row in rows for column in STATE_CYCLE_COLUMNS.values())
+
+    def latency_ms(self, rows):
+        return self.total_cycles(rows) * self.clk_period_ns * 1e-6
+
+    def images_per_million_cycles(self, rows, batch_size = 1):
+        '''
+        Throughput of a stream that runs batch_size images.
+        '''
+        return batch_size * 1e6 / self.total_cycles(rows)
+
+    def write_csv(self, rows, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=STATS_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == '__main__':
+    import sys
+
+    commands_path = sys.argv[1] if len(sys.argv) > 1 else 'tb/qracc_top/inputs/commands.txt'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+    coefficients_path = sys.argv[3] if len(sys.argv) > 3 else None
+
+    model = QrAccPerfModel(
+        coefficients = load_coefficients(coefficients_path) if coefficients_path is not None else None
+    )
+    rows = model.estimate_file(commands_path)
+    print(f'[QRACC_PERF] {len(rows)} nodes, {model.total_cycles(rows)} cycles, {model.latency_ms(rows):.3f} ms')
+    for column in STATE_CYCLE_COLUMNS.values():
+        print(f'[QRACC_PERF] {column:26s} {sum(row[column] for row in rows):12d}')
+
+    if output_path is not None:
+        model.write_csv(rows, output_path)
@@ -0,0 +1,99 @@
+'''
+Offline packer benchmark, no RTL simulation needed.
+
+Builds core.NxModelMapping with every packer of make_packers() for every
+model in onnx_models/ and hwacc_design_garage/onnx_models/, and scores
+each combination by:
+    bins                 number of analog bins
+    bin_switches         bin rewrites along the ONNX execution order
+    weight_write_words   TRIGGER_LOADWEIGHTS words for those rewrites
+    scheduled_*          same, in the order of schedule_nx_graph
+    utilisation          mapped matrix area / total bin area
+    pack_time_s          wall time of the mapping
+
+Usage:
+    python -m results.benchmark_packers [output.csv]
+'''
+
+import os
+import glob
+import time
+import onnx
+import pandas as pd
+from hwacctools.comp_graph import core
+from tests.stim_lib.graph_index import NxGraphIndex
+from tests.stim_lib.packers import make_packers
+from tests.stim_lib.schedule import schedule_cost, schedule_nx_graph
+
+MODEL_DIRS = ['onnx_models', 'hwacc_design_garage/onnx_models']
+
+def find_models(model_dirs = MODEL_DIRS):
+    paths = []
+    for model_dir in model_dirs:
+        paths += sorted(glob.glob(os.path.join(model_dir, '*.onnx')))
+    return paths
+
+def score_mapping(
+    u_nx_mapping : core.NxModelMapping,
+    graph_index  : NxGraphIndex,
+    imc_core_size = (256, 256)
+):
+    analog_nodes = [node for node in u_nx_mapping.mapped_nodes if not node.depthwise]
+    mapped_area = sum(node.matrix.size for node in analog_nodes)
+    bins = len(u_nx_mapping.mapped_bins)
+
+    naive = schedule_cost(graph_index, u_nx_mapping, graph_index.order, imc_core_size=imc_core_size)
+    order = schedule_nx_graph(graph_index, u_nx_mapping, imc_core_size=imc_core_size)
+    scheduled = schedule_cost(graph_index, u_nx_mapping, order, imc_core_size=imc_core_size)
+
+    return {
+        'bins': bins,
+        'bin_switches': naive['weight_rewrites'],
+        'weight_write_words': naive['weight_words'],
+        'scheduled_bin_switches': scheduled['weight_rewrites'],
+        'scheduled_weight_write_words': scheduled['weight_words'],
+        'utilisation': mapped_area / (bins * imc_core_size[0] * imc_core_size[1]) if bins else 0.0,
+    }
+
+def benchmark_packers(
+    model_paths = None,
+    imc_core_size = (256, 256),
+    dwc_core_size = 32
+):
+    '''
+    Returns one row per (model, packer) as a DataFrame.
+    Models that fail to map with a packer get a row with the error.
+    '''
+    model_paths = find_models() if model_paths is None else model_paths
+    rows = []
+    for model_path in model_paths:
+        nx_model = onnx.load(model_path)
+        graph_index = NxGraphIndex(nx_model)
+        model_name = os.path.splitext(os.path.basename(model_path))[0]
+
+        for packer_name, packer in make_packers(imc_core_size):
+            row = {'model': model_name, 'packer': packer_name}
+            try:
+                start = time.perf_counter()
+                u_nx_mapping = core.NxModelMapping(
+                    nx_model,
+                    imc_core_size=imc_core_size,
+                    dwc_core_size=dwc_core_size,
+                    packer=packer
+                )
+                row['pack_time_s'] = time.perf_counter() - start
+                row.update(score_mapping(u_nx_mapping, graph_index, imc_core_size))
+            except Exception as e:
+                row['error'] = f'{type(e).__name__}: {e}'
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    import sys
+
+    output_path = sys.argv[1] if len(sys.argv) > 1 else 'results/packer_benchmark.csv'
+
+    table = benchmark_packers()
+    print(table.to_string(index=False))
+    table.to_csv(output_path, index=False)
+    print(f'Saved packer benchmark to {output_path}')
@@ -0,0 +1,134 @@
+'''
+Fits the per-state coefficients of hw_model/qracc_perf_model.py to RTL runs.
+
+Every results/qracc_statistics_<model>_<packer>.csv written by
+test_qracc_run_nx_model is joined node by node with the node features of
+the matching results/qracc_commands_<model>_<packer>.{txt,bin}. For each
+controller state, the cycle column is fitted to that state's features by
+least squares over all nodes of all runs.
+
+Usage:
+    python -m results.calibrate_perf_model [results_dir] [coefficients.json]
+'''
+
+import os
+import re
+import glob
+import json
+import numpy as np
+import pandas as pd
+from hw_model.qracc_perf_model import QrAccPerfModel, STATE_FEATURES, STATE_CYCLE_COLUMNS
+
+STATS_PATTERN = re.compile(r'qracc_statistics_(?P<run>.+)\.csv$')
+
+def read_commands(path):
+    if os.fspath(path).endswith('.bin'):
+        # Only needed for binary streams, pulls in the compiler dependencies
+        from tests.stim_lib.compile import read_commands_file
+        return read_commands_file(path)
+    with open(path, 'r') as f:
+        return f.read().splitlines()
+
+def load_runs(results_dir = 'results', model = None):
+    '''
+    Returns one DataFrame row per node of every run that has both a
+    statistics csv and a commands file. Measured columns keep their csv
+    names, features are named <state>.<feature>.
+    '''
+    model = QrAccPerfModel() if model is None else model
+    frames = []
+    for stats_path in sorted(glob.glob(os.path.join(results_dir, 'qracc_statistics_*.csv'))):
+        run = STATS_PATTERN.search(os.path.basename(stats_path)).group('run')
+        commands_paths = glob.glob(os.path.join(results_dir, f'qracc_commands_{run}.*'))
+        if not commands_paths:
+            print(f'Skipping {run}: no commands file next to the statistics')
+            continue
+
+        stats = pd.read_csv(stats_path)
+        features = pd.DataFrame([
+            {'EventName': node['EventName'], **{
+                f'{state}.{name}': value
+                for state, state_features in node['features'].items()
+                for name, value in state_features.items()
+            }}
+            for node in model.node_features(read_commands(commands_paths[0]))
+        ])
+        # Both are in node order. Names need not be unique, so rows are
+        # paired by position, and the tb skips the stats of a last node
+        # it never finished.
+        num_nodes = min(len(stats), len(features))
+        if not np.array_equal(stats['EventName'][:num_nodes].to_numpy(), features['EventName'][:num_nodes].to_numpy()):
+            print(f'Skipping {run}: its statistics and commands list different nodes')
+            continue
+        joined = pd.concat([
+            stats[:num_nodes].reset_index(drop=True),
+            features[:num_nodes].drop(columns='EventName').reset_index(drop=True),
+        ], axis=1)
+        joined.insert(0, 'run', run)
+        print(f'{run}: {len(joined)} of {len(stats)} nodes joined')
+        frames.append(joined)
+
+    if not frames:
+        raise FileNotFoundError(f'No statistics with matching commands found in {results_dir}')
+    return pd.concat(frames, ignore_index=True)
+
+def fit_coefficients(runs : pd.DataFrame):
+    '''
+    Least-squares fit of every state's cycles to its features.
+    Features that never vary across the data are left out of the fit
+    and get a coefficient of 0.
+    '''
+    coefficients = {}
+    for state, names in STATE_FEATURES.items():
+        X = runs[[f'{state}.{name}' for name in names]].to_numpy(dtype=np.float64)
+        y = runs[STATE_CYCLE_COLUMNS[state]].to_numpy(dtype=np.float64)
+        used = np.any(X != 0, axis=0)
+        fitted = np.zeros(len(names))
+        if used.any():
+            fitted[used] = np.linalg.lstsq(X[:, used], y, rcond=None)[0]
+        coefficients[state] = dict(zip(names, fitted.tolist()))
+    return coefficients
+
+def residual_report(runs : pd.DataFrame, coefficients : dict):
+    '''
+    Per-state error of the model with the given coefficients:
+    RMSE and max absolute error in cycles per node, and the relative
+    error of the state's total cycles over all runs.
+    '''
+    report = []
+    for state, names in STATE_FEATURES.items():
+        X = runs[[f'{state}.{name}' for name in names]].to_numpy(dtype=np.float64)
+        y = runs[STATE_CYCLE_COLUMNS[state]].to_numpy(dtype=np.float64)
+        predicted = X @ np.array([coefficients[state][name] for name in names])
+        error = predicted - y
+        report.append({
+            'state': state,
+            'measured_cycles': y.sum(),
+            'predicted_cycles': predicted.sum(),
+            'rmse': np.sqrt(np.mean(error**2)),
+            'max_abs_error': np.abs(error).max(),
+            'total_rel_error': error.sum() / y.sum() if y.sum() else 0.0,
+        })
+    return pd.DataFrame(report)
+
+def save_coefficients(coefficients, path):
+    with open(path, 'w') as f:
+        json.dump(coefficients, f, indent=2)
+
+if __name__ == '__main__':
+    import sys
+
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else 'results'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(results_dir, 'perf_model_coefficients.json')
+
+    runs = load_runs(results_dir)
+
+    print('Default coefficients:')
+    print(residual_report(runs, QrAccPerfModel().coefficients).to_string(index=False))
+
+    coefficients = fit_coefficients(runs)
+    print('Fitted coefficients:')
+    print(residual_report(runs, coefficients).to_string(index=False))
+
+    save_coefficients(coefficients, output_path)
+    print(f'Saved coefficients to {output_path}')
@@ -68,8 +68,20 @@ localparam bankCodeBits = numBanks > 1 ? $clog2(numBanks) : 1;
 // Derived Layer Parameters
 logic [31:0] input_fmap_size;
 assign input_fmap_size = cfg.input_fmap_dimx * cfg.input_fmap_dimy * cfg.num_input_channels;
+
+// Tiled ofmaps are written into a wider ofmap, ofmap_pixel_stride channels per pixel
+logic [31:0] ofmap_pixel_stride;
+assign ofmap_pixel_stride = (cfg.ofmap_pixel_stride != 0) ? {16'b0, cfg.ofmap_pixel_stride} : {16'b0, cfg.num_output_channels};
+// Row tiles and depthwise channel groups read their channels out of a wider ifmap, ifmap_pixel_stride channels per pixel
+logic [31:0] ifmap_pixel_stride;
+assign ifmap_pixel_stride = (cfg.ifmap_pixel_stride != 0) ? {16'b0, cfg.ifmap_pixel_stride} : {16'b0, cfg.num_input_channels};
+
+// Row tiles before the last only update the partial sums, they write no ofmap
+logic psum_only;
+assign psum_only = (cfg.psum_mode == PSUM_FIRST) || (cfg.psum_mode == PSUM_ACCUMULATE);
+
 logic [31:0] output_fmap_size;
-assign output_fmap_size = cfg.output_fmap_dimx * cfg.output_fmap_dimy * cfg.num_output_channels;
+assign output_fmap_size = cfg.output_fmap_dimx * cfg.output_fmap_dimy * ofmap_pixel_stride;
 
 // Handshake Signalsl
 logic data_handshake;
@@ -109,12 +121,30 @@ logic feature_loader_wr_en_d;
 logic [31:0] read_set;
 logic [31:0] num_read_sets;
 assign num_read_sets = ( (cfg.num_input_channels*cfg.filter_size_x - 1) / internalInterfaceElements ) + 1;
+// Offset of the read set in the filter row. In a wider ifmap, every num_input_channels
+// elements skip to the next pixel. Only exact if no read set spans two pixels:
+// filter_size_x == 1, or num_input_channels a multiple of internalInterfaceElements.
+logic [31:0] read_set_offset;
+assign read_set_offset = read_set*internalInterfaceElements
+                       + ( (read_set*internalInterfaceElements) / cfg.num_input_channels ) * (ifmap_pixel_stride - cfg.num_input_channels);
 logic read_acts_out_valid;
 
 // Write tracking signals
 logic [31:0] scaler_ptr;
 logic [31:0] weight_ptr;
 
+// Windowed weight loads only write words [start, start+count) of the SRAM
+logic [31:0] weight_load_start;
+logic [31:0] weight_load_end;
+assign weight_load_start = (cfg.load_window_count != 0) ? {16'b0, cfg.load_window_start} : 0;
+assign weight_load_end   = (cfg.load_window_count != 0) ? {16'b0, cfg.load_window_start} + {16'b0, cfg.load_window_count} : numRows*numBanks;
+
+// Windowed scaler loads only write scalers and biases [start, start+count)
+logic [31:0] scaler_load_start;
+logic [31:0] scaler_load_end;
+assign scaler_load_start = (cfg.load_window_count != 0) ? {16'b0, cfg.load_window_start} : 0;
+assign scaler_load_end   = (cfg.load_window_count != 0) ? {16'b0, cfg.load_window_start} + {16'b0, cfg.load_window_count} : numScalers;
+
 // Padding
 logic [31:0] padding_address_offset;
 logic [15:0] padding_start_q;
@@ -199,10 +229,12 @@ always_comb begin : ctrlDecode
             ctrl_o.output_scaler_scale_w_en = data_write;
             ctrl_o.output_scaler_shift_w_en = data_write;
             ctrl_o.output_scaler_offset_w_en = data_write;
+            ctrl_o.output_scaler_w_addr = scaler_ptr;
             bus_resp_o.ready = 1;
         end
         S_LOADBIAS: begin
             ctrl_o.output_bias_w_en = data_write;
+            ctrl_o.output_scaler_w_addr = scaler_ptr;
             bus_resp_o.ready = 1;
             // ctrl_o.activation_buffer_int_rd_en = (state_d == S_COMPUTE_ANALOG) ? 1 : 0;
         end
@@ -213,13 +245,14 @@ always_comb begin : ctrlDecode
             bus_resp_o.ready = 1; // Ready to be read (all extern WRENs are deasserted)
                 
             ctrl_o.activation_buffer_int_rd_addr = 
-                    cfg.num_input_channels * 
+                    ifmap_pixel_stride * 
                     cfg.input_fmap_dimx * 
                     ( (opix_pos_y*cfg.stride_y - {28'b0,cfg.padding}) + {28'b0, fy_ctr})
-                +   cfg.num_input_channels * 
+                +   ifmap_pixel_stride * 
                     (opix_pos_x*cfg.stride_x - {28'b0,cfg.padding}) 
-                +   read_set*internalInterfaceElements
-                ; // h*W*C + w*C + c
+                +   {16'b0, cfg.ifmap_channel_offset}
+                +   read_set_offset
+                ; // h*W*S + w*S + offset + c
             
             ctrl_o.feature_loader_addr = feature_loader_addr_qq;
             // Do not write to feature loader seq_acc isn't ready yet
@@ -227,11 +260,12 @@ always_comb begin : ctrlDecode
             // Latch output if feature loader isn't accepting writes
             ctrl_o.activation_buffer_int_rd_en = ctrl_o.feature_loader_wr_en; 
             ctrl_o.qracc_mac_data_valid = feature_loader_valid_out_qq && (state_q == S_COMPUTE_ANALOG);
+            ctrl_o.psum_active = (state_q == S_COMPUTE_ANALOG);
             ctrl_o.wsacc_data_i_valid = feature_loader_valid_out_qq && (state_q == S_COMPUTE_DIGITAL);
 
             // OFMAP WRITEBACK
-            ctrl_o.activation_buffer_int_wr_en = qracc_output_valid || wsacc_output_valid;
-            ctrl_o.activation_buffer_int_wr_addr = ofmap_start_addr + ofmap_offset_ptr;
+            ctrl_o.activation_buffer_int_wr_en = (qracc_output_valid && !psum_only) || wsacc_output_valid;
+            ctrl_o.activation_buffer_int_wr_addr = ofmap_start_addr + ofmap_offset_ptr + {16'b0, cfg.ofmap_channel_offset};
 
             ctrl_o.padding_start = padding_start_q;
             ctrl_o.padding_end = padding_end_q;
@@ -267,7 +301,7 @@ always_comb begin : stateDecode
             state_d = state_trigger;
         end
         S_LOADWEIGHTS: begin
-            if (weight_ptr < numRows*numBanks) begin
+            if (weight_ptr < weight_load_end) begin
                 state_d = S_LOADWEIGHTS;
             end else begin
                 state_d = S_IDLE;
@@ -288,16 +322,15 @@ always_comb begin : stateDecode
             end
         end
         S_LOADSCALER: begin
-            // Scaler orchestrates its own address
-            if (scaler_ptr < numScalers-1) begin
+            // Leave once the last scaler of the window is written
+            if (scaler_ptr < scaler_load_end-1 || !data_write) begin
                 state_d = S_LOADSCALER;
             end else begin
                 state_d = S_LOADBIAS;
             end
         end
         S_LOADBIAS: begin
-            // Scaler orchestrates its own address
-            if (scaler_ptr < numScalers-1) begin
+            if (scaler_ptr < scaler_load_end-1 || !data_write) begin
                 state_d = S_LOADBIAS;
             end else begin
                 state_d = state_trigger;
@@ -311,7 +344,9 @@ always_comb begin : stateDecode
             end
         end
         S_COMPUTE_ANALOG: begin
-            if (~feature_loader_valid_out_qq && qracc_ready && write_queue_done && last_window) begin
+            // Partial sum tiles write nothing, they are done once every output came out
+            if (~feature_loader_valid_out_qq && qracc_ready && last_window &&
+                (psum_only ? (ofmap_offset_ptr == output_fmap_size) : write_queue_done)) begin
                 state_d = state_trigger;
             end else begin
                 state_d = state_q;
@@ -448,7 +483,7 @@ always_ff @( posedge clk or negedge nrst ) begin : computeCycleCounter
         if (state_q == S_COMPUTE_ANALOG || state_q == S_COMPUTE_DIGITAL) begin
 
             if (qracc_output_valid || wsacc_output_valid) begin
-                ofmap_offset_ptr <=  ofmap_offset_ptr + { 16'b0 , cfg.num_output_channels};
+                ofmap_offset_ptr <=  ofmap_offset_ptr + ofmap_pixel_stride;
             end
 
             if (last_window) begin
@@ -515,6 +550,9 @@ always_ff @( posedge clk or negedge nrst ) begin : weightWriteLogic
         if (csr_main_clear) begin
             weight_ptr <= 0;
         end else
+        if (state_q == S_IDLE && state_d == S_LOADWEIGHTS) begin
+            weight_ptr <= weight_load_start;
+        end else
         if (state_q == S_LOADWEIGHTS) begin
             if (data_write) weight_ptr <= weight_ptr + 1;
             if (state_d != S_LOADWEIGHTS) begin 
@@ -547,7 +585,8 @@ always_ff @( posedge clk or negedge nrst ) begin : actBufferLogic
         end else
 
         if (state_q == S_IDLE) begin
-            if (state_d == S_LOADACTS) ifmap_start_addr <= 0;
+            // CSR 10 places the ifmap, otherwise ifmaps load at 0
+            if (state_d == S_LOADACTS) ifmap_start_addr <= cfg.ifmap_addr_en ? {14'b0, cfg.ifmap_addr} : 0;
         end
 
         if (state_q == S_LOADACTS) begin
@@ -563,6 +602,13 @@ always_ff @( posedge clk or negedge nrst ) begin : actBufferLogic
 
         end
 
+        // CSR 10 and 11 place the ifmap and ofmap of a compute, otherwise it
+        // reads the last ofmap and writes behind it
+        if ((state_d == S_COMPUTE_ANALOG || state_d == S_COMPUTE_DIGITAL) && state_d != state_q) begin
+            if (cfg.ifmap_addr_en) ifmap_start_addr <= {14'b0, cfg.ifmap_addr};
+            if (cfg.ofmap_addr_en) ofmap_start_addr <= {14'b0, cfg.ofmap_addr};
+        end
+
         if (state_q == S_READACTS) begin
 
             if (data_read) begin
@@ -604,10 +650,13 @@ always_ff @( posedge clk or negedge nrst ) begin : scalerLogic
         if (csr_main_clear) begin
             scaler_ptr <= 0;
         end else
+        if (state_q == S_IDLE && state_d == S_LOADSCALER) begin
+            scaler_ptr <= scaler_load_start;
+        end else
         if (state_q == S_LOADSCALER) begin
             if (data_write) scaler_ptr <= scaler_ptr + 1;
             if (state_d != S_LOADSCALER) begin 
-                scaler_ptr <= 0;
+                scaler_ptr <= scaler_load_start; // Biases use the same window
             end
         end
         if (state_q == S_LOADBIAS) begin
@@ -30,7 +30,12 @@ typedef enum logic [3:0] {
     CSR_REG_OFMAP_DIMS = 3,
     CSR_REG_CHANNELS = 4,
     CSR_REG_OFFSETS = 5,
-    CSR_REG_PADDING = 6
+    CSR_REG_PADDING = 6,
+    CSR_REG_LOAD_WINDOW = 7,
+    CSR_REG_OFMAP_LAYOUT = 8,
+    CSR_REG_IFMAP_LAYOUT = 9,
+    CSR_REG_IFMAP_ADDR = 10,
+    CSR_REG_OFMAP_ADDR = 11
 } csr_names_t;
 
 // Signals
@@ -110,6 +115,7 @@ always_comb begin : csrDecode
 
     cfg_o.binary_cfg           = csr_set[CSR_REG_CONFIG][0];
     cfg_o.unsigned_acts        = csr_set[CSR_REG_CONFIG][1];
+    cfg_o.psum_mode            = psum_mode_t'(csr_set[CSR_REG_CONFIG][3:2]);
     cfg_o.adc_ref_range_shifts = csr_set[CSR_REG_CONFIG][7:4];
     cfg_o.filter_size_y        = csr_set[CSR_REG_CONFIG][11:8];
     cfg_o.filter_size_x        = csr_set[CSR_REG_CONFIG][15:12];
@@ -132,6 +138,20 @@ always_comb begin : csrDecode
 
     cfg_o.padding       = csr_set[CSR_REG_PADDING][3:0];
     cfg_o.padding_value = csr_set[CSR_REG_PADDING][11:4];
+
+    cfg_o.load_window_start = csr_set[CSR_REG_LOAD_WINDOW][15:0];
+    cfg_o.load_window_count = csr_set[CSR_REG_LOAD_WINDOW][31:16];
+
+    cfg_o.ofmap_channel_offset = csr_set[CSR_REG_OFMAP_LAYOUT][15:0];
+    cfg_o.ofmap_pixel_stride   = csr_set[CSR_REG_OFMAP_LAYOUT][31:16];
+
+    cfg_o.ifmap_channel_offset = csr_set[CSR_REG_IFMAP_LAYOUT][15:0];
+    cfg_o.ifmap_pixel_stride   = csr_set[CSR_REG_IFMAP_LAYOUT][31:16];
+
+    cfg_o.ifmap_addr    = csr_set[CSR_REG_IFMAP_ADDR][17:0];
+    cfg_o.ifmap_addr_en = csr_set[CSR_REG_IFMAP_ADDR][31];
+    cfg_o.ofmap_addr    = csr_set[CSR_REG_OFMAP_ADDR][17:0];
+    cfg_o.ofmap_addr_en = csr_set[CSR_REG_OFMAP_ADDR][31];
 end
 
 endmodule
\ No newline at end of file
@@ -21,6 +21,7 @@ module output_scaler_set #(
     output logic signed [numElements-1:0][outputWidth-1:0] y_o,
 
     // Scaler memory inputs
+    input [$clog2(numElements)-1:0] w_addr_i, // Shared by the scale, shift, offset and bias writes
     input scale_w_en_i,
     input [scaleBits-1:0] scale_w_data_i,
 
@@ -41,18 +42,11 @@ module output_scaler_set #(
     input [3:0] cfg_output_bits
 );
 
-// Parameters
-localparam addrWidth = $clog2(numElements);
-
 // Registers
 logic signed [scaleBits-1:0] output_scale [numElements];
 logic signed [shiftBits-1:0] output_shift [numElements];
 logic signed [offsetBits-1:0] output_offset [numElements];
 logic signed [31:0] output_bias [numElements];
-logic [addrWidth-1:0] scale_w_addr;
-logic [addrWidth-1:0] shift_w_addr;
-logic [addrWidth-1:0] offset_w_addr;
-logic [addrWidth-1:0] bias_w_addr;
 
 // Modules
 always_ff @( posedge clk or negedge nrst) begin : scalerMemory
@@ -63,26 +57,18 @@ always_ff @( posedge clk or negedge nrst) begin : scalerMemory
             output_offset[i] <= 0;
             output_bias[i] <= 0;
         end
-        scale_w_addr <= 0;
-        shift_w_addr <= 0;
-        offset_w_addr <= 0;
-        bias_w_addr <= 0;
     end else begin
         if (scale_w_en_i) begin
-            output_scale[scale_w_addr] <= scale_w_data_i;
-            scale_w_addr <= scale_w_addr + 1;
+            output_scale[w_addr_i] <= scale_w_data_i;
         end
         if (shift_w_en_i) begin
-            output_shift[shift_w_addr] <= shift_w_data_i;
-            shift_w_addr <= scale_w_addr + 1;
+            output_shift[w_addr_i] <= shift_w_data_i;
         end
         if (offset_w_en_i) begin
-            output_offset[offset_w_addr] <= offset_w_data_i;
-            offset_w_addr <= offset_w_addr + 1;
+            output_offset[w_addr_i] <= offset_w_data_i;
         end
         if (bias_w_en_i) begin
-            output_bias[bias_w_addr] <= bias_w_data_i;
-            bias_w_addr <= bias_w_addr + 1;
+            output_bias[w_addr_i] <= bias_w_data_i;
         end
     end
 end
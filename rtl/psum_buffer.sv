@@ -0,0 +1,90 @@
+/*
+
+Partial sum buffer for row-tiled layers
+
+Layers whose window is longer than the SRAM rows are split into row tiles
+that run one after another over the same output pixels. The MAC outputs
+of each tile are added into psumBits-wide partial sums, one entry per
+output pixel, and only the last tile passes the total to the output
+scaler, saturated to the accumulator width.
+
+cfg.psum_mode:
+    PSUM_OFF        - data_o = data_i
+    PSUM_FIRST      - psum = data_i
+    PSUM_ACCUMULATE - psum += data_i
+    PSUM_LAST       - data_o = sat(psum + data_i)
+
+The controller does not write the ofmap in PSUM_FIRST and PSUM_ACCUMULATE.
+
+The pixel pointer restarts whenever active_i is low, so every compute
+starts at the first pixel.
+
+*/
+`timescale 1ns/1ps
+
+import qracc_pkg::*;
+
+module psum_buffer #(
+    parameter numElements = 256,
+    parameter inputWidth = 16,
+    parameter psumBits = 24,
+    parameter depth = 256     // Output pixels per compute
+) (
+    input clk, nrst,
+
+    input qracc_config_t cfg,
+    input active_i,
+
+    input valid_i,
+    input [numElements-1:0][inputWidth-1:0] data_i,
+
+    output logic [numElements-1:0][inputWidth-1:0] data_o
+);
+
+localparam addrWidth = $clog2(depth);
+
+logic [numElements-1:0][psumBits-1:0] psum_mem [depth];
+logic [addrWidth-1:0] pixel_ptr;
+logic [numElements-1:0][psumBits-1:0] psum_sum;
+logic stores_psum;
+logic adds_psum;
+
+assign stores_psum = (cfg.psum_mode == PSUM_FIRST) || (cfg.psum_mode == PSUM_ACCUMULATE);
+assign adds_psum = (cfg.psum_mode == PSUM_ACCUMULATE) || (cfg.psum_mode == PSUM_LAST);
+
+localparam logic signed [psumBits-1:0] satHigh = psumBits'(2**(inputWidth-1) - 1);
+localparam logic signed [psumBits-1:0] satLow = -psumBits'(2**(inputWidth-1));
+
+always_comb begin : psumDpath
+    for (int i = 0; i < numElements; i++) begin
+        psum_sum[i] = psumBits'(signed'(data_i[i]));
+        if (adds_psum) psum_sum[i] = psum_sum[i] + psum_mem[pixel_ptr][i];
+    end
+
+    for (int i = 0; i < numElements; i++) begin
+        if (cfg.psum_mode != PSUM_LAST) begin
+            data_o[i] = data_i[i];
+        end else if ($signed(psum_sum[i]) > satHigh) begin
+            data_o[i] = satHigh[inputWidth-1:0];
+        end else if ($signed(psum_sum[i]) < satLow) begin
+            data_o[i] = satLow[inputWidth-1:0];
+        end else begin
+            data_o[i] = psum_sum[i][inputWidth-1:0];
+        end
+    end
+end
+
+always_ff @( posedge clk or negedge nrst ) begin : psumRegs
+    if (!nrst) begin
+        pixel_ptr <= 0;
+    end else begin
+        if (!active_i) begin
+            pixel_ptr <= 0;
+        end else if (valid_i) begin
+            pixel_ptr <= pixel_ptr + 1;
+            if (stores_psum) psum_mem[pixel_ptr] <= psum_sum;
+        end
+    end
+end
+
+endmodule
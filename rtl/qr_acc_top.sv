@@ -27,6 +27,8 @@ module qr_acc_top #(
     parameter qrAccOutputElements = 256,
     parameter qrAccAdcBits = 4,
     parameter qrAccAccumulatorBits = 16, // Internal parameter of seq acc
+    parameter qrAccPsumBits = 24, // Partial sums of row-tiled layers
+    parameter qrAccPsumDepth = 256, // Output pixels of a row-tiled layer
 
     //  Parameters: Per Bank
     parameter numRows = 256,
@@ -354,6 +356,24 @@ feature_loader #(
     .mask_end          (cfg.filter_size_y * cfg.filter_size_x * cfg.num_input_channels + cfg.mapped_matrix_offset_y)
 );
 
+// Partial sums of row-tiled layers, passes the QRAcc output through otherwise
+logic [qrAccOutputElements-1:0][qrAccAccumulatorBits-1:0] psum_output;
+
+psum_buffer #(
+    .numElements    (qrAccOutputElements),
+    .inputWidth     (qrAccAccumulatorBits),
+    .psumBits       (qrAccPsumBits),
+    .depth          (qrAccPsumDepth)
+) u_psum_buffer (
+    .clk            (clk),
+    .nrst           (nrst),
+    .cfg            (cfg),
+    .active_i       (qracc_ctrl.psum_active),
+    .valid_i        (qracc_output_valid),
+    .data_i         (qracc_mac_output),
+    .data_o         (psum_output)
+);
+
 logic [qrAccOutputElements-1:0][qrAccAccumulatorBits-1:0] oscaler_input;
 always_comb begin : oscalerMux
     if (qracc_ctrl.wsacc_active) begin
@@ -361,7 +381,7 @@ always_comb begin : oscalerMux
         oscaler_input = wsacc_data_o;
     end else begin
         // Use QRAcc output otherwise
-        oscaler_input = qracc_mac_output;
+        oscaler_input = psum_output;
     end
 end
 
@@ -379,6 +399,7 @@ output_scaler_set #(
     .wx_i           (oscaler_input),
     .y_o            (output_scaler_output),
 
+    .w_addr_i       (qracc_ctrl.output_scaler_w_addr[$clog2(qrAccOutputElements)-1:0]),
     .scale_w_en_i   (qracc_ctrl.output_scaler_scale_w_en),
     .scale_w_data_i (bus_req_i.data_in[4+:16]),
 
@@ -281,6 +281,21 @@ always_ff @( posedge clk or negedge nrst ) begin : l2Mem
     end
 end
 
+// Host bus utilisation, cycles with a completed write over cycles spent in the bus loop
+int unsigned bus_loop_cycles = 0;
+int unsigned bus_write_cycles = 0;
+logic bus_loop_active = 0;
+always @( posedge clk ) begin : busUtilisation
+    if (bus_loop_active) begin
+        bus_loop_cycles <= bus_loop_cycles + 1;
+        if (bus_req.valid && bus_req.wen && bus_resp.ready) bus_write_cycles <= bus_write_cycles + 1;
+    end
+end
+
+task display_bus_utilisation();
+    $display("Host bus utilisation: %0d write cycles / %0d cycles (%0.2f%%)", bus_write_cycles, bus_loop_cycles, 100.0 * bus_write_cycles / (bus_loop_cycles > 0 ? bus_loop_cycles : 1));
+endtask
+
 /////////////
 // TESTING BOILERPLATE
 /////////////
@@ -610,7 +625,7 @@ task magic_export_ofmap();
     int fd;
     int ofmap_size;
 
-    ofmap_size = cfg.output_fmap_dimx * cfg.output_fmap_dimy * cfg.num_output_channels;
+    ofmap_size = cfg.output_fmap_dimx * cfg.output_fmap_dimy * ofmap_pixel_stride();
 
     $display("Exporting ofmap to file %s at time %t", {output_path,output_file_name,".txt"}, $time);
 
@@ -665,7 +680,7 @@ task export_l2();
     int fd;
     int ofmap_size;
 
-    ofmap_size = cfg.output_fmap_dimx * cfg.output_fmap_dimy * cfg.num_output_channels;
+    ofmap_size = cfg.output_fmap_dimx * cfg.output_fmap_dimy * ofmap_pixel_stride();
 
     $display("Exporting ofmap at time %t", $time);
 
@@ -700,14 +715,126 @@ task start_sim();
     #(CLK_PERIOD*2);
 endtask
 
+task bus_write(input int addr, input int data, input bit wait_ready = 1);
+
+    qracc_trigger_t trigger_type;
+    trigger_type = qracc_trigger_t'(data[2:0]);
+
+    if ((addr & 32'hFFFF_FFF0)== 32'h0000_0010) begin
+        if (data[2:0] != TRIGGER_IDLE) begin
+            $display("Triggering QRAcc with command: %s", trigger_type.name());
+        end
+    end
+    if (addr == 32'h0000_0011) begin
+        adc_ref_range_shifts = data[7:4];
+    end
+
+    // casex(addr)
+    //     32'h0000_001x: $write("Writing to CSR: %h = %h", addr, data);
+    //     32'h0000_0100: $write("Writing to QRAcc: %h = %h", addr, data);
+    //     default: $write("Writing to unknown address: %h = %h", addr, data);
+    // endcase
+    bus_req.addr = addr;
+    bus_req.data_in = data;
+    bus_req.valid = 1;
+    bus_req.wen = 1;
+    if(wait_ready) begin
+        while (!bus_resp.ready) begin 
+            #(CLK_PERIOD);
+            // $write(".");
+        end
+        #(CLK_PERIOD);
+        // $write("\tDONE\n");
+        bus_req.valid = 0;
+        // status_checkup();
+    end
+
+endtask
+
+// Streams n words to addr back-to-back, valid stays high between words
+// Text bursts have one hex word per line, binary bursts pack two words per record
+task bus_write_burst(input int addr, input int n, input int fd, input bit binary = 0);
+    int data;
+    logic [63:0] record;
+    for (int k = 0; k < n; k++) begin
+        if (binary) begin
+            if (k % 2 == 0) void'($fread(record, fd));
+            data = (k % 2 == 0) ? record[63:32] : record[31:0];
+        end else begin
+            void'($fscanf(fd,"%h", data));
+        end
+        bus_req.addr = addr;
+        bus_req.data_in = data;
+        bus_req.valid = 1;
+        bus_req.wen = 1;
+        while (!bus_resp.ready) begin 
+            #(CLK_PERIOD);
+        end
+        #(CLK_PERIOD);
+    end
+    bus_req.valid = 0;
+endtask
+
+task start_node(input string node_name, input string prev_node_name);
+    `ifdef TRACK_STATISTICS
+    // Save statistics of the previous node
+    if (prev_node_name != "") begin
+        append_stats_to_csv({output_path,"qracc_statistics",".csv"},prev_node_name);
+        reset_statistics();
+    end
+    `endif
+    $display("Node Name: %s", node_name);
+endtask
+
+task wait_busy(input string node_name);
+    $display("Waiting for QRAcc Computation, time:", $time);
+    $display("ofmap loc: %d, ifmap loc: %d", u_qr_acc_top.u_qracc_controller.ofmap_start_addr + u_qr_acc_top.u_qracc_controller.ofmap_offset_ptr, u_qr_acc_top.u_qracc_controller.ifmap_start_addr + u_qr_acc_top.u_qracc_controller.act_rd_ptr);
+    `ifdef NOTPLITZTRACK
+    wait_busy_silent(32'h0000_0010); // CSR_REG_MAIN_ADDR
+    `else
+    display_config();
+    track_toeplitz();
+    `endif
+    `ifdef SNOOP_OFMAP
+    magic_export_ofmap(node_name);
+    `endif
+endtask
+
+// Channels per ofmap pixel in ACTMEM, wider than the node for tiled ofmaps
+function automatic int ofmap_pixel_stride();
+    return (cfg.ofmap_pixel_stride != 0) ? cfg.ofmap_pixel_stride : cfg.num_output_channels;
+endfunction
+
+task wait_read();
+    int i;
+    // Wait for reads to finish
+    $display("Waiting for QRAcc Readout, time:", $time);
+    // $display("ofmap loc: %d, ifmap loc: %d", u_qr_acc_top.u_qracc_controller.ofmap_start_addr + u_qr_acc_top.u_qracc_controller.ofmap_offset_ptr, u_qr_acc_top.u_qracc_controller.ifmap_start_addr + u_qr_acc_top.u_qracc_controller.act_rd_ptr);
+    i = 0;
+    l2_mem_enable = 1;
+    for(i=0;i<cfg.output_fmap_dimx * cfg.output_fmap_dimy * ofmap_pixel_stride();i++) begin
+        bus_req.addr = QRACC_MAIN_ADDR;
+        bus_req.valid = 1;
+        bus_req.wen = 0;
+        while (!bus_resp.ready) begin 
+            #(CLK_PERIOD);
+            i++;
+            $write(".");
+        end
+        #(CLK_PERIOD);
+        i++;
+    end
+    l2_mem_enable = 0;
+    $display("\nQRAcc is ready after %d cycles, time: ", i, $time);
+endtask
+
 task bus_write_loop();
 
     int fd;
     int data;
     int addr;
-    int i;
+    int burst_length;
     string node_name;
-    qracc_trigger_t trigger_type;
     string command;
     fd = $fopen({files_path,"commands.txt"},"r");
     
@@ -716,22 +843,18 @@ task bus_write_loop();
         $display("Error opening commands file");
         $finish;
     end
+    bus_loop_active = 1;
 
     while (!$feof(fd)) begin
         $fscanf(fd,"%s", command);
         case(command)
             "INFO": begin
-                `ifdef TRACK_STATISTICS
-                // Save statistics of the previous node
-                if (node_name != "") begin
-                    append_stats_to_csv({output_path,"qracc_statistics",".csv"},node_name);
-                    reset_statistics();
-                end
-                `endif
+                string prev_node_name;
+                prev_node_name = node_name;
                 $display("=== NODE INFORMATION ===");
                 $fscanf(fd,"\n%s", node_name);
                 // $fgets(node_name, fd);
-                $display("Node Name: %s", node_name);
+                start_node(node_name, prev_node_name);
                 do begin
                     $fgets(command, fd);
                     $write("%s ", command);
@@ -740,79 +863,103 @@ task bus_write_loop();
             end
             "LOAD": begin
                 $fscanf(fd,"%h %h",addr,data);
+                bus_write(addr, data, !$feof(fd));
+            end
+            "LOADBURST": begin
+                $fscanf(fd,"%h %h",addr,burst_length);
+                bus_write_burst(addr, burst_length, fd);
+            end
+            "WAITBUSY": begin
+                wait_busy(node_name);
+            end
+            "WAITREAD": begin
+                wait_read();
+            end
+            "END": begin
+                $write("Ending bus write loop\n");
+                break;
+            end
+        endcase
+    end
 
-                trigger_type = qracc_trigger_t'(data[2:0]);
+    bus_loop_active = 0;
+    display_bus_utilisation();
+    $write("\n");
+    $display("=========== END OF BUS WRITE LOOP ============");
 
-                if ((addr & 32'hFFFF_FFF0)== 32'h0000_0010) begin
-                    if (data[2:0] != TRIGGER_IDLE) begin
-                        $display("Triggering QRAcc with command: %s", trigger_type.name());
-                    end
-                end
-                if (addr == 32'h0000_0011) begin
-                    adc_ref_range_shifts = data[7:4];
-                end
+endtask
+
+// Binary command records, written by write_commands_file(..., command_format='bin')
+// Each record is 64 bits, big-endian: [63:56] opcode, [55:32] address, [31:0] data
+// INFO records carry the node name length in data, followed by the name in 8-byte records
+// LOADBURST records carry the word count in data, followed by two words per record
+localparam logic [7:0] BIN_OP_LOAD     = 8'h01;
+localparam logic [7:0] BIN_OP_LOADBURST = 8'h05;
+localparam logic [7:0] BIN_OP_WAITBUSY = 8'h02;
+localparam logic [7:0] BIN_OP_WAITREAD = 8'h03;
+localparam logic [7:0] BIN_OP_INFO     = 8'h04;
+localparam logic [7:0] BIN_OP_END      = 8'h0F;
+
+task bus_write_loop_bin();
 
-                // casex(addr)
-                //     32'h0000_001x: $write("Writing to CSR: %h = %h", addr, data);
-                //     32'h0000_0100: $write("Writing to QRAcc: %h = %h", addr, data);
-                //     default: $write("Writing to unknown address: %h = %h", addr, data);
-                // endcase
-                bus_req.addr = addr;
-                bus_req.data_in = data;
-                bus_req.valid = 1;
-                bus_req.wen = 1;
-                if(!$feof(fd)) begin
-                    while (!bus_resp.ready) begin 
-                        #(CLK_PERIOD);
-                        // $write(".");
+    int fd;
+    int nbytes;
+    int name_length;
+    logic [63:0] record;
+    string node_name;
+    string prev_node_name;
+    fd = $fopen({files_path,"commands.bin"},"rb");
+    
+    $display("=========== BUS COMMAND LOOP (BINARY) ============");
+    if (fd == 0) begin
+        $display("Error opening commands file");
+        $finish;
+    end
+    bus_loop_active = 1;
+
+    forever begin
+        nbytes = $fread(record, fd);
+        if (nbytes < 8) break;
+        case(record[63:56])
+            BIN_OP_INFO: begin
+                prev_node_name = node_name;
+                name_length = record[31:0];
+                node_name = "";
+                for (int r = 0; r < (name_length + 7) / 8; r++) begin
+                    nbytes = $fread(record, fd);
+                    for (int b = 0; b < 8; b++) begin
+                        if (r*8 + b < name_length)
+                            node_name = {node_name, string'(record[63-8*b -: 8])};
                     end
-                    #(CLK_PERIOD);
-                    // $write("\tDONE\n");
-                    bus_req.valid = 0;
-                    // status_checkup();
                 end
+                start_node(node_name, prev_node_name);
             end
-            "WAITBUSY": begin
-                $display("Waiting for QRAcc Computation, time:", $time);
-                $display("ofmap loc: %d, ifmap loc: %d", u_qr_acc_top.u_qracc_controller.ofmap_start_addr + u_qr_acc_top.u_qracc_controller.ofmap_offset_ptr, u_qr_acc_top.u_qracc_controller.ifmap_start_addr + u_qr_acc_top.u_qracc_controller.act_rd_ptr);
-                `ifdef NOTPLITZTRACK
-                wait_busy_silent(32'h0000_0010); // CSR_REG_MAIN_ADDR
-                `else
-                display_config();
-                track_toeplitz();
-                `endif
-                `ifdef SNOOP_OFMAP
-                magic_export_ofmap(node_name);
-                `endif
+            BIN_OP_LOAD: begin
+                bus_write(int'(record[55:32]), int'(record[31:0]));
             end
-            "WAITREAD": begin
-                // Wait for reads to finish
-                $display("Waiting for QRAcc Readout, time:", $time);
-                // $display("ofmap loc: %d, ifmap loc: %d", u_qr_acc_top.u_qracc_controller.ofmap_start_addr + u_qr_acc_top.u_qracc_controller.ofmap_offset_ptr, u_qr_acc_top.u_qracc_controller.ifmap_start_addr + u_qr_acc_top.u_qracc_controller.act_rd_ptr);
-                i = 0;
-                l2_mem_enable = 1;
-                for(i=0;i<cfg.output_fmap_dimx * cfg.output_fmap_dimy * cfg.num_output_channels;i++) begin
-                    bus_req.addr = QRACC_MAIN_ADDR;
-                    bus_req.valid = 1;
-                    bus_req.wen = 0;
-                    while (!bus_resp.ready) begin 
-                        #(CLK_PERIOD);
-                        i++;
-                        $write(".");
-                    end
-                    #(CLK_PERIOD);
-                    i++;
-                end
-                l2_mem_enable = 0;
-                $display("\nQRAcc is ready after %d cycles, time: ", i, $time);
+            BIN_OP_LOADBURST: begin
+                bus_write_burst(int'(record[55:32]), int'(record[31:0]), fd, 1);
             end
-            "END": begin
+            BIN_OP_WAITBUSY: begin
+                wait_busy(node_name);
+            end
+            BIN_OP_WAITREAD: begin
+                wait_read();
+            end
+            BIN_OP_END: begin
                 $write("Ending bus write loop\n");
                 break;
             end
+            default: begin
+                $display("Unknown binary command record %h", record);
+                $finish;
+            end
         endcase
     end
 
+    $fclose(fd);
+    bus_loop_active = 0;
+    display_bus_utilisation();
     $write("\n");
     $display("=========== END OF BUS WRITE LOOP ============");
 
@@ -976,7 +1123,11 @@ initial begin
 
     start_sim();
 
+    `ifdef BINARY_COMMANDS
+    bus_write_loop_bin();
+    `else
     bus_write_loop();
+    `endif
     
     `ifndef NOIOFILES
     `ifndef POST_SYNTH
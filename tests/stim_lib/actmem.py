@@ -0,0 +1,62 @@
+import numpy as np
+from .tiling import ACTMEM_BYTES
+
+class ActmemAllocator(object):
+    '''
+    First-fit allocator of ACTMEM byte ranges for the tensors kept on chip.
+
+    resident maps a tensor view (see NxGraphIndex.ifmap_view) to its
+    (address, bytes). Ranges start on alignment bytes, the ifmap loads
+    write whole 32-bit words.
+    '''
+
+    def __init__(self, actmem_bytes = ACTMEM_BYTES, alignment = 4):
+        self.actmem_bytes = actmem_bytes
+        self.alignment = alignment
+        self.resident = {}
+
+    def find(self, num_bytes):
+        '''
+        Lowest free address with num_bytes behind it, None if there is none.
+        '''
+        address = 0
+        for start, size in sorted(self.resident.values()):
+            if start - address >= num_bytes:
+                return address
+            address = max(address, -(-(start + size) // self.alignment) * self.alignment)
+        return address if self.actmem_bytes - address >= num_bytes else None
+
+    def allocate(self, view, num_bytes):
+        address = self.find(num_bytes)
+        if address is not None:
+            self.resident[view] = (address, num_bytes)
+        return address
+
+    def free(self, view):
+        self.resident.pop(view, None)
+
+    def address(self, view):
+        return self.resident[view][0] if view in self.resident else None
+
+    def used_bytes(self):
+        return sum(size for _, size in self.resident.values())
+
+    def __repr__(self):
+        return f"ActmemAllocator(actmem_bytes={self.actmem_bytes}, resident={len(self.resident)}, used_bytes={self.used_bytes()})"
+
+def view_uses(views):
+    '''
+    Positions at which each view is read, in order.
+    '''
+    uses = {}
+    for pos, view in enumerate(views):
+        uses.setdefault(view, []).append(pos)
+    return uses
+
+def next_use(uses, view, pos):
+    '''
+    First position after pos at which view is read, None if it is dead.
+    '''
+    positions = uses.get(view, [])
+    i = np.searchsorted(positions, pos, side='right')
+    return positions[i] if i < len(positions) else None
@@ -1,17 +1,41 @@
+import os
+import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+from functools import cached_property
 from .stimulus_gen import *
+from .tensor_store import IntermediateTensorStore
+from .graph_index import NxGraphIndex
+from .compile_cache import CompileCache
+from .compile_report import CompileReport, COMPILE_STATS_KEYS
+from .schedule import schedule_nx_graph
+from .actmem import ActmemAllocator, view_uses, next_use
+from .tiling import split_wide_nodes, split_deep_nodes, split_depthwise_nodes, split_row_bands, actmem_footprint, apply_ifmap_view, ifmap_view_label, ACTMEM_BYTES
 from hwacctools.comp_graph import compute, cgraph, cnodes, core
 import onnx
 
+# psum_mode_t of qracc_pkg.svh, bits 3:2 of CSR_REG_CONFIG
+PSUM_OFF, PSUM_FIRST, PSUM_ACCUMULATE, PSUM_LAST = 0, 1, 2, 3
+
 class QrAccNodeCode(object):
     '''
     Holds all relevant information for testing a single node in QRAcc.
     Mappings and reference output attributes are NCHW
     '''
 
-    def __init__(self, mapped_node : core.MappedQRAccNode, mapped_bin : core.MappedBin, ifmap, imc_core_size = (256,256), ws_core_size = 32, ifmap_bits = 8, ofmap_bits = 8, nx_model : onnx.ModelProto = None):
+    def __init__(self, mapped_node : core.MappedQRAccNode, mapped_bin : core.MappedBin, ifmap, imc_core_size = (256,256), ws_core_size = 32, ifmap_bits = 8, ofmap_bits = 8, nx_model : onnx.ModelProto = None, tensor_store : IntermediateTensorStore = None, compile_only = False, ifmap_channels = None):
+        '''
+        toeplitz, reference_output and the packed data are computed on first access.
+        compile_only: the node is only compiled, reference_output is not available
+        and no ONNX model is needed.
+        ifmap_channels: [start, stop) channels of ifmap the node reads, for row
+        tiles and channel groups that read their channels out of the full
+        ifmap in ACTMEM.
+        '''
 
         self.ifmap = ifmap if ifmap.ndim == 4 else ifmap.reshape((1, -1, 1, 1))
+        self.ifmap_channels = ifmap_channels
 
         self.ofmap_shape = infer_ofmap_shape(
             ifmap_shape=self.ifmap.shape,
@@ -29,29 +53,9 @@ class QrAccNodeCode(object):
         self.mapped_bin = mapped_bin
         self.mapped_node = mapped_node
 
-        # if nx_model is None:
-        if 0:
-            self.reference_output = self._generate_reference_output()[0].transpose((0, 2, 3, 1))  # Convert to NHWC format
-        else:
-            output_tensor = mapped_node.nx_node.output[0]
-            input_dict = self._get_input_dict()
-            onnx_out = onnx_utils.get_intermediate_tensor_value(nx_model,output_tensor,input_dict=input_dict)
-
-            # We pretend the output is in NCHW if it's a matmul (we treat those like pointwise convs)
-            if len(onnx_out.shape) == 1:
-                onnx_out = onnx_out.reshape((1, -1, 1, 1))
-            self.reference_output = onnx_out.transpose((0, 2, 3, 1))
-        
-        self.toeplitz = compute.toeplitzize_input(
-            in_tensor = self.ifmap.squeeze(axis=0), # Remove batch dimension for toeplitz
-            kernel_shape=mapped_node.kernel.shape,
-            strides=mapped_node.strides,
-            pads=mapped_node.pads,
-            zero_point=mapped_node.x_zp,
-            channel_minor=True
-        )
-
         self.nx_model = nx_model
+        self.tensor_store = tensor_store
+        self.compile_only = compile_only
 
         # The writable matrix is the kernel for depthwise nodes, because they go into qracc
         self.matrix = mapped_node.matrix if not mapped_node.depthwise else mapped_node.kernel
@@ -60,12 +64,86 @@ class QrAccNodeCode(object):
         self.outputs = self.mapped_node.nx_node.output
 
         return
+
+    @cached_property
+    def reference_output(self):
+        if self.compile_only:
+            raise ValueError(f'{self.mapped_node.name} was built compile-only, it has no reference output.')
+
+        # if nx_model is None:
+        if 0:
+            return self._generate_reference_output()[0].transpose((0, 2, 3, 1))  # Convert to NHWC format
+
+        output_tensor = self.mapped_node.nx_node.output[0]
+        input_dict = self._get_input_dict()
+        if self.tensor_store is not None:
+            # Runs only this node instead of the model up to output_tensor
+            onnx_out = self.tensor_store.infer_node(self.mapped_node.nx_node, input_dict)
+        else:
+            onnx_out = onnx_utils.get_intermediate_tensor_value(self.nx_model,output_tensor,input_dict=input_dict)
+
+        # We pretend the output is in NCHW if it's a matmul (we treat those like pointwise convs)
+        if len(onnx_out.shape) == 1:
+            onnx_out = onnx_out.reshape((1, -1, 1, 1))
+        return onnx_out.transpose((0, 2, 3, 1))
+
+    @property
+    def node_ifmap(self):
+        '''
+        Channels of the ifmap the node reads, all of them unless ifmap_channels is set.
+        '''
+        if self.ifmap_channels is None:
+            return self.ifmap
+        return self.ifmap[:, self.ifmap_channels[0]:self.ifmap_channels[1]]
+
+    @cached_property
+    def toeplitz(self):
+        return self._toeplitzize(self.node_ifmap.squeeze(axis=0)) # Remove batch dimension for toeplitz
+
+    @cached_property
+    def first_toeplitz_window(self):
+        '''
+        Same as toeplitz[0], but only im2cols the corner of the ifmap
+        that the first window reads.
+        '''
+        if 'toeplitz' in self.__dict__:
+            return self.toeplitz[0]
+        kernel_shape = self.mapped_node.kernel.shape
+        pads = self.mapped_node.pads
+        corner = self.node_ifmap[0, :, :max(kernel_shape[2] - pads[0], 1), :max(kernel_shape[3] - pads[1], 1)]
+        return self._toeplitzize(corner)[0]
+
+    def _toeplitzize(self, in_tensor):
+        return compute.toeplitzize_input(
+            in_tensor = in_tensor,
+            kernel_shape=self.mapped_node.kernel.shape,
+            strides=self.mapped_node.strides,
+            pads=self.mapped_node.pads,
+            zero_point=self.mapped_node.x_zp,
+            channel_minor=True
+        )
+
+    @cached_property
+    def weight_data(self):
+        return self._get_weight_data()
+
+    @cached_property
+    def scaler_data(self):
+        return self._get_scaler_data()
+
+    @cached_property
+    def bias_data(self):
+        return self._get_bias_data()
+
+    @cached_property
+    def ifmap_data(self):
+        return self._get_ifmap_data()
     
     def _get_input_dict(self):
         if self.mapped_node.type == 'QLinearMatMul':
-            in_tensor = self.ifmap.squeeze()  # Convert to a 1D tensor for matmul
+            in_tensor = self.node_ifmap.squeeze()  # Convert to a 1D tensor for matmul
         else:
-            in_tensor = self.ifmap
+            in_tensor = self.node_ifmap
         input_dict = {
             self.mapped_node.nx_node.input[0]: in_tensor,
         }
@@ -77,7 +155,7 @@ class QrAccNodeCode(object):
         Returns the configuration for the QRAcc node.
         '''
 
-        ifmap_shape = self.ifmap.shape
+        ifmap_shape = self.node_ifmap.shape
         mapped_node = self.mapped_node
         ifmap_bits = self.ifmap_bits
         ofmap_bits = self.ofmap_bits
@@ -87,15 +165,13 @@ class QrAccNodeCode(object):
                 raise ValueError(f"Input feature map channels {ifmap_shape} do not match kernel input channels {mapped_node.kernel.shape}.")
 
         kernel_shape = mapped_node.kernel.shape
-        # ofmap_dimx = ((ifmap_shape[2] - kernel_shape[2] + 2*mapped_node.pads[0]) // mapped_node.strides[0]) + 1 #(W-K+2P)/S + 1
-        # ofmap_dimy = ((ifmap_shape[3] - kernel_shape[3] + 2*mapped_node.pads[1]) // mapped_node.strides[1]) + 1
-
-        ofmap_dimx = self.ofmap_shape[2]
-        ofmap_dimy = self.ofmap_shape[3]
+        # ACTMEM holds HWC ifmaps, so x runs along W (NCHW axis 3) and y along H (axis 2)
+        ofmap_dimx = self.ofmap_shape[3]
+        ofmap_dimy = self.ofmap_shape[2]
 
 
         adc_ref_range_shifts = infer_optimal_adc_range_shifts(
-            tplitz_act_vector=self.toeplitz[0],
+            tplitz_act_vector=self.first_toeplitz_window,
             weights=mapped_node.matrix,
             ifmap_bits=ifmap_bits
         ) if not mapped_node.depthwise else 0
@@ -106,20 +182,21 @@ class QrAccNodeCode(object):
             "unsigned_acts": 1,
             "binary_cfg": 1,
             "adc_ref_range_shifts": int(adc_ref_range_shifts),
-            "filter_size_y": kernel_shape[3],
-            "filter_size_x": kernel_shape[2],
-            "input_fmap_dimx": ifmap_shape[2],
-            "input_fmap_dimy": ifmap_shape[3],
+            "filter_size_y": kernel_shape[2],
+            "filter_size_x": kernel_shape[3],
+            "input_fmap_dimx": ifmap_shape[3],
+            "input_fmap_dimy": ifmap_shape[2],
             "output_fmap_dimx": ofmap_dimx,
             "output_fmap_dimy": ofmap_dimy,
-            "stride_x": mapped_node.strides[0],
-            "stride_y": mapped_node.strides[1],
+            "stride_x": mapped_node.strides[1],
+            "stride_y": mapped_node.strides[0],
             "num_input_channels": ifmap_shape[1],
             "num_output_channels": kernel_shape[0],
             "mapped_matrix_offset_x": mapped_node.offset_x,
             "mapped_matrix_offset_y": mapped_node.offset_y,
             "padding": mapped_node.pads[0],  # Use 0 padding for soft padding
             "padding_value": mapped_node.x_zp,  # Padding value for the input feature map
+            "psum_mode": PSUM_OFF,
         }
 
         return config_dict
@@ -166,6 +243,8 @@ class QrAccNodeCode(object):
     def _get_weight_data(self):
         if self.mapped_node.depthwise:
 
+            if self.mapped_node.kernel.shape[0] > self.ws_core_size:
+                raise ValueError(f"{self.mapped_node.name} has {self.mapped_node.kernel.shape[0]} channels, more than the {self.ws_core_size} PEs. Split it with tiling.split_depthwise_nodes.")
             if self.mapped_node.kernel.shape[0] < self.ws_core_size:
                 physical_kernel = np.zeros((self.ws_core_size, *self.mapped_node.kernel.shape[1:]), dtype=self.mapped_node.kernel.dtype)
                 physical_kernel[:self.mapped_node.kernel.shape[0]] = self.mapped_node.kernel
@@ -178,18 +257,10 @@ class QrAccNodeCode(object):
             return mapped_matrix_to_bank_writes(self.mapped_bin.weights,32)
         
     def _get_scaler_data(self):
-        return pad_scaler_writes(
-            scale_to_map = self.mapped_node.scale,
-            core_shape= self.imc_core_size,
-            output_zero_point = self.mapped_node.y_zp,
-            mm_offset_x= self.mapped_node.offset_x,
-        )
+        return node_scaler_data(self.mapped_node, self.imc_core_size)
     
     def _get_bias_data(self):
-        return pad_bias_data(self.mapped_node.biases, 
-            core_shape=self.imc_core_size, 
-            mm_offset_x=self.mapped_node.offset_x,
-        )
+        return node_bias_data(self.mapped_node, self.imc_core_size)
     
     def _get_ifmap_data(self):
         ifmap_hwc = self.ifmap.transpose(0,2,3,1)
@@ -206,8 +277,8 @@ class QrAccNodeCode(object):
             'toeplitz': self.toeplitz,
             'ifmap': self.ifmap.transpose(0,2,3,1),  # Convert to NHWC format
             'matrix_raw': self.matrix,  
-            'scaler_data': self._get_scaler_data(),
-            'biases': self._get_bias_data()
+            'scaler_data': self.scaler_data,
+            'biases': self.bias_data
         }
 
         write_input_files(res_dict, savepath)
@@ -234,33 +305,72 @@ class QrAccNodeCode(object):
             name=self.mapped_node.name,
         )        
     
-    def compile(self, include_ifmap_writes=True, write_weights=True, add_read=True, config_write_address='00000010', end=True, preserve_ifmap=False):
+    def compile(self, include_ifmap_writes=True, write_weights=True, add_read=True, config_write_address='00000010', end=True, preserve_ifmap=False, burst=False, loaded_weight_data=None, loaded_scaler_data=None, loaded_bias_data=None, ifmap_placeholder=None, ofmap_layout=None, psum_mode=None, ifmap_layout=None, act_addrs=None):
         '''
         Compile the node into a list of assembly instructions for QRAcc.
         include_ifmap_writes: bool, whether to include ifmap writes in the output.
         solo: bool, whether to compile the node as a standalone unit (default True).
+        burst: bool, emit data blocks as LOADBURST instead of one LOAD per word.
+        loaded_weight_data: bank writes of the bin already in the analog core.
+            If given, only the words that differ are rewritten (see weight_delta_windows).
+        loaded_scaler_data, loaded_bias_data: contents of the output scaler.
+            If given, only the scalers of the used columns that differ are rewritten.
+        ifmap_placeholder: label of the ifmap block. If given, the block is put
+            between IFMAP <label> <shape> and ENDIFMAP lines for QrAccProgram.
+        ofmap_layout: (channel offset, channels per pixel) of an output-channel
+            tile in the merged ofmap, set through CSR_REG_OFMAP_LAYOUT for this node only.
+        psum_mode: PSUM_* mode of a row tile. PSUM_FIRST and PSUM_ACCUMULATE
+            tiles leave their outputs in the psum_buffer, so they load no scalers.
+        ifmap_layout: (channel offset, channels per pixel) of the channels a
+            row tile or channel group reads out of the ifmap in ACTMEM, set
+            through CSR_REG_IFMAP_LAYOUT for this node only.
+        act_addrs: (ifmap, ofmap) ACTMEM addresses of a node placed by
+            allocate_nx_plans, set through CSR_REG_IFMAP_ADDR and
+            CSR_REG_OFMAP_ADDR for this node only.
+        Word counts of the emitted stream are left in self.compile_stats.
         '''
         # print(f"Compiling node {self.mapped_node.node_id}:{self.mapped_node.name} for QRAcc...")
 
+        self.compile_stats = dict.fromkeys(COMPILE_STATS_KEYS, 0)
+
         config_dict = self.config()
+        if psum_mode is not None:
+            config_dict['psum_mode'] = psum_mode
         config_writes = bundle_config_into_write(config_dict, config_write_address)
         commands = config_writes
+        if ofmap_layout is not None:
+            commands += make_ofmap_layout_write(*ofmap_layout, write_address=config_write_address)
+        if ifmap_layout is not None:
+            commands += make_ifmap_layout_write(*ifmap_layout, write_address=config_write_address)
+        if act_addrs is not None:
+            commands += make_act_addr_write(*act_addrs, write_address=config_write_address)
         
+        window_set = False  # CSR_REG_LOAD_WINDOW holds a window
         if write_weights:
             if self.mapped_node.depthwise:
                 commands += make_trigger_write('TRIGGER_LOADWEIGHTS_DIGITAL', write_address=config_write_address)
+                commands += write_array_to_asm(self.weight_data, burst=burst)
+                self.compile_stats['digital_weight_words'] = len(self.weight_data)
             else:
-                commands += make_trigger_write('TRIGGER_LOADWEIGHTS', write_address=config_write_address)
-            commands += write_array_to_asm(self._get_weight_data()) 
+                weight_commands, window_set = self._compile_weight_load(loaded_weight_data, config_write_address, burst)
+                commands += weight_commands
         
-        # Writing to the scaler is not optional
-        commands += make_trigger_write('TRIGGER_LOAD_SCALER', write_address=config_write_address)
-        commands += write_array_to_asm(self._get_scaler_data()) 
-        commands += write_array_to_asm(self._get_bias_data()) 
+        # Writing to the scaler is not optional, unless it already holds the right values
+        # or the outputs stay in the psum_buffer
+        if psum_mode not in (PSUM_FIRST, PSUM_ACCUMULATE):
+            scaler_commands, window_set = self._compile_scaler_load(loaded_scaler_data, loaded_bias_data, window_set, config_write_address, burst)
+            commands += scaler_commands
+        if window_set:
+            commands += make_load_window_write(0, 0, write_address=config_write_address)
         
         if include_ifmap_writes: # If not, the ifmap is assumed to be already in the ACTMEM
             commands += make_trigger_write('TRIGGER_LOAD_ACTIVATION', write_address=config_write_address)
-        commands += write_array_to_asm(self._get_ifmap_data())
+            self.compile_stats['ifmap_words'] = len(self.ifmap_data)
+        ifmap_commands = write_array_to_asm(self.ifmap_data, burst=burst)
+        if ifmap_placeholder is not None:
+            shape = 'x'.join(str(dim) for dim in self.ifmap.shape)
+            ifmap_commands = [f'IFMAP {ifmap_placeholder} {shape}'] + ifmap_commands + ['ENDIFMAP']
+        commands += ifmap_commands
 
         if self.mapped_node.depthwise:
             commands += make_trigger_write('TRIGGER_COMPUTE_DIGITAL', write_address=config_write_address, preserve_ifmap=preserve_ifmap)
@@ -271,11 +381,93 @@ class QrAccNodeCode(object):
         if add_read:
             commands += make_trigger_write('TRIGGER_READ_ACTIVATION', write_address=config_write_address)
             commands += [f'WAITREAD']
-            if end:
-                commands += ['END']
+            pixel_stride = ofmap_layout[1] if ofmap_layout is not None and ofmap_layout[1] else self.ofmap_shape[1]
+            self.compile_stats['readout_words'] = -(-self.ofmap_shape[2] * self.ofmap_shape[3] * pixel_stride // 4)
+        if act_addrs is not None:
+            commands += make_act_addr_write(None, None, write_address=config_write_address)
+        if ofmap_layout is not None:
+            commands += make_ofmap_layout_write(0, 0, write_address=config_write_address)
+        if ifmap_layout is not None:
+            commands += make_ifmap_layout_write(0, 0, write_address=config_write_address)
+        if add_read and end:
+            commands += ['END']
 
         return commands
     
+    def _compile_weight_load(self, loaded_weight_data, config_write_address, burst):
+        '''
+        Analog weight load. Without loaded_weight_data the whole SRAM is
+        written. Otherwise each changed range is written through a
+        CSR_REG_LOAD_WINDOW load, unless the windows cost more than a full load.
+        Returns the commands and whether the load window is left set.
+        '''
+        weight_data = self.weight_data
+        full_load = make_trigger_write('TRIGGER_LOADWEIGHTS', write_address=config_write_address)
+        full_load += write_array_to_asm(weight_data, burst=burst)
+
+        if loaded_weight_data is None:
+            self.compile_stats['weight_words'] = len(weight_data)
+            self.compile_stats['weight_windows'] = 1
+            return full_load, False
+
+        windows = weight_delta_windows(weight_data, loaded_weight_data)
+        window_words = sum(stop - start for start, stop in windows)
+        # Each window costs a CSR_REG_LOAD_WINDOW write and a trigger, plus one write
+        # to reset the window at the end, against the single trigger of a full load
+        if window_words + 2 * len(windows) >= len(weight_data):
+            self.compile_stats['weight_words'] = len(weight_data)
+            self.compile_stats['weight_windows'] = 1
+            return full_load, False
+
+        commands = []
+        for start, stop in windows:
+            commands += make_load_window_write(start, stop - start, write_address=config_write_address)
+            commands += make_trigger_write('TRIGGER_LOADWEIGHTS', write_address=config_write_address)
+            commands += write_array_to_asm(weight_data[start:stop], burst=burst)
+
+        self.compile_stats['weight_words'] = window_words
+        self.compile_stats['weight_words_skipped'] = len(weight_data) - window_words
+        self.compile_stats['weight_windows'] = len(windows)
+        return commands, len(windows) > 0
+
+    def _compile_scaler_load(self, loaded_scaler_data, loaded_bias_data, window_set, config_write_address, burst):
+        '''
+        Scaler and bias load. Without the loaded contents all columns are
+        written, otherwise only the window of scaler_load_window, or nothing.
+        Returns the commands and whether the load window is left set.
+        '''
+        scaler_data, bias_data = self.scaler_data, self.bias_data
+        window = (0, len(scaler_data))
+        if loaded_scaler_data is not None and loaded_bias_data is not None:
+            window = scaler_load_window(
+                scaler_data, bias_data, loaded_scaler_data, loaded_bias_data,
+                used_columns = node_used_columns(self.mapped_node),
+            )
+
+        commands = []
+        if window is None:
+            start, stop = 0, 0
+        elif window == (0, len(scaler_data)):
+            start, stop = window
+            if window_set:
+                commands += make_load_window_write(0, 0, write_address=config_write_address)
+                window_set = False
+        else:
+            start, stop = window
+            commands += make_load_window_write(start, stop - start, write_address=config_write_address)
+            window_set = True
+
+        if stop > start:
+            commands += make_trigger_write('TRIGGER_LOAD_SCALER', write_address=config_write_address)
+            commands += write_array_to_asm(scaler_data[start:stop], burst=burst)
+            commands += write_array_to_asm(bias_data[start:stop], burst=burst)
+
+        self.compile_stats['scaler_words'] = stop - start
+        self.compile_stats['bias_words'] = stop - start
+        self.compile_stats['scaler_words_skipped'] = len(scaler_data) - (stop - start)
+        self.compile_stats['bias_words_skipped'] = len(bias_data) - (stop - start)
+        return commands, window_set
+
     def __repr__(self):
         # Print attributes of the class, showing shapes for arrays
         attrs = vars(self)
@@ -297,11 +489,22 @@ class QrAccNodeCode(object):
 def generate_random_intermediate_tensor(
     nx_model : onnx.ModelProto,
     node_id : int,
-    input_dict : dict
+    input_dict : dict,
+    tensor_store : IntermediateTensorStore = None,
+    rng = None
 ):
-    input_tensor_shape = onnx_utils.get_intermediate_tensor_value(
-        nx_model, nx_model.graph.node[node_id].input[0], input_dict=input_dict).shape
-    return np.random.randint(0, 256, input_tensor_shape).astype(np.uint8)
+    '''
+    rng: np.random.RandomState to draw from. Uses the global numpy RNG if None.
+    '''
+    if rng is None:
+        rng = np.random
+    input_name = nx_model.graph.node[node_id].input[0]
+    if tensor_store is not None:
+        input_tensor_shape = tensor_store.shape(input_name)
+    else:
+        input_tensor_shape = onnx_utils.get_intermediate_tensor_value(
+            nx_model, input_name, input_dict=input_dict).shape
+    return rng.randint(0, 256, input_tensor_shape).astype(np.uint8)
 
 def is_nx_node_compilable(
     nx_node : onnx.NodeProto
@@ -357,6 +560,153 @@ def make_trigger_write(
     word = trigger_val | clear_val | inst_write_mode_val | preserve_ifmap_val
     return [f'LOAD {write_address} {word:08x}']
 
+def node_scaler_data(mapped_node, imc_core_size = (256, 256)):
+    return pad_scaler_writes(
+        scale_to_map = mapped_node.scale,
+        core_shape= imc_core_size,
+        output_zero_point = mapped_node.y_zp,
+        mm_offset_x= mapped_node.offset_x,
+    )
+
+def node_bias_data(mapped_node, imc_core_size = (256, 256)):
+    return pad_bias_data(mapped_node.biases, 
+        core_shape=imc_core_size, 
+        mm_offset_x=mapped_node.offset_x,
+    )
+
+def node_used_columns(mapped_node):
+    '''
+    Output scaler columns whose outputs end up in the ofmap of the node.
+    '''
+    return mapped_node.offset_x, mapped_node.offset_x + mapped_node.kernel.shape[0]
+
+def scaler_load_window(scaler_data, bias_data, loaded_scaler_data, loaded_bias_data, used_columns):
+    '''
+    [start, stop) columns of the output scaler to rewrite so that the used
+    columns hold scaler_data and bias_data. Columns outside used_columns
+    are don't-cares. None if nothing has to be written.
+    '''
+    used = np.zeros(len(scaler_data), dtype=bool)
+    used[used_columns[0]:used_columns[1]] = True
+    changed = used & (
+        (np.asarray(scaler_data) != np.asarray(loaded_scaler_data)) |
+        (np.asarray(bias_data) != np.asarray(loaded_bias_data))
+    )
+    columns = np.flatnonzero(changed)
+    if len(columns) == 0:
+        return None
+    return int(columns[0]), int(columns[-1]) + 1
+
+def track_scaler_state(plans, u_nx_mapping : core.NxModelMapping, imc_core_size = (256, 256)):
+    '''
+    Sets loaded_scaler_data and loaded_bias_data of every plan to the
+    output scaler contents left by the plans before it, replaying the
+    loads that QrAccNodeCode.compile emits for them.
+    '''
+    loaded_scaler_data, loaded_bias_data = None, None
+    for plan in plans:
+        mapped_node = u_nx_mapping.get_mapped_node_by_id(plan.node_id)
+        scaler_data = node_scaler_data(mapped_node, imc_core_size)
+        bias_data = node_bias_data(mapped_node, imc_core_size)
+
+        plan.loaded_scaler_data, plan.loaded_bias_data = loaded_scaler_data, loaded_bias_data
+        if plan.psum_mode in (PSUM_FIRST, PSUM_ACCUMULATE):
+            continue  # Loads no scalers
+        if loaded_scaler_data is None:
+            loaded_scaler_data, loaded_bias_data = scaler_data.copy(), bias_data.copy()
+            continue
+        window = scaler_load_window(scaler_data, bias_data, loaded_scaler_data, loaded_bias_data, node_used_columns(mapped_node))
+        if window is not None:
+            start, stop = window
+            loaded_scaler_data = loaded_scaler_data.copy()
+            loaded_bias_data = loaded_bias_data.copy()
+            loaded_scaler_data[start:stop] = scaler_data[start:stop]
+            loaded_bias_data[start:stop] = bias_data[start:stop]
+    return plans
+
+def make_load_window_write(
+    start,
+    count,
+    write_address='00000010'  # CSR base address
+):
+    '''
+    Sets CSR_REG_LOAD_WINDOW so the next TRIGGER_LOADWEIGHTS or
+    TRIGGER_LOAD_SCALER only writes words [start, start + count).
+    A count of 0 goes back to full loads.
+    '''
+    CSR_REG_LOAD_WINDOW = 7
+    if not (0 <= start < 2**16 and 0 <= count < 2**16):
+        raise ValueError(f"Load window ({start}, {count}) does not fit in 16 bits.")
+    word = ((count & 0xFFFF) << 16) | (start & 0xFFFF)
+    return [f'LOAD {int(write_address, 16) + CSR_REG_LOAD_WINDOW:08x} {word:08x}']
+
+def make_ofmap_layout_write(
+    channel_offset,
+    pixel_stride,
+    write_address='00000010'  # CSR base address
+):
+    '''
+    Sets CSR_REG_OFMAP_LAYOUT so the next compute writes its channels at
+    channel_offset of an ofmap with pixel_stride channels per pixel, and
+    WAITREAD reads the whole wider ofmap. (0, 0) goes back to plain ofmaps.
+    '''
+    CSR_REG_OFMAP_LAYOUT = 8
+    if not (0 <= channel_offset < 2**16 and 0 <= pixel_stride < 2**16):
+        raise ValueError(f"Ofmap layout ({channel_offset}, {pixel_stride}) does not fit in 16 bits.")
+    word = ((pixel_stride & 0xFFFF) << 16) | (channel_offset & 0xFFFF)
+    return [f'LOAD {int(write_address, 16) + CSR_REG_OFMAP_LAYOUT:08x} {word:08x}']
+
+def make_ifmap_layout_write(
+    channel_offset,
+    pixel_stride,
+    write_address='00000010'  # CSR base address
+):
+    '''
+    Sets CSR_REG_IFMAP_LAYOUT so the next compute reads its channels from
+    channel_offset of an ifmap with pixel_stride channels per pixel.
+    Only for 1x1 windows, or windows of a multiple of 32 channels
+    (internalInterfaceElements). (0, 0) goes back to plain ifmaps.
+    '''
+    CSR_REG_IFMAP_LAYOUT = 9
+    if not (0 <= channel_offset < 2**16 and 0 <= pixel_stride < 2**16):
+        raise ValueError(f"Ifmap layout ({channel_offset}, {pixel_stride}) does not fit in 16 bits.")
+    word = ((pixel_stride & 0xFFFF) << 16) | (channel_offset & 0xFFFF)
+    return [f'LOAD {int(write_address, 16) + CSR_REG_IFMAP_LAYOUT:08x} {word:08x}']
+
+def make_act_addr_write(
+    ifmap_addr,
+    ofmap_addr,
+    write_address='00000010'  # CSR base address
+):
+    '''
+    Sets CSR_REG_IFMAP_ADDR and CSR_REG_OFMAP_ADDR so the next ifmap load
+    and compute use these ACTMEM addresses instead of the running ones.
+    None goes back to the running address.
+    '''
+    CSR_REG_IFMAP_ADDR = 10
+    CSR_REG_OFMAP_ADDR = 11
+    commands = []
+    for reg, addr in [(CSR_REG_IFMAP_ADDR, ifmap_addr), (CSR_REG_OFMAP_ADDR, ofmap_addr)]:
+        if addr is not None and not 0 <= addr < 2**18:
+            raise ValueError(f"ACTMEM address {addr} does not fit in 18 bits.")
+        word = 0 if addr is None else (1 << 31) | addr
+        commands += [f'LOAD {int(write_address, 16) + reg:08x} {word:08x}']
+    return commands
+
+def weight_delta_windows(weight_data, loaded_weight_data, merge_gap = 2):
+    '''
+    [start, stop) word ranges where weight_data differs from loaded_weight_data.
+    Ranges separated by merge_gap unchanged words or less are merged, as
+    rewriting those words is as cheap as opening another window.
+    '''
+    changed = np.flatnonzero(np.asarray(weight_data) != np.asarray(loaded_weight_data))
+    if len(changed) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(changed) > merge_gap + 1)
+    starts = np.concatenate([changed[:1], changed[breaks + 1]])
+    stops = np.concatenate([changed[breaks], changed[-1:]]) + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
 def bundle_config_into_write(
     config_dict,
     config_write_address = '00000010' # in hex, base address for CSR
@@ -380,6 +730,7 @@ def bundle_config_into_write(
         ((config_dict['filter_size_x']          & 0xF) << 12) |
         ((config_dict['filter_size_y']          & 0xF) << 8)  |
         ((config_dict['adc_ref_range_shifts']   & 0xF) << 4)  |
+        ((config_dict.get('psum_mode', PSUM_OFF) & 0x3) << 2)  |
         ((config_dict['unsigned_acts']          & 0x1) << 1)  |
         ((config_dict['binary_cfg']             & 0x1) << 0)
     )
@@ -416,11 +767,24 @@ def bundle_config_into_write(
     
     return config_writes
 
-def write_array_to_asm(write_array, address='00000100'):
-    asm = []
-    for element in write_array:
-        asm.append(f"LOAD {address} {vhex3(element)}")
-    return asm
+def format_array_asm(write_array, address='00000100', burst=False):
+    '''
+    One LOAD per element, or a single LOADBURST <address> <n>
+    followed by the n data words if burst is set.
+    Returns the block as a single newline-terminated string.
+    '''
+    if burst:
+        return f"LOADBURST {address} {len(write_array):08x}\n" + format_hex_lines(write_array)
+    return format_hex_lines(write_array, prefix=f"LOAD {address} ")
+
+def write_array_to_asm(write_array, address='00000100', burst=False):
+    return format_array_asm(write_array, address, burst).splitlines()
+
+def write_array_to_file(f, write_array, address='00000100', burst=False):
+    '''
+    Same as write_array_to_asm but writes straight into an open text file.
+    '''
+    f.write(format_array_asm(write_array, address, burst))
 
 def get_config_from_mapped_node(
     mapped_node : core.MappedQRAccNode,
@@ -437,8 +801,8 @@ def get_config_from_mapped_node(
         raise ValueError("Input feature map channels do not match kernel input channels.")
 
     kernel_shape = mapped_node.kernel.shape
-    ofmap_dimx = ((ifmap_shape[2] - kernel_shape[2] + 2*mapped_node.pads[0]) // mapped_node.strides[0]) + 1 #(W-K+2P)/S + 1
-    ofmap_dimy = ((ifmap_shape[3] - kernel_shape[3] + 2*mapped_node.pads[1]) // mapped_node.strides[1]) + 1
+    ofmap_dimx = ((ifmap_shape[3] - kernel_shape[3] + 2*mapped_node.pads[1]) // mapped_node.strides[1]) + 1 #(W-K+2P)/S + 1
+    ofmap_dimy = ((ifmap_shape[2] - kernel_shape[2] + 2*mapped_node.pads[0]) // mapped_node.strides[0]) + 1
 
     tplitz_window_length = kernel_shape[2] * kernel_shape[3] * ifmap_shape[1] # CFxFy
 
@@ -457,14 +821,14 @@ def get_config_from_mapped_node(
         "unsigned_acts": 1,
         "binary_cfg": 1,
         "adc_ref_range_shifts": int(adc_ref_range_shifts),
-        "filter_size_y": kernel_shape[3],
-        "filter_size_x": kernel_shape[2],
-        "input_fmap_dimx": ifmap_shape[2],
-        "input_fmap_dimy": ifmap_shape[3],
+        "filter_size_y": kernel_shape[2],
+        "filter_size_x": kernel_shape[3],
+        "input_fmap_dimx": ifmap_shape[3],
+        "input_fmap_dimy": ifmap_shape[2],
         "output_fmap_dimx": ofmap_dimx,
         "output_fmap_dimy": ofmap_dimy,
-        "stride_x": mapped_node.strides[0],
-        "stride_y": mapped_node.strides[1],
+        "stride_x": mapped_node.strides[1],
+        "stride_y": mapped_node.strides[0],
         "num_input_channels": ifmap_shape[1],
         "num_output_channels": kernel_shape[0],
         "mapped_matrix_offset_x": mapped_node.offset_x,
@@ -477,27 +841,581 @@ def get_config_from_mapped_node(
 
 def check_if_any_consumers_are_noncompilable(
     nx_model : onnx.ModelProto,
-    nx_node : int
+    nx_node : int,
+    graph_index : NxGraphIndex = None
 ):
     """
     Check if any consumers of the given node are non-compilable.
     Returns True if any consumer is non-compilable, False otherwise.
+    Pass a graph_index to avoid scanning the whole graph.
     """
+    if graph_index is not None:
+        node_id = graph_index.producers_of(nx_node.output[0])[0]
+        return graph_index.has_noncompilable_consumer(node_id)
     for output in nx_node.output:
         for node in nx_model.graph.node:
             if output in node.input and not is_nx_node_compilable(node):
                 return True
     return False
 
-def traverse_and_compile_nx_graph(
+class NodeCompilePlan(object):
+    '''
+    Everything the code generation of one node depends on besides the node itself.
+    Decided by plan_nx_graph, which has to walk the graph in order because
+    bin and ACTMEM reuse depend on the previous node.
+    '''
+
+    def __init__(self, node_id, info, include_ifmap_writes, write_weights, add_read, preserve_ifmap, seed, loaded_bin_id = None):
+        self.node_id = node_id
+        self.info = info  # Lines of the INFO block, without INFO and ENDINFO
+        self.include_ifmap_writes = include_ifmap_writes
+        self.write_weights = write_weights
+        self.add_read = add_read
+        self.preserve_ifmap = preserve_ifmap
+        self.seed = seed  # Seed of the random ifmap of this node
+        self.loaded_bin_id = loaded_bin_id  # Bin in the analog core before this node, None if empty
+        self.loaded_scaler_data = None  # Output scaler contents before this node, set by track_scaler_state
+        self.loaded_bias_data = None
+        self.image = 0  # Image of the batch, set by batch_nx_plans
+        self.ofmap_layout = None  # (channel offset, channels per pixel) of an output-channel tile
+        self.merges_with_next = False  # Tile whose merged ofmap the next node completes
+        self.psum_mode = PSUM_OFF  # PSUM_* mode of a row tile
+        self.ifmap_channels = None  # [start, stop) input channels of a row tile or channel group
+        self.ifmap_layout = None  # (channel offset, channels per pixel) of an in-place row tile or channel group
+        self.ifmap_band = None  # Row band whose rows the node loads, see tiling.split_row_bands
+        self.act_addrs = None  # (ifmap, ofmap) ACTMEM addresses set by allocate_nx_plans
+
+    def __repr__(self):
+        return f"NodeCompilePlan(node_id={self.node_id}, include_ifmap_writes={self.include_ifmap_writes}, write_weights={self.write_weights}, add_read={self.add_read}, preserve_ifmap={self.preserve_ifmap}, seed={self.seed}, loaded_bin_id={self.loaded_bin_id})"
+
+def plan_nx_graph(
+    u_nx_mapping : core.NxModelMapping,
+    graph_index  : NxGraphIndex,
+    until        : int = None,
+    starting     : int = 0,
+    seed         : int = 0,
+    tensor_store : IntermediateTensorStore = None,
+    actmem_bytes : int = ACTMEM_BYTES
+):
+    '''
+    Sequential planning pass of the compiler.
+    Decides bin rewrites, ifmap loads, readouts and ifmap preservation
+    for every compilable node. Output-channel tiles merged by a Concat
+    write into one ofmap, only the last one reads it out. Row tiles
+    accumulate in the psum_buffer, only the last one writes its ofmap.
+    Depthwise channel groups read and write their channels of one ifmap
+    and ofmap, only the last one reads it out.
+
+    With a tensor_store, the ACTMEM addresses are tracked like the
+    controller moves them. A node whose ofmap would end past actmem_bytes
+    gets its ifmap reloaded at address 0 instead, and the node that wrote
+    it reads it out first. Layers too large even then are split into row
+    bands beforehand (see tiling.split_row_bands).
+    Does not touch any tensor data.
+    Returns a list of NodeCompilePlan in execution order.
+    '''
+    if until is None:
+        until = len(graph_index.nodes)
+
+    plans = []
+    prev_bin_id = None
+    loaded_view = None  # graph_index.ifmap_view of the ifmap in ACTMEM
+    event_names = set()  # INFO node names used so far, kept unique
+    ifmap_start, ofmap_start = 0, 0
+    for node_id in graph_index.order[starting:until]:
+        nx_node = graph_index.node(node_id)
+
+        if node_id in graph_index.merges:
+            print(f'Skipping {nx_node.name} as its tiles are merged in ACTMEM...')
+            continue
+        if not graph_index.is_compilable(node_id):
+            print(f'Skipping {nx_node.name} as it is not compilable...')
+            continue
+
+        mapped_node = u_nx_mapping.get_mapped_node_by_id(node_id)
+        input_name = mapped_node.get_true_inputs()[0]
+        output_name = graph_index.merged_output(node_id)
+        last_tile = graph_index.is_last_tile(node_id)
+        readout = last_tile and graph_index.has_noncompilable_consumer(node_id)
+        preserve_ifmap = graph_index.shares_input_with_next(node_id)
+        row_tile = graph_index.row_tiles.get(node_id)
+        row_band = graph_index.row_bands.get(node_id)
+        view = graph_index.ifmap_view(node_id)
+        include_ifmap_writes = view != loaded_view
+
+        # The tb will later parse this as the node name, and stats are matched to nodes by it
+        event_name = sanitize_name(nx_node.name)
+        if event_name in event_names:
+            event_name = f'{event_name}_{node_id}'
+        event_names.add(event_name)
+        info = [event_name]
+        info += [f'Current loaded ifmap: {loaded_view[0] if loaded_view else None}']
+
+        print('============ Planning Node ============')
+
+        if mapped_node.depthwise:
+            print(f"Compiling {nx_node.name} as depthwise node...")
+
+        if include_ifmap_writes and graph_index.needs_host_ifmap(node_id):
+            print(f"Compiling {nx_node.name} as tile with its own ifmap...")
+            _, rows, channels = view
+            part = f'rows {rows[0]} to {rows[1]}' if rows is not None else ''
+            part += (' and ' if part else '') + (f'channels {channels[0]} to {channels[1]}' if channels is not None else '')
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) reading {part} of ifmap ({input_name}) from external memory']
+        elif include_ifmap_writes:
+            print(f"Compiling {nx_node.name} as first node of set...")
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) reading ifmap ({input_name}) from external memory']
+        else:
+            print(f"Compiling {nx_node.name} as middle node of set...")
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) will read ifmap ({input_name}) from ACTMEM']
+
+        if readout:
+            print(f"{nx_node.name} is followed by a non-compilable node, so it will write the ofmap to external memory.")
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) will write ofmap ({output_name}) into external memory']
+
+        if mapped_node.bin_id is not None:
+            if mapped_node.bin_id != prev_bin_id:
+                print(f"Rewriting bin {nx_node.name} as bin changed from {prev_bin_id} to {mapped_node.bin_id}...")
+                info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) will rewrite the bin from {prev_bin_id} to {mapped_node.bin_id}']
+            else:
+                print(f'NODE {nx_node.name} (id={mapped_node.node_id}) BIN COMBO!!! Reusing bin {mapped_node.bin_id}.')
+                info += [f'This node will reuse the bin {mapped_node.bin_id} from the previous node']
+        else:
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) is a depthwise node. Loaded bin ({prev_bin_id}) is preserved.']
+
+        if preserve_ifmap:
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) will preserve the ifmap ({input_name}) in ACTMEM for the next node.']
+
+        ofmap_layout = None
+        tiles = graph_index.merge_tiles(node_id)
+        if tiles is not None:
+            channels = [u_nx_mapping.get_mapped_node_by_id(tile).kernel.shape[0] for tile in tiles]
+            channel_offset = sum(channels[:tiles.index(node_id)])
+            ofmap_layout = (channel_offset, sum(channels))
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) writes channels {channel_offset} to {channel_offset + channels[tiles.index(node_id)]} of {output_name}']
+
+        psum_mode, ifmap_channels, ifmap_layout = PSUM_OFF, None, None
+        if row_tile is not None:
+            start, stop, num_channels = row_tile['channels']
+            if row_tile['tile'] == 0:
+                psum_mode = PSUM_FIRST
+            elif row_tile['tile'] == row_tile['tiles'] - 1:
+                psum_mode = PSUM_LAST
+            else:
+                psum_mode = PSUM_ACCUMULATE
+            ifmap_channels = (start, stop)
+            if row_tile['in_place']:
+                ifmap_layout = (start, num_channels)
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) is row tile {row_tile["tile"] + 1} of {row_tile["tiles"]} of {row_tile["node"]}, input channels {start} to {stop}']
+
+        channel_group = graph_index.channel_groups.get(node_id)
+        if channel_group is not None:
+            start, stop, num_channels = channel_group['channels']
+            ifmap_channels = (start, stop)
+            ifmap_layout = (start, num_channels)
+            ofmap_layout = (start, num_channels)
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) is channel group {channel_group["tile"] + 1} of {channel_group["tiles"]} of {channel_group["node"]}, channels {start} to {stop}']
+
+        if row_band is not None:
+            start, stop, out_height = row_band['output_rows']
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) is row band {row_band["tile"] + 1} of {row_band["tiles"]} of {row_band["node"]}, output rows {start} to {stop} of {out_height}']
+
+        if tensor_store is not None:
+            ifmap_bytes, ofmap_bytes, ofmap_advance = node_actmem_bytes(
+                graph_index, u_nx_mapping, tensor_store, node_id, ofmap_layout)
+            if not include_ifmap_writes and ofmap_start + ofmap_bytes > actmem_bytes:
+                producer = next((plan for plan in reversed(plans) if graph_index.merged_output(plan.node_id) == input_name), None)
+                if producer is not None:
+                    print(f'{nx_node.name} would write past ACTMEM, reloading its ifmap ({input_name})')
+                    producer.add_read = True
+                    include_ifmap_writes = True
+                    info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) reloads ifmap ({input_name}) from external memory, its ofmap would end past ACTMEM']
+            if include_ifmap_writes:
+                ifmap_start, ofmap_start = 0, -(-ifmap_bytes // 4) * 4
+            if ofmap_start + ofmap_bytes > actmem_bytes:
+                print(f'WARNING: {nx_node.name} needs {ofmap_start + ofmap_bytes} bytes of ACTMEM, only {actmem_bytes} are available')
+            info += [f'NODE {nx_node.name} (id={mapped_node.node_id}) ifmap at {ifmap_start:08x}, ofmap at {ofmap_start:08x}']
+            if not preserve_ifmap:
+                ifmap_start, ofmap_start = ofmap_start, ofmap_start + ofmap_advance
+
+        plans.append(NodeCompilePlan(
+            node_id              = node_id,
+            info                 = info,
+            include_ifmap_writes = include_ifmap_writes,
+            write_weights        = mapped_node.bin_id != prev_bin_id,
+            add_read             = readout,
+            preserve_ifmap       = preserve_ifmap,
+            seed                 = [seed, node_id],
+            loaded_bin_id        = prev_bin_id,
+        ))
+        plans[-1].ofmap_layout = ofmap_layout
+        plans[-1].merges_with_next = (
+            not last_tile or psum_mode in (PSUM_FIRST, PSUM_ACCUMULATE) or
+            (channel_group is not None and channel_group['tile'] < channel_group['tiles'] - 1)
+        )
+        plans[-1].psum_mode = psum_mode
+        plans[-1].ifmap_channels = ifmap_channels
+        plans[-1].ifmap_layout = ifmap_layout
+        plans[-1].ifmap_band = row_band
+
+        prev_bin_id = mapped_node.bin_id if not mapped_node.depthwise else prev_bin_id  # If the node is depthwise, we don't change the bin id, as it will be the same as the previous node
+
+        loaded_view = view if preserve_ifmap else (output_name, None, None)
+
+    return plans
+
+def node_actmem_bytes(
+    graph_index  : NxGraphIndex,
+    u_nx_mapping : core.NxModelMapping,
+    tensor_store : IntermediateTensorStore,
+    node_id      : int,
+    ofmap_layout = None
+):
+    '''
+    (ifmap bytes loaded, ofmap bytes written from the ofmap start, bytes the
+    ofmap start moves by after the compute) of a node in ACTMEM, same
+    addressing as QrAccIss.compute.
+    '''
+    mapped_node = u_nx_mapping.get_mapped_node_by_id(node_id)
+    ifmap_shape = tuple(tensor_store.shape(graph_index.node(node_id).input[0]))
+    if len(ifmap_shape) != 4:
+        ifmap_shape = (1, int(np.prod(ifmap_shape)), 1, 1)
+    _, rows, channels = graph_index.ifmap_view(node_id)
+    if rows is not None:
+        pads = graph_index.row_bands[node_id]['pads']
+        ifmap_shape = (ifmap_shape[0], ifmap_shape[1], rows[1] - rows[0], ifmap_shape[3] + pads[1] + pads[3])
+    if channels is not None:
+        ifmap_shape = (ifmap_shape[0], channels[1] - channels[0], ifmap_shape[2], ifmap_shape[3])
+
+    ofmap_shape = infer_ofmap_shape(
+        ifmap_shape  = ifmap_shape,
+        kernel_shape = mapped_node.kernel.shape,
+        pads         = mapped_node.pads,
+        stride       = mapped_node.strides,
+    )
+    num_pixels = ofmap_shape[2] * ofmap_shape[3]
+    num_channels = mapped_node.kernel.shape[0]
+    channel_offset, pixel_stride = ofmap_layout if ofmap_layout is not None else (0, num_channels)
+    pixel_stride = pixel_stride or num_channels
+    ofmap_bytes = num_pixels * pixel_stride + actmem_footprint((0,), 0, num_channels)
+    return int(np.prod(ifmap_shape)), ofmap_bytes, num_pixels * pixel_stride + num_channels
+
+def allocate_nx_plans(
+    plans,
+    graph_index  : NxGraphIndex,
+    u_nx_mapping : core.NxModelMapping,
+    tensor_store : IntermediateTensorStore,
+    actmem_bytes : int = ACTMEM_BYTES
+):
+    '''
+    Places the ifmap and ofmap of every plan in ACTMEM by tensor liveness,
+    instead of the running addresses of the controller.
+
+    A tensor stays resident from the node that writes (or loads) it to
+    the last node that reads it, so a node reading a tensor that is still
+    resident does not load it again, even when other nodes ran in between.
+    The nodes of a run group share the range of its ofmap. When a tensor does not fit,
+    the resident tensor read furthest in the future is evicted; if it is
+    read again, the node that wrote it reads it out and the reader loads it back.
+
+    Sets plan.act_addrs (CSR_REG_IFMAP_ADDR and CSR_REG_OFMAP_ADDR) and
+    updates include_ifmap_writes and add_read. The ifmap is never
+    preserved by the controller, the addresses are set for every compute.
+    Modifies the plans in place.
+    '''
+    views = [graph_index.ifmap_view(plan.node_id) for plan in plans]
+    uses = view_uses(views)
+    allocator = ActmemAllocator(actmem_bytes)
+    writers = {}  # view -> plan that wrote it in ACTMEM
+
+    def place(view, num_bytes, pos, keep):
+        address = allocator.allocate(view, num_bytes)
+        while address is None:
+            victims = [v for v in allocator.resident if v not in keep]
+            if not victims:
+                print(f'WARNING: {view[0]} ({num_bytes} bytes) does not fit in {actmem_bytes} bytes of ACTMEM')
+                allocator.resident[view] = (0, num_bytes)
+                return 0
+            victim = max(victims, key=lambda v: next_use(uses, v, pos) or len(plans))
+            allocator.free(victim)
+            if victim in writers and next_use(uses, victim, pos) is not None:
+                writers[victim].add_read = True
+                writers[victim].info += [f'{victim[0]} is evicted from ACTMEM before it is read again, so it is read out']
+            address = allocator.allocate(view, num_bytes)
+        return address
+
+    for pos, plan in enumerate(plans):
+        view = views[pos]
+        # Tiles, row tiles and channel groups all write the ofmap of the last node of their group
+        group = graph_index.run_group(plan.node_id)
+        output_view = (graph_index.merged_output(group[-1] if group else plan.node_id), None, None)
+        ifmap_bytes, ofmap_bytes, _ = node_actmem_bytes(
+            graph_index, u_nx_mapping, tensor_store, plan.node_id, plan.ofmap_layout)
+
+        plan.include_ifmap_writes = view not in allocator.resident
+        if plan.include_ifmap_writes:
+            place(view, -(-ifmap_bytes // 4) * 4, pos, {output_view})
+        if output_view not in allocator.resident:
+            place(output_view, ofmap_bytes, pos, {view})
+        writers[output_view] = plan  # The last tile of a merged ofmap reads it out
+        plan.act_addrs = (allocator.address(view), allocator.address(output_view))
+        plan.preserve_ifmap = False
+        plan.info += [f'ifmap ({view[0]}) at {plan.act_addrs[0]:08x}, ofmap ({output_view[0]}) at {plan.act_addrs[1]:08x}, {"loaded" if plan.include_ifmap_writes else "resident"}']
+
+        # Free what no later node reads, merged ofmaps once their last tile ran
+        if next_use(uses, view, pos) is None and view != output_view:
+            allocator.free(view)
+        if next_use(uses, output_view, pos) is None and not plan.merges_with_next:
+            allocator.free(output_view)
+    return plans
+
+def weight_stationary_segments(plans, u_nx_mapping : core.NxModelMapping):
+    '''
+    Splits the plans into runs of consecutive nodes that use one analog bin.
+    Depthwise nodes stay in the run they are in. Output-channel tiles
+    merged into one ofmap stay in one run, even across bins.
+    '''
+    segments = []
+    segment_bin_id = None
+    for plan in plans:
+        mapped_node = u_nx_mapping.get_mapped_node_by_id(plan.node_id)
+        bin_id = None if mapped_node.depthwise else mapped_node.bin_id
+        merging = bool(segments) and segments[-1][-1].merges_with_next
+        if not segments or (not merging and bin_id is not None and segment_bin_id is not None and bin_id != segment_bin_id):
+            segments.append([])
+            segment_bin_id = None
+        if bin_id is not None:
+            segment_bin_id = bin_id
+        segments[-1].append(plan)
+    return segments
+
+def batch_nx_plans(
+    plans,
+    u_nx_mapping : core.NxModelMapping,
+    batch_size   : int = 1,
+    micro_batch  : int = None
+):
+    '''
+    Weight-stationary schedule of a batch of images.
+
+    The images are split into micro-batches of micro_batch images (the
+    whole batch if None). Within a micro-batch, every image runs through
+    a weight_stationary_segments run before the next run, so each bin is
+    loaded once per micro-batch instead of once per image.
+
+    ACTMEM holds one image at a time, so with more than one image per
+    micro-batch the first node of a run loads the image's ifmap from
+    external memory and the last node reads its ofmap out.
+
+    Node names get a _b<image> suffix so the ofmaps of the images can be told apart.
+    Returns the plans unchanged for a batch of 1.
+    '''
+    if batch_size <= 1:
+        return plans
+    micro_batch = batch_size if micro_batch is None else micro_batch
+    segments = weight_stationary_segments(plans, u_nx_mapping)
+
+    batched = []
+    loaded_bin_id = None
+    for first_image in range(0, batch_size, micro_batch):
+        images = range(first_image, min(first_image + micro_batch, batch_size))
+        streaming = len(images) > 1
+        for segment_index, segment in enumerate(segments):
+            for image in images:
+                for pos, plan in enumerate(segment):
+                    mapped_node = u_nx_mapping.get_mapped_node_by_id(plan.node_id)
+                    image_plan = copy.copy(plan)
+                    image_plan.image = image
+                    image_plan.seed = plan.seed if image == 0 else plan.seed + [image]
+                    image_plan.info = [f'{plan.info[0]}_b{image}'] + plan.info[1:]
+                    image_plan.info += [f'Image {image} of {batch_size}, weight-stationary run {segment_index}']
+
+                    image_plan.loaded_bin_id = loaded_bin_id
+                    if not mapped_node.depthwise:
+                        image_plan.write_weights = mapped_node.bin_id != loaded_bin_id
+                        loaded_bin_id = mapped_node.bin_id
+
+                    if streaming and pos == 0 and not plan.include_ifmap_writes:
+                        image_plan.include_ifmap_writes = True
+                        image_plan.info += ['The ifmap is reloaded, other images ran since it was written']
+                    if streaming and pos == len(segment) - 1:
+                        image_plan.add_read = True
+                        image_plan.preserve_ifmap = False
+                    batched.append(image_plan)
+    return batched
+
+def input_batch_size(input_dict : dict):
+    '''
+    Leading dimension of the graph inputs, 1 if they have none.
+    '''
+    value = np.asarray(next(iter(input_dict.values())))
+    return value.shape[0] if value.ndim > 0 else 1
+
+def compile_planned_node(plan : NodeCompilePlan, context : dict):
+    '''
+    Code generation of one planned node. Only depends on the plan and
+    the read-only context, so nodes can be compiled in any order.
+    context holds nx_model, input_dict, tensor_store, u_nx_mapping,
+    imc_core_size, dwc_core_size, burst, delta_weights, delta_scalers,
+    ifmap_placeholders and an optional CompileCache.
+    Returns the command chunk and the compile_stats of the node.
+    '''
+    nx_model = context['nx_model']
+    u_nx_mapping = context['u_nx_mapping']
+    mapped_node = u_nx_mapping.get_mapped_node_by_id(plan.node_id)
+
+    input_tensor = generate_random_intermediate_tensor(
+        nx_model, plan.node_id, context['input_dict'], context['tensor_store'],
+        rng = np.random.RandomState(plan.seed)
+    )
+    # Row tiles that load only their channels and row bands get a partial ifmap
+    ifmap_channels = plan.ifmap_channels
+    host_channels = ifmap_channels if plan.ifmap_layout is None else None
+    if host_channels is not None or plan.ifmap_band is not None:
+        input_tensor = apply_ifmap_view(input_tensor, host_channels, plan.ifmap_band)
+        ifmap_channels = plan.ifmap_channels if host_channels is None else None
+    u_code = QrAccNodeCode(
+        mapped_node   = mapped_node,
+        mapped_bin    = u_nx_mapping.get_bin_of_node_id(plan.node_id),
+        ifmap         = input_tensor,
+        imc_core_size = context['imc_core_size'],
+        ws_core_size  = context['dwc_core_size'],
+        nx_model      = nx_model,
+        tensor_store  = context['tensor_store'],
+        compile_only  = True,
+        ifmap_channels = ifmap_channels
+    )
+
+    compile_kwargs = dict(
+        include_ifmap_writes = plan.include_ifmap_writes,
+        write_weights        = plan.write_weights,
+        add_read             = plan.add_read,
+        end                  = False ,
+        preserve_ifmap       = plan.preserve_ifmap ,
+        burst                = context['burst'] ,
+    )
+    if plan.ofmap_layout is not None:
+        compile_kwargs['ofmap_layout'] = plan.ofmap_layout
+    if plan.psum_mode != PSUM_OFF:
+        compile_kwargs['psum_mode'] = plan.psum_mode
+    if plan.ifmap_layout is not None:
+        compile_kwargs['ifmap_layout'] = plan.ifmap_layout
+    if plan.act_addrs is not None:
+        compile_kwargs['act_addrs'] = plan.act_addrs
+    if context.get('ifmap_placeholders') and plan.include_ifmap_writes:
+        input_name = ifmap_view_label(mapped_node.get_true_inputs()[0], host_channels, plan.ifmap_band)
+        compile_kwargs['ifmap_placeholder'] = f'{input_name} {plan.image}'
+    if context.get('delta_scalers'):
+        compile_kwargs['loaded_scaler_data'] = plan.loaded_scaler_data
+        compile_kwargs['loaded_bias_data'] = plan.loaded_bias_data
+    # Only rewrite the words that differ from the bin in the core
+    if context.get('delta_weights') and plan.write_weights and plan.loaded_bin_id is not None and not mapped_node.depthwise:
+        compile_kwargs['loaded_weight_data'] = mapped_matrix_to_bank_writes(
+            u_nx_mapping.mapped_bins[plan.loaded_bin_id].weights, 32
+        )
+
+    commands = ['INFO'] + plan.info + ['ENDINFO']
+    # commands += [u_code.__repr__()]
+    if context.get('cache') is not None:
+        commands += context['cache'].compile(u_code, **compile_kwargs)
+    else:
+        commands += u_code.compile(**compile_kwargs)
+    return commands, u_code.compile_stats
+
+# Set in each pool worker by _init_compile_worker. Workers are forked, so
+# the context is inherited instead of pickled.
+_COMPILE_WORKER_CONTEXT = None
+
+def _init_compile_worker(context):
+    global _COMPILE_WORKER_CONTEXT
+    _COMPILE_WORKER_CONTEXT = context
+
+def _compile_planned_node_in_worker(plan):
+    return compile_planned_node(plan, _COMPILE_WORKER_CONTEXT)
+
+def iter_compile_nx_graph(
     nx_model     : onnx.ModelProto,
     input_dict   : dict,
     imc_core_size: tuple = (256, 256),
     dwc_core_size: int = 32,
     until        : int = None,
     starting     : int = 0,
-    packer = None
+    packer = None,
+    tensor_store : IntermediateTensorStore = None,
+    burst        : bool = False,
+    seed         : int = 0,
+    n_workers    : int = None,
+    cache        : CompileCache = None,
+    schedule     : bool = False,
+    delta_weights: bool = True,
+    delta_scalers: bool = True,
+    report       : CompileReport = None,
+    batch_size   : int = None,
+    micro_batch  : int = None,
+    ifmap_placeholders : bool = False,
+    allocate_actmem : bool = False
 ):
+    '''
+    Generator version of traverse_and_compile_nx_graph.
+    Yields the command chunk of each compiled node as soon as it is ready,
+    then a final ['END'] chunk.
+
+    The graph is planned sequentially first, then the nodes are compiled.
+    With n_workers > 1 the nodes are compiled on a process pool. Random
+    ifmaps are seeded with (seed, node_id), so the output does not depend
+    on n_workers.
+
+    With a CompileCache, nodes whose inputs did not change since a
+    previous run are read back from the cache instead of compiled.
+
+    With schedule, nodes run in the order of schedule_nx_graph instead of
+    the ONNX order, so fewer bins and ifmaps are rewritten.
+
+    With delta_weights, a bin rewrite only writes the SRAM words that
+    differ from the previous bin, through CSR_REG_LOAD_WINDOW loads.
+    With delta_scalers, scalers and biases are only written for the used
+    columns that differ from what the output scaler holds.
+
+    With a CompileReport, the compile_stats of every node are added to it.
+
+    batch_size images are compiled into one weight-stationary stream
+    (see batch_nx_plans). If None, it is the leading dimension of the
+    input_dict arrays, and the first image is used to run the model.
+
+    With ifmap_placeholders, the ifmap blocks loaded from external memory
+    are marked for QrAccProgram (see compile_nx_graph_to_program).
+
+    With allocate_actmem, tensors are placed in ACTMEM by liveness (see
+    allocate_nx_plans), so a tensor read by several nodes is only loaded
+    once. Not for batches that stream several images through each run.
+
+    Layers with more output channels than the core has columns are split
+    into output-channel tiles first (see tiling.split_wide_nodes), and
+    layers with windows longer than the rows into row tiles that
+    accumulate partial sums (see tiling.split_deep_nodes). Depthwise layers
+    wider than the WSAcc are split into channel groups
+    (see tiling.split_depthwise_nodes). Before the row tiling, convolutions
+    whose ifmap and ofmap overflow ACTMEM, and long ones with more output
+    pixels than the partial sums, are split into row bands
+    (see tiling.split_row_bands).
+    '''
+    if batch_size is None:
+        batch_size = input_batch_size(input_dict)
+        if batch_size > 1:
+            input_dict = {name: value[:1] for name, value in input_dict.items()}
+    if report is not None:
+        report.batch_size = batch_size
+
+    nx_model = split_wide_nodes(nx_model, imc_core_size[1])
+
+    # Runs the model once, shapes and reference outputs are looked up from here
+    if tensor_store is None:
+        tensor_store = IntermediateTensorStore(nx_model, input_dict)
+    # Band outputs go into an overlay, the caller's store can be reused as it was
+    tensor_store = tensor_store.overlay()
+    nx_model = split_row_bands(nx_model, tensor_store, max_rows=imc_core_size[0])
+    nx_model = split_deep_nodes(nx_model, tensor_store, imc_core_size[0])
+    nx_model = split_depthwise_nodes(nx_model, dwc_core_size)
     
     u_nx_mapping = core.NxModelMapping(
         nx_model,
@@ -506,89 +1424,111 @@ def traverse_and_compile_nx_graph(
         packer = packer
     )
 
-    if until is None:
-        until = len(nx_model.graph.node)
-    commands = []
-
-    prev_bin_id = None
-    current_loaded_ifmap_name = None
-    for node_id,nx_node in enumerate(nx_model.graph.node[starting:until]):
-        
-        readout = check_if_any_consumers_are_noncompilable(nx_model, nx_node)
-        next_node = nx_model.graph.node[node_id + 1] if node_id + 1 < len(nx_model.graph.node) else None
-
-        if is_nx_node_compilable(nx_node):
-            input_tensor = generate_random_intermediate_tensor(
-                nx_model, node_id, input_dict
-            )
-            u_code = QrAccNodeCode(
-                mapped_node   = u_nx_mapping.get_mapped_node_by_id(node_id),
-                mapped_bin    = u_nx_mapping.get_bin_of_node_id(node_id),
-                ifmap         = input_tensor,
-                imc_core_size = imc_core_size,
-                ws_core_size  = dwc_core_size,
-                nx_model      = nx_model
-            )
+    graph_index = NxGraphIndex(nx_model)
+    if schedule:
+        graph_index = graph_index.with_order(
+            schedule_nx_graph(graph_index, u_nx_mapping, tensor_store, imc_core_size)
+        )
 
-            preserve_ifmap = False
-            if is_nx_node_compilable(next_node) and next_node.input[0] == u_code.inputs[0]:
-                preserve_ifmap = True
+    if allocate_actmem:
+        if batch_size > 1 and micro_batch != 1:
+            raise ValueError('allocate_actmem needs micro_batch=1, the images of a micro-batch share ACTMEM.')
+        plans = plan_nx_graph(u_nx_mapping, graph_index, until, starting, seed)
+        allocate_nx_plans(plans, graph_index, u_nx_mapping, tensor_store)
+    else:
+        plans = plan_nx_graph(u_nx_mapping, graph_index, until, starting, seed, tensor_store)
+    plans = batch_nx_plans(plans, u_nx_mapping, batch_size, micro_batch)
+    if delta_scalers:
+        track_scaler_state(plans, u_nx_mapping, imc_core_size)
+
+    context = {
+        'nx_model'      : nx_model,
+        'input_dict'    : input_dict,
+        'tensor_store'  : tensor_store,
+        'u_nx_mapping'  : u_nx_mapping,
+        'imc_core_size' : imc_core_size,
+        'dwc_core_size' : dwc_core_size,
+        'burst'         : burst,
+        'cache'         : cache,
+        'delta_weights' : delta_weights,
+        'delta_scalers' : delta_scalers,
+        'ifmap_placeholders' : ifmap_placeholders,
+    }
 
-            commands += ['INFO']
-            commands += [f'{sanitize_name(nx_node.name)}'] # The tb will later parse this as the node name
-            commands += [f'Current loaded ifmap: {current_loaded_ifmap_name}']
+    if n_workers is None or n_workers <= 1:
+        compiled = (compile_planned_node(plan, context) for plan in plans)
+        for plan, (chunk, stats) in zip(plans, compiled):
+            if report is not None:
+                report.add(plan.info[0], stats)
+            yield chunk
+    else:
+        with ProcessPoolExecutor(
+            max_workers = n_workers,
+            mp_context  = multiprocessing.get_context('fork'),
+            initializer = _init_compile_worker,
+            initargs    = (context,)
+        ) as executor:
+            # map keeps the plan order, chunks still come out in execution order
+            compiled = executor.map(_compile_planned_node_in_worker, plans)
+            for plan, (chunk, stats) in zip(plans, compiled):
+                if report is not None:
+                    report.add(plan.info[0], stats)
+                yield chunk
+
+    yield ['END']
 
-            print('============ Compiling Node ============')
+def traverse_and_compile_nx_graph(
+    nx_model     : onnx.ModelProto,
+    input_dict   : dict,
+    imc_core_size: tuple = (256, 256),
+    dwc_core_size: int = 32,
+    until        : int = None,
+    starting     : int = 0,
+    packer = None,
+    tensor_store : IntermediateTensorStore = None,
+    burst        : bool = False,
+    seed         : int = 0,
+    n_workers    : int = None,
+    cache        : CompileCache = None,
+    schedule     : bool = False,
+    delta_weights: bool = True,
+    delta_scalers: bool = True,
+    report       : CompileReport = None,
+    batch_size   : int = None,
+    micro_batch  : int = None,
+    allocate_actmem : bool = False
+):
+    commands = []
+    for chunk in iter_compile_nx_graph(
+        nx_model, input_dict, imc_core_size, dwc_core_size, until, starting, packer, tensor_store, burst, seed, n_workers, cache, schedule, delta_weights, delta_scalers, report, batch_size, micro_batch,
+        allocate_actmem = allocate_actmem
+    ):
+        commands += chunk
+    return commands
 
-            if u_code.mapped_node.depthwise:
-                print(f"Compiling {nx_node.name} as depthwise node...")
-            
-            if (u_code.inputs[0] != current_loaded_ifmap_name):
-                print(f"Compiling {nx_node.name} as first node of set...")
-                commands += [f'NODE {nx_node.name} (id={u_code.mapped_node.node_id}) reading ifmap ({u_code.inputs[0]}) from external memory']
-            else:
-                print(f"Compiling {nx_node.name} as middle node of set...")
-                commands += [f'NODE {nx_node.name} (id={u_code.mapped_node.node_id}) will read ifmap ({u_code.inputs[0]}) from ACTMEM']
-
-            if readout:
-                print(f"{nx_node.name} is followed by a non-compilable node, so it will write the ofmap to external memory.")
-                commands += [f'NODE {nx_node.name} (id={u_code.mapped_node.node_id}) will write ofmap ({u_code.outputs[0]}) into external memory']
-
-            if u_code.mapped_node.bin_id is not None:
-                if u_code.mapped_node.bin_id != prev_bin_id:
-                    print(f"Rewriting bin {nx_node.name} as bin changed from {prev_bin_id} to {u_code.mapped_node.bin_id}...")
-                    commands += [f'NODE {nx_node.name} (id={u_code.mapped_node.node_id}) will rewrite the bin from {prev_bin_id} to {u_code.mapped_node.bin_id}']
-                else:
-                    print(f'NODE {nx_node.name} (id={u_code.mapped_node.node_id}) BIN COMBO!!! Reusing bin {u_code.mapped_node.bin_id}.')
-                    commands += [f'This node will reuse the bin {u_code.mapped_node.bin_id} from the previous node']
+def compile_nx_graph_to_file(
+    savepath,
+    nx_model     : onnx.ModelProto,
+    input_dict   : dict,
+    command_format : str = 'txt',
+    **kwargs
+):
+    '''
+    Streams the compiled graph into savepath node by node, flushing after
+    each node so memory stays flat and readers can start early.
+    kwargs go to iter_compile_nx_graph. Returns the path of the written file.
+    '''
+    if command_format not in ('txt', 'bin'):
+        raise ValueError(f'Unknown command format: {command_format}')
+    path = os.path.join(savepath, f'commands.{command_format}')
+    with open(path, 'w' if command_format == 'txt' else 'wb') as f:
+        for chunk in iter_compile_nx_graph(nx_model, input_dict, **kwargs):
+            if command_format == 'txt':
+                f.write('\n'.join(chunk) + '\n')
             else:
-                commands += [f'NODE {nx_node.name} (id={u_code.mapped_node.node_id}) is a depthwise node. Loaded bin ({prev_bin_id}) is preserved.']
-
-            if preserve_ifmap:
-                commands += [f'NODE {nx_node.name} (id={u_code.mapped_node.node_id}) will preserve the ifmap ({u_code.inputs[0]}) in ACTMEM for the next node.']
-                    
-            # commands += [u_code.__repr__()]
-            commands += ['ENDINFO']
-            commands += u_code.compile(
-                include_ifmap_writes = (u_code.inputs[0] != current_loaded_ifmap_name) ,
-                write_weights        = u_code.mapped_node.bin_id                       != prev_bin_id,
-                add_read             = readout,
-                end                  = False ,
-                preserve_ifmap       = preserve_ifmap ,
-            )
-
-            prev_bin_id = u_code.mapped_node.bin_id if not u_code.mapped_node.depthwise else prev_bin_id  # If the node is depthwise, we don't change the bin id, as it will be the same as the previous node
-        
-            if not preserve_ifmap:
-                current_loaded_ifmap_name = u_code.outputs[0]
-
-        else:
-            print(f'Skipping {nx_node.name} as it is not compilable...')
-
-    commands += ['END'] 
-    prev_node = nx_node
-
-    return commands
+                f.write(commands_to_bin(chunk))
+            f.flush()
+    return path
 
 def get_info_command(u_code):
 
@@ -598,7 +1538,8 @@ def get_info_command(u_code):
     """
     commands = []
     commands += ['INFO']
-    commands += [u_code.__repr__()]
+    commands += [sanitize_name(u_code.mapped_node.name)] # The tb parses the first line as the node name
+    commands += u_code.__repr__().splitlines()
     commands += ['ENDINFO']
     return commands
 
@@ -619,4 +1560,119 @@ def sanitize_name(name):
     if not safe_name:
         safe_name = 'node'
         
-    return safe_name
\ No newline at end of file
+    return safe_name
+
+
+# Binary command records, read by tb_qracc_top when BINARY_COMMANDS is defined.
+# Each record is 64 bits, big-endian: [63:56] opcode, [55:32] address, [31:0] data.
+# INFO records carry the length of the node name in the data field, followed by
+# the name in 8-byte records. Other INFO lines are comments and are not kept.
+# LOADBURST records carry the word count, followed by two data words per record.
+# IFMAP/ENDIFMAP placeholder markers have no record.
+BIN_OPCODES = {
+    'LOAD':      0x01,
+    'WAITBUSY':  0x02,
+    'WAITREAD':  0x03,
+    'INFO':      0x04,
+    'LOADBURST': 0x05,
+    'END':       0x0F,
+}
+
+def commands_to_bin(commands):
+    '''
+    Converts text commands into binary command records.
+    '''
+    records = []
+    lines = iter(commands)
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+        op = tokens[0]
+        if op == 'LOAD':
+            addr, data = int(tokens[1], 16), int(tokens[2], 16)
+            records.append((BIN_OPCODES['LOAD'] << 56) | ((addr & 0xFFFFFF) << 32) | (data & 0xFFFFFFFF))
+        elif op == 'LOADBURST':
+            addr, n = int(tokens[1], 16), int(tokens[2], 16)
+            records.append((BIN_OPCODES['LOADBURST'] << 56) | ((addr & 0xFFFFFF) << 32) | n)
+            words = [int(next(lines), 16) for _ in range(n)] + [0] * (n % 2)
+            records += [(words[i] << 32) | words[i+1] for i in range(0, len(words), 2)]
+        elif op in ('IFMAP', 'ENDIFMAP'):
+            # QrAccProgram placeholder markers, the loads between them are kept
+            continue
+        elif op == 'INFO':
+            name = next(lines).strip().encode('ascii')
+            for info_line in lines:
+                if info_line.strip() == 'ENDINFO':
+                    break
+            records.append((BIN_OPCODES['INFO'] << 56) | len(name))
+            padded = name.ljust(-(-len(name) // 8) * 8, b'\0')
+            records += [int.from_bytes(padded[i:i+8], 'big') for i in range(0, len(padded), 8)]
+        elif op in BIN_OPCODES:
+            records.append(BIN_OPCODES[op] << 56)
+        else:
+            raise ValueError(f'Unknown command: {line}')
+    return np.array(records, dtype='>u8').tobytes()
+
+def bin_to_commands(data):
+    '''
+    Converts binary command records back into text commands.
+    '''
+    opcodes = {value: key for key, value in BIN_OPCODES.items()}
+    records = np.frombuffer(data, dtype='>u8')
+    commands = []
+    i = 0
+    while i < len(records):
+        record = int(records[i])
+        op = opcodes.get(record >> 56)
+        if op == 'LOAD':
+            commands.append(f'LOAD {(record >> 32) & 0xFFFFFF:08x} {record & 0xFFFFFFFF:08x}')
+        elif op == 'LOADBURST':
+            n = record & 0xFFFFFFFF
+            commands.append(f'LOADBURST {(record >> 32) & 0xFFFFFF:08x} {n:08x}')
+            words = records[i+1:i+1+(n+1)//2].astype(np.uint64)
+            words = np.stack([words >> np.uint64(32), words & np.uint64(0xFFFFFFFF)], axis=1).reshape(-1)[:n]
+            commands += [f'{int(word):08x}' for word in words]
+            i += (n + 1) // 2
+        elif op == 'INFO':
+            name_length = record & 0xFFFFFFFF
+            name_records = -(-name_length // 8)
+            name = records[i+1:i+1+name_records].tobytes()[:name_length].decode('ascii')
+            commands += ['INFO', name, 'ENDINFO']
+            i += name_records
+        elif op is not None:
+            commands.append(op)
+        else:
+            raise ValueError(f'Unknown binary command record {record:016x}')
+        i += 1
+    return commands
+
+def write_commands_file(commands, savepath, command_format='txt'):
+    '''
+    Writes commands for tb_qracc_top into savepath.
+    command_format='txt' writes commands.txt, one command per line.
+    command_format='bin' writes commands.bin, needs BINARY_COMMANDS in the tb.
+    Returns the path of the written file.
+    '''
+    if command_format == 'txt':
+        path = os.path.join(savepath, 'commands.txt')
+        with open(path, 'w') as f:
+            for write in commands:
+                f.write(write + '\n')
+    elif command_format == 'bin':
+        path = os.path.join(savepath, 'commands.bin')
+        with open(path, 'wb') as f:
+            f.write(commands_to_bin(commands))
+    else:
+        raise ValueError(f'Unknown command format: {command_format}')
+    return path
+
+def read_commands_file(path):
+    '''
+    Reads a commands.txt or commands.bin back into text commands.
+    '''
+    if os.fspath(path).endswith('.bin'):
+        with open(path, 'rb') as f:
+            return bin_to_commands(f.read())
+    with open(path, 'r') as f:
+        return f.read().splitlines()
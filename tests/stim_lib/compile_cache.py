@@ -0,0 +1,167 @@
+import os
+import json
+import hashlib
+import zipfile
+import numpy as np
+
+# Sources whose changes can change the emitted commands. Their contents
+# are part of every key, so editing the compiler invalidates the cache.
+_COMPILER_SOURCES = ['compile.py', 'stimulus_gen.py']
+
+def _compiler_fingerprint():
+    h = hashlib.sha256()
+    stim_lib_dir = os.path.dirname(os.path.abspath(__file__))
+    for source in _COMPILER_SOURCES:
+        with open(os.path.join(stim_lib_dir, source), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def _hash_value(h, value):
+    if isinstance(value, np.ndarray):
+        h.update(f'{value.dtype}{value.shape}'.encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, bytes):
+        h.update(value)
+    else:
+        h.update(repr(value).encode())
+    h.update(b'\0')
+
+class CompileCache(object):
+    '''
+    Content-addressed on-disk cache of compiled QrAccNodeCode.
+
+    The key is a sha256 over the ONNX node and its quantization parameters,
+    the ifmap contents and channels, the core sizes, the packer placement
+    (bin, offsets and the full bin weights), the compile flags and the
+    compiler sources.
+    Each entry is one .npz holding the command chunk, the packed
+    weight, scaler and bias arrays and the compile_stats.
+
+    Entries are evicted least recently used first (by mtime, which is
+    bumped on every hit) once the directory grows past max_bytes.
+    Safe to share between the workers of a parallel compile.
+    '''
+
+    def __init__(self, cache_dir : str, max_bytes : int = 2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.fingerprint = _compiler_fingerprint()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, u_code, **compile_kwargs):
+        mapped_node = u_code.mapped_node
+        h = hashlib.sha256()
+        for value in [
+            self.fingerprint,
+            mapped_node.nx_node.SerializeToString(),
+            mapped_node.kernel,
+            mapped_node.matrix,
+            mapped_node.scale,
+            mapped_node.biases,
+            mapped_node.x_zp,
+            mapped_node.y_zp,
+            mapped_node.strides,
+            mapped_node.pads,
+            mapped_node.depthwise,
+            mapped_node.bin_id,
+            mapped_node.offset_x,
+            mapped_node.offset_y,
+            u_code.mapped_bin.weights if u_code.mapped_bin is not None else None,
+            u_code.ifmap,
+            u_code.ifmap_channels,
+            u_code.ifmap_bits,
+            u_code.ofmap_bits,
+            u_code.imc_core_size,
+            u_code.ws_core_size,
+        ]:
+            _hash_value(h, np.asarray(value) if isinstance(value, np.generic) else value)
+        for name, value in sorted(compile_kwargs.items()):  # May hold arrays, e.g. loaded_weight_data
+            _hash_value(h, name)
+            _hash_value(h, value)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def get(self, key):
+        '''
+        Returns a dict with commands, weight_data, scaler_data, bias_data
+        and compile_stats, or None on a miss.
+        '''
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                loaded = {name: entry[name] for name in entry.files}
+            loaded['compile_stats'] = json.loads(str(loaded['compile_stats']))
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):  # Missing, evicted or corrupt
+            return None
+        loaded['commands'] = str(loaded['commands']).split('\n')
+        return loaded
+
+    def put(self, key, commands, u_code):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                commands    = np.array('\n'.join(commands)),
+                weight_data = np.asarray(u_code.weight_data),
+                scaler_data = np.asarray(u_code.scaler_data),
+                bias_data   = np.asarray(u_code.bias_data),
+                compile_stats = np.array(json.dumps(u_code.compile_stats)),
+            )
+        os.replace(tmp_path, path)  # Readers never see a half-written entry
+        self.evict()
+
+    def compile(self, u_code, **compile_kwargs):
+        '''
+        Drop-in for u_code.compile(**compile_kwargs).
+        On a hit the packed arrays and compile_stats are also put back into u_code.
+        '''
+        key = self.key(u_code, **compile_kwargs)
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            u_code.weight_data = entry['weight_data']
+            u_code.scaler_data = entry['scaler_data']
+            u_code.bias_data = entry['bias_data']
+            u_code.compile_stats = entry['compile_stats']
+            return entry['commands']
+
+        self.misses += 1
+        commands = u_code.compile(**compile_kwargs)
+        self.put(key, commands, u_code)
+        return commands
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:  # Evicted by another worker
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def __repr__(self):
+        return f"CompileCache({self.cache_dir}, hits={self.hits}, misses={self.misses}, max_bytes={self.max_bytes})"
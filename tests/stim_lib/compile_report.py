@@ -0,0 +1,54 @@
+# Keys of QrAccNodeCode.compile_stats, all counts of emitted words or loads
+COMPILE_STATS_KEYS = [
+    'weight_words',             # Analog weight words written
+    'weight_words_skipped',     # Analog weight words already in the core
+    'weight_windows',           # TRIGGER_LOADWEIGHTS issued
+    'digital_weight_words',
+    'scaler_words',
+    'scaler_words_skipped',     # Scaler words already in the output scaler
+    'bias_words',
+    'bias_words_skipped',
+    'ifmap_words',
+    'readout_words',            # Ofmap words read out by TRIGGER_READ_ACTIVATION
+]
+
+class CompileReport(object):
+    '''
+    Collects the compile_stats of every node of a compiled graph.
+    Pass one as report to iter_compile_nx_graph.
+    '''
+
+    def __init__(self):
+        self.nodes = []  # (node name, compile_stats)
+        self.batch_size = 1  # Images in the compiled stream
+
+    def add(self, name, stats):
+        self.nodes.append((name, dict(stats)))
+
+    def totals(self):
+        totals = dict.fromkeys(COMPILE_STATS_KEYS, 0)
+        for _, stats in self.nodes:
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def external_bytes(self):
+        '''
+        Activation bytes moved between ACTMEM and external memory, ifmap loads plus readouts.
+        '''
+        totals = self.totals()
+        return 4 * (totals['ifmap_words'] + totals['readout_words'])
+
+    def print_report(self, name = ''):
+        totals = self.totals()
+        print(f'============ Compile report {name} ============')
+        print(f'{"nodes":24s} {len(self.nodes):10d}')
+        print(f'{"batch_size":24s} {self.batch_size:10d}')
+        for key, value in totals.items():
+            print(f'{key:24s} {value:10d} {value / self.batch_size:14.1f} per image')
+        external_bytes = self.external_bytes()
+        print(f'{"external_bytes":24s} {external_bytes:10d} {external_bytes / self.batch_size:14.1f} per image')
+        return totals
+
+    def __repr__(self):
+        return f"CompileReport(nodes={len(self.nodes)}, batch_size={self.batch_size}, totals={self.totals()})"
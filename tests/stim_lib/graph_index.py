@@ -0,0 +1,253 @@
+import copy
+import heapq
+import onnx
+from .tiling import row_tiles, channel_groups, row_bands
+
+class NxGraphIndex(object):
+    '''
+    Producer/consumer index of an ONNX graph, built once per model.
+
+    producers[tensor]  : node ids that write the tensor
+    consumers[tensor]  : node ids that read the tensor
+    compilable[node_id]: whether QRAcc can run the node
+    order              : node ids in topological (execution) order
+    merges[node_id]    : tile node ids of a Concat that merges output-channel
+                         tiles (see tiling.split_wide_nodes), in channel order
+    row_tiles[node_id] : row tile of a node split by tiling.split_deep_nodes
+    channel_groups[node_id]: channel group of a depthwise node split by
+                         tiling.split_depthwise_nodes
+    row_bands[node_id] : row band of a node split by tiling.split_row_bands,
+                         also set for the row tiles and channel groups of a band
+    run_groups[node_id]: node ids that must run back to back with the node,
+                         in order (merged tiles, row tiles and channel groups)
+
+    Node ids are positions in nx_model.graph.node, same as NxModelMapping.
+    '''
+
+    def __init__(self, nx_model : onnx.ModelProto, is_compilable = None):
+        # Avoids a circular import, compile.py imports this module
+        if is_compilable is None:
+            from .compile import is_nx_node_compilable
+            is_compilable = is_nx_node_compilable
+
+        self.nodes = list(nx_model.graph.node)
+        self.graph_outputs = {output.name for output in nx_model.graph.output}
+        self.producers = {}
+        self.consumers = {}
+        for node_id, node in enumerate(self.nodes):
+            for tensor in node.output:
+                self.producers.setdefault(tensor, []).append(node_id)
+            for tensor in node.input:
+                consumers = self.consumers.setdefault(tensor, [])
+                if not consumers or consumers[-1] != node_id:
+                    consumers.append(node_id)
+
+        self.compilable = [is_compilable(node) for node in self.nodes]
+        node_ids = {node.name: node_id for node_id, node in enumerate(self.nodes)}
+        self.row_tiles = {
+            node_ids[name]: tile for name, tile in row_tiles(nx_model).items()
+            if name in node_ids
+        }
+        self.channel_groups = {
+            node_ids[name]: group for name, group in channel_groups(nx_model).items()
+            if name in node_ids
+        }
+        bands = row_bands(nx_model)
+        self.row_bands = {node_ids[name]: band for name, band in bands.items() if name in node_ids}
+        for node_id, tile in {**self.row_tiles, **self.channel_groups}.items():
+            if tile['node'] in bands:
+                self.row_bands[node_id] = bands[tile['node']]
+        self.merges = self._find_merges()
+        self.merged_into = {tile: concat for concat, tiles in self.merges.items() for tile in tiles}
+        self.run_groups = self._find_run_groups()
+        self.order = self._topological_order()
+        self.position = {node_id: pos for pos, node_id in enumerate(self.order)}
+
+    def _find_merges(self):
+        '''
+        Concats whose inputs are all written by compilable nodes that read
+        the same ifmap, and are read by nothing else. QRAcc writes those
+        tiles into one ofmap, so the Concat needs no external memory.
+        Not for row tiles that load their ifmap from external memory, as
+        the load would overwrite the ofmap in ACTMEM.
+        '''
+        merges = {}
+        for node_id, node in enumerate(self.nodes):
+            if node.op_type != 'Concat' or len(node.input) < 2:
+                continue
+            tiles = [self.producers.get(tensor, [None])[0] for tensor in node.input]
+            if any(tile is None or not self.compilable[tile] or self.needs_host_ifmap(tile) for tile in tiles):
+                continue
+            if len(set(tiles)) != len(tiles):
+                continue
+            if len({self.nodes[tile].input[0] for tile in tiles}) != 1:
+                continue
+            if any(self.consumers.get(tensor) != [node_id] or tensor in self.graph_outputs for tensor in node.input):
+                continue
+            merges[node_id] = tiles
+        return merges
+
+    def _find_run_groups(self):
+        '''
+        Row tiles and channel groups of a node run in tile order. Merged
+        tiles run in graph order, each with its own row tiles.
+        '''
+        split_tiles = {**self.row_tiles, **self.channel_groups}
+        node_groups = {}
+        for node_id, tile in split_tiles.items():
+            node_groups.setdefault(tile['node'], []).append(node_id)
+        groups = {}
+        for members in node_groups.values():
+            members.sort(key=lambda node_id: split_tiles[node_id]['tile'])
+            for node_id in members:
+                groups[node_id] = members
+        for tiles in self.merges.values():
+            members = sorted(member for tile in tiles for member in groups.get(tile, [tile]))
+            for node_id in members:
+                groups[node_id] = members
+        return groups
+
+    def _topological_order(self):
+        '''
+        Kahn's algorithm. Ties go to the lowest node id, so an
+        already sorted graph keeps its original order.
+        '''
+        indegree = [0] * len(self.nodes)
+        for node_id, node in enumerate(self.nodes):
+            for tensor in set(node.input):
+                indegree[node_id] += len(self.producers.get(tensor, []))
+
+        ready = [node_id for node_id, deg in enumerate(indegree) if deg == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            node_id = heapq.heappop(ready)
+            order.append(node_id)
+            for tensor in self.nodes[node_id].output:
+                for consumer in self.consumers.get(tensor, []):
+                    indegree[consumer] -= 1
+                    if indegree[consumer] == 0:
+                        heapq.heappush(ready, consumer)
+
+        if len(order) != len(self.nodes):
+            raise ValueError('ONNX graph has a cycle, cannot order nodes.')
+        return order
+
+    def with_order(self, order):
+        '''
+        Copy of the index that executes the nodes in the given order.
+        The order must contain every node and respect the dependencies.
+        '''
+        if sorted(order) != list(range(len(self.nodes))):
+            raise ValueError('Order must contain every node exactly once.')
+        position = {node_id: pos for pos, node_id in enumerate(order)}
+        for node_id, node in enumerate(self.nodes):
+            for tensor in node.input:
+                for producer in self.producers_of(tensor):
+                    if position[producer] > position[node_id]:
+                        raise ValueError(f'{node.name} is scheduled before its producer {self.nodes[producer].name}.')
+        for node_id, group in self.run_groups.items():
+            if [position[member] for member in group] != list(range(position[group[0]], position[group[0]] + len(group))):
+                raise ValueError(f'Tiles of {self.nodes[node_id].name} must run back to back and in order.')
+
+        reordered = copy.copy(self)
+        reordered.order = list(order)
+        reordered.position = position
+        return reordered
+
+    def node(self, node_id):
+        return self.nodes[node_id] if node_id is not None else None
+
+    def is_compilable(self, node_id):
+        return node_id is not None and self.compilable[node_id]
+
+    def consumers_of(self, tensor):
+        return self.consumers.get(tensor, [])
+
+    def producers_of(self, tensor):
+        return self.producers.get(tensor, [])
+
+    def merged_output(self, node_id):
+        '''
+        Tensor the node writes into ACTMEM: the merged output for a tile, else its first output.
+        '''
+        node_id = self.merged_into.get(node_id, node_id)
+        return self.nodes[node_id].output[0]
+
+    def merge_tiles(self, node_id):
+        '''
+        Tiles merged with the node in channel order, None if it is not a tile.
+        '''
+        concat = self.merged_into.get(node_id)
+        return None if concat is None else self.merges[concat]
+
+    def is_last_tile(self, node_id):
+        '''
+        True if no tile merged with the node runs after it. True for untiled nodes.
+        '''
+        tiles = self.merge_tiles(node_id)
+        if tiles is None:
+            return True
+        return self.position[node_id] == max(self.position[tile] for tile in tiles)
+
+    def run_group(self, node_id):
+        '''
+        Node ids that run back to back with the node, None if it runs alone.
+        '''
+        return self.run_groups.get(node_id)
+
+    def ifmap_view(self, node_id):
+        '''
+        (input tensor, band rows, channels) of the ifmap the node needs in
+        ACTMEM. Band rows are set for row bands, channels for row tiles that
+        load a channel slice, both are None for whole ifmaps.
+        '''
+        band = self.row_bands.get(node_id)
+        tile = self.row_tiles.get(node_id)
+        return (
+            self.nodes[node_id].input[0],
+            tuple(band['rows']) if band is not None else None,
+            tuple(tile['channels'][:2]) if tile is not None and not tile['in_place'] else None,
+        )
+
+    def needs_host_ifmap(self, node_id):
+        '''
+        True for row bands and for row tiles that load a channel slice,
+        their ifmap comes from external memory instead of another node's
+        ofmap in ACTMEM.
+        '''
+        _, rows, channels = self.ifmap_view(node_id)
+        return rows is not None or channels is not None
+
+    def has_noncompilable_consumer(self, node_id):
+        '''
+        True if any output of the node is read by a node QRAcc cannot run,
+        by a node that loads part of it from external memory, or is an
+        output of the graph. Either way it has to go to external memory.
+        Tiles look at the output they are merged into.
+        '''
+        node_id = self.merged_into.get(node_id, node_id)
+        for tensor in self.nodes[node_id].output:
+            if tensor in self.graph_outputs:
+                return True
+            for consumer in self.consumers_of(tensor):
+                if not self.compilable[consumer] or self.needs_host_ifmap(consumer):
+                    return True
+        return False
+
+    def next_node(self, node_id):
+        '''
+        Node id executed right after node_id, None for the last node.
+        '''
+        pos = self.position[node_id] + 1
+        return self.order[pos] if pos < len(self.order) else None
+
+    def shares_input_with_next(self, node_id):
+        '''
+        True if the next executed node is compilable and reads the same
+        ifmap (same band and channels), so the ifmap can stay in ACTMEM.
+        '''
+        next_id = self.next_node(node_id)
+        if not self.is_compilable(next_id):
+            return False
+        return self.ifmap_view(next_id) == self.ifmap_view(node_id)
@@ -0,0 +1,31 @@
+import rectpack
+from hwacctools.comp_graph import packer_utils as pu
+from .sequential_packer import SequentialWriteCostPacker
+
+def make_packers(imc_core_size = (256, 256)):
+    '''
+    Fresh instances of the packers compared in the RTL runs, as (name, packer).
+    rectpack packers keep their rectangles, so use new ones for every model.
+    '''
+    return [
+        ("Dense",rectpack.newPacker(
+            mode=rectpack.PackingMode.Offline,
+            # bin_algo=rectpack.PackingBin.BBF, 
+            rotation=False, 
+            pack_algo=rectpack.MaxRectsBssf
+        )),
+        ("Naive",pu.NaiveRectpackPacker(imc_core_size[0],imc_core_size[1], rotation=False)),
+        ("Tradeoff",rectpack.newPacker(
+            mode=rectpack.PackingMode.Online,
+            bin_algo=rectpack.PackingBin.BBF, 
+            rotation=False, 
+            pack_algo=rectpack.MaxRectsBssf
+        )),
+        ("Write Optimized",rectpack.newPacker(
+            mode=rectpack.PackingMode.Online,
+            bin_algo=rectpack.PackingBin.BNF, 
+            rotation=False, 
+            pack_algo=rectpack.MaxRectsBssf
+        )),
+        ("Sequential",SequentialWriteCostPacker()),
+    ]
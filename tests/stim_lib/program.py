@@ -0,0 +1,139 @@
+import os
+import json
+import numpy as np
+from .stimulus_gen import pack_ifmap_to_ints
+from .compile import iter_compile_nx_graph, format_array_asm, commands_to_bin
+from .tiling import parse_ifmap_view_label, apply_ifmap_view
+import onnx
+
+class QrAccProgram(object):
+    '''
+    Relocatable compiled graph.
+
+    A list of segments in stream order. Code segments hold the config,
+    weight, scaler, trigger and INFO commands as text. Ifmap segments are
+    placeholders for the ifmap blocks loaded from external memory, keyed by
+    (tensor name, image), and keep the compiled data as their default.
+    Row tiles that load a channel slice and row bands have placeholders
+    labelled by tiling.ifmap_view_label, linked from the tensor itself.
+
+    link() splices packed tensors into the placeholders and returns a
+    runnable stream, so new inputs do not need a recompile.
+    '''
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    @classmethod
+    def from_commands(cls, commands):
+        '''
+        Splits a stream compiled with ifmap_placeholders at its IFMAP/ENDIFMAP blocks.
+        '''
+        segments = []
+        code = []
+        lines = iter(commands)
+        for line in lines:
+            if not line.startswith('IFMAP '):
+                code.append(line)
+                continue
+            name, image, shape = line[len('IFMAP '):].rsplit(' ', 2)
+            block = []
+            for block_line in lines:
+                if block_line == 'ENDIFMAP':
+                    break
+                block.append(block_line)
+            segments.append({'code': '\n'.join(code)})
+            segments.append({
+                'ifmap'  : name,
+                'image'  : int(image),
+                'shape'  : [int(dim) for dim in shape.split('x')],
+                'burst'  : bool(block) and block[0].startswith('LOADBURST'),
+                'default': '\n'.join(block),
+            })
+            code = []
+        segments.append({'code': '\n'.join(code)})
+        return cls([segment for segment in segments if segment.get('code', True)])
+
+    def placeholders(self):
+        '''
+        (tensor name, image, shape) of every ifmap placeholder, in stream order.
+        '''
+        return [
+            (segment['ifmap'], segment['image'], tuple(segment['shape']))
+            for segment in self.segments if 'ifmap' in segment
+        ]
+
+    def _ifmap_block(self, segment, tensors):
+        name, channels, band = parse_ifmap_view_label(segment['ifmap'])
+        tensor = tensors.get(name)
+        if tensor is None:
+            return segment['default']
+        tensor = np.asarray(tensor)
+        if tensor.ndim == len(segment['shape']) and tensor.shape[0] > 1:
+            tensor = tensor[segment['image']:segment['image'] + 1]  # One image of a batch
+        elif segment['image'] > 0:
+            raise ValueError(f"No image {segment['image']} in tensor {name} of shape {tensor.shape}.")
+        if channels is not None or band is not None:
+            tensor = apply_ifmap_view(tensor, channels, band)
+        if tensor.size != np.prod(segment['shape']):
+            raise ValueError(f"Tensor {segment['ifmap']} of shape {tensor.shape} does not fit placeholder of shape {segment['shape']}.")
+        ifmap_hwc = tensor.reshape(segment['shape']).transpose(0, 2, 3, 1)
+        return format_array_asm(pack_ifmap_to_ints(ifmap_hwc), burst=segment['burst']).rstrip('\n')
+
+    def link_text(self, tensors = None):
+        '''
+        Stream as one string. tensors maps tensor names to uint8 NCHW arrays,
+        with the images of a batch along N. Placeholders of tensors not
+        given keep their compiled data.
+        '''
+        tensors = {} if tensors is None else tensors
+        blocks = [
+            segment['code'] if 'code' in segment else self._ifmap_block(segment, tensors)
+            for segment in self.segments
+        ]
+        return '\n'.join(block for block in blocks if block) + '\n'
+
+    def link(self, tensors = None):
+        return self.link_text(tensors).splitlines()
+
+    def link_to_file(self, savepath, tensors = None, command_format = 'txt'):
+        '''
+        Same files as write_commands_file. Returns the path of the written file.
+        '''
+        if command_format == 'txt':
+            path = os.path.join(savepath, 'commands.txt')
+            with open(path, 'w') as f:
+                f.write(self.link_text(tensors))
+        elif command_format == 'bin':
+            path = os.path.join(savepath, 'commands.bin')
+            with open(path, 'wb') as f:
+                f.write(commands_to_bin(self.link(tensors)))
+        else:
+            raise ValueError(f'Unknown command format: {command_format}')
+        return path
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'segments': self.segments}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls(json.load(f)['segments'])
+
+    def __repr__(self):
+        return f"QrAccProgram(segments={len(self.segments)}, placeholders={self.placeholders()})"
+
+def compile_nx_graph_to_program(
+    nx_model   : onnx.ModelProto,
+    input_dict : dict,
+    **kwargs
+):
+    '''
+    Compiles the graph once into a QrAccProgram.
+    kwargs go to iter_compile_nx_graph.
+    '''
+    commands = []
+    for chunk in iter_compile_nx_graph(nx_model, input_dict, ifmap_placeholders=True, **kwargs):
+        commands += chunk
+    return QrAccProgram.from_commands(commands)
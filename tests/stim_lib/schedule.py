@@ -0,0 +1,188 @@
+import numpy as np
+from hwacctools.comp_graph import core
+from .graph_index import NxGraphIndex
+
+def weight_write_words(imc_core_size = (256, 256), num_cols_per_bank = 32):
+    '''
+    Words written to rewrite one analog bin (TRIGGER_LOADWEIGHTS)
+    '''
+    return imc_core_size[0] * (imc_core_size[1] // num_cols_per_bank)
+
+# 32 PEs x 9 weights, 4 per word (numWsAccWrites in qracc_controller)
+DIGITAL_WEIGHT_WRITE_WORDS = 72
+
+def ifmap_write_words(tensor_store, tensor_name, elements_per_word = 4):
+    '''
+    Words written to load a tensor into ACTMEM. Counts one word per load
+    if no tensor store is given, so costs become plain reload counts.
+    '''
+    if tensor_store is None:
+        return 1
+    return -(-int(np.prod(tensor_store.shape(tensor_name))) // elements_per_word)
+
+def schedule_cost(
+    graph_index  : NxGraphIndex,
+    u_nx_mapping : core.NxModelMapping,
+    order        : list,
+    tensor_store = None,
+    imc_core_size: tuple = (256, 256)
+):
+    '''
+    Bin rewrites and ifmap loads that plan_nx_graph would emit for the
+    given execution order. Mirrors its decisions without printing.
+    '''
+    cost = {
+        'weight_rewrites': 0,
+        'weight_words': 0,
+        'digital_weight_words': 0,
+        'ifmap_loads': 0,
+        'ifmap_words': 0,
+        'preserved_ifmaps': 0,
+    }
+    prev_bin_id = None
+    loaded_view = None  # ifmap_view of what ACTMEM holds
+    for pos, node_id in enumerate(order):
+        if not graph_index.is_compilable(node_id):
+            continue
+        mapped_node = u_nx_mapping.get_mapped_node_by_id(node_id)
+        input_name = mapped_node.get_true_inputs()[0]
+
+        if mapped_node.bin_id != prev_bin_id:
+            if mapped_node.depthwise:
+                cost['digital_weight_words'] += DIGITAL_WEIGHT_WRITE_WORDS
+            else:
+                cost['weight_rewrites'] += 1
+                cost['weight_words'] += weight_write_words(imc_core_size)
+        view = graph_index.ifmap_view(node_id)
+        if view != loaded_view:
+            cost['ifmap_loads'] += 1
+            cost['ifmap_words'] += ifmap_write_words(tensor_store, input_name)
+
+        next_id = order[pos + 1] if pos + 1 < len(order) else None
+        preserve_ifmap = (
+            graph_index.is_compilable(next_id) and
+            graph_index.ifmap_view(next_id) == graph_index.ifmap_view(node_id)
+        )
+        cost['preserved_ifmaps'] += int(preserve_ifmap)
+
+        if not mapped_node.depthwise:
+            prev_bin_id = mapped_node.bin_id
+        loaded_view = view if preserve_ifmap else (graph_index.merged_output(node_id), None, None)
+    return cost
+
+def _total_words(cost):
+    return cost['weight_words'] + cost['digital_weight_words'] + cost['ifmap_words']
+
+def schedule_nx_graph(
+    graph_index  : NxGraphIndex,
+    u_nx_mapping : core.NxModelMapping,
+    tensor_store = None,
+    imc_core_size: tuple = (256, 256)
+):
+    '''
+    Bin-reuse-aware list scheduler.
+
+    Among the ready nodes, picks the compilable node that adds the fewest
+    written words given what is in the core: a bin rewrite costs a full
+    bin, an ifmap that is neither the previous ifmap (kept with
+    preserve_ifmap) nor the previous ofmap costs the ifmap size.
+    Ties go to the ONNX order. Non-compilable nodes are deferred until
+    no compilable node is ready, so they do not split preserve chains.
+    Output-channel and row tiles run back to back, in order, once the
+    first one is picked.
+
+    Returns the greedy order, or the ONNX order if that one is cheaper.
+    '''
+    nodes = graph_index.nodes
+    indegree = [0] * len(nodes)
+    for node_id, node in enumerate(nodes):
+        for tensor in set(node.input):
+            indegree[node_id] += len(graph_index.producers_of(tensor))
+    ready = {node_id for node_id, deg in enumerate(indegree) if deg == 0}
+
+    rewrite_words = weight_write_words(imc_core_size)
+    order = []
+    prev_id = None          # Last compilable node
+    interrupted = False     # A non-compilable node ran after prev_id
+    prev_bin_id = None
+    pending_tiles = []      # Tiles of the run group of prev_id that did not run yet
+
+    def added_words(node_id):
+        mapped_node = u_nx_mapping.get_mapped_node_by_id(node_id)
+        input_name = mapped_node.get_true_inputs()[0]
+        words = 0
+        if not mapped_node.depthwise and mapped_node.bin_id != prev_bin_id:
+            words += rewrite_words
+        if prev_id is None:
+            reuses_ifmap = False
+        else:
+            shares_input = not interrupted and graph_index.ifmap_view(node_id) == graph_index.ifmap_view(prev_id)
+            reads_prev_ofmap = not graph_index.needs_host_ifmap(node_id) and input_name == graph_index.merged_output(prev_id)
+            reuses_ifmap = shares_input or reads_prev_ofmap
+        if not reuses_ifmap:
+            words += ifmap_write_words(tensor_store, input_name)
+        return words
+
+    while ready:
+        compilable_ready = [node_id for node_id in ready if graph_index.is_compilable(node_id)]
+        if pending_tiles:
+            compilable_ready = [node_id for node_id in compilable_ready if node_id == pending_tiles[0]]
+        else:
+            # Groups start at their first tile
+            compilable_ready = [
+                node_id for node_id in compilable_ready
+                if graph_index.run_group(node_id) is None or graph_index.run_group(node_id)[0] == node_id
+            ]
+        if compilable_ready:
+            pick = min(compilable_ready, key=lambda node_id: (added_words(node_id), graph_index.position[node_id]))
+            mapped_node = u_nx_mapping.get_mapped_node_by_id(pick)
+            if not mapped_node.depthwise:
+                prev_bin_id = mapped_node.bin_id
+            prev_id = pick
+            interrupted = False
+            if not pending_tiles:
+                pending_tiles = list(graph_index.run_group(pick) or [pick])
+            pending_tiles.remove(pick)
+        else:
+            deferred = [node_id for node_id in ready if not graph_index.is_compilable(node_id)] or list(ready)
+            pick = min(deferred, key=lambda node_id: graph_index.position[node_id])
+            interrupted = prev_id is not None
+
+        ready.remove(pick)
+        order.append(pick)
+        for tensor in nodes[pick].output:
+            for consumer in graph_index.consumers_of(tensor):
+                indegree[consumer] -= 1
+                if indegree[consumer] == 0:
+                    ready.add(consumer)
+
+    greedy = _total_words(schedule_cost(graph_index, u_nx_mapping, order, tensor_store, imc_core_size))
+    naive = _total_words(schedule_cost(graph_index, u_nx_mapping, graph_index.order, tensor_store, imc_core_size))
+    return order if greedy < naive else list(graph_index.order)
+
+def schedule_report(
+    graph_index  : NxGraphIndex,
+    u_nx_mapping : core.NxModelMapping,
+    tensor_store = None,
+    imc_core_size: tuple = (256, 256),
+    name = ''
+):
+    '''
+    Costs of the ONNX order, of the scheduled order and what the schedule saves.
+    '''
+    order = schedule_nx_graph(graph_index, u_nx_mapping, tensor_store, imc_core_size)
+    naive = schedule_cost(graph_index, u_nx_mapping, graph_index.order, tensor_store, imc_core_size)
+    scheduled = schedule_cost(graph_index, u_nx_mapping, order, tensor_store, imc_core_size)
+    saved = {key: naive[key] - scheduled[key] for key in naive}
+
+    print(f'============ Schedule report {name} ============')
+    print(f'{"":24s} {"naive":>10s} {"scheduled":>10s} {"saved":>10s}')
+    for key in naive:
+        print(f'{key:24s} {naive[key]:10d} {scheduled[key]:10d} {saved[key]:10d}')
+
+    return {
+        'order': order,
+        'naive': naive,
+        'scheduled': scheduled,
+        'saved': saved,
+    }
@@ -0,0 +1,196 @@
+class PackedRect(object):
+    '''
+    Placed rectangle, same fields as rectpack's Rectangle.
+    '''
+
+    def __init__(self, x, y, width, height, rid):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.rid = rid
+
+    def __repr__(self):
+        return f"PackedRect(x={self.x}, y={self.y}, width={self.width}, height={self.height}, rid={self.rid})"
+
+class PackedBin(object):
+    '''
+    Bin of a SequentialWriteCostPacker, iterates over its PackedRects like a rectpack bin.
+    '''
+
+    def __init__(self, width, height, rects):
+        self.width = width
+        self.height = height
+        self.rects = rects
+
+    def __iter__(self):
+        return iter(self.rects)
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __getitem__(self, key):
+        return self.rects[key]
+
+def _skyline_place(rects, bin_width, bin_height):
+    '''
+    Bottom-left skyline packing of (width, height, rid) in the given order.
+    Returns a list of PackedRect, or None if a rectangle does not fit.
+    '''
+    skyline = [[0, 0, bin_width]]  # Segments of [x, y, width], left to right
+    placed = []
+    for width, height, rid in rects:
+        best = None
+        for i, (x, _, _) in enumerate(skyline):
+            if x + width > bin_width:
+                break
+            # Height of the skyline under [x, x + width)
+            y = 0
+            covered = 0
+            j = i
+            while covered < width:
+                y = max(y, skyline[j][1])
+                covered += skyline[j][2] if j > i else skyline[j][0] + skyline[j][2] - x
+                j += 1
+            if y + height <= bin_height and (best is None or (y, x) < (best[1], best[0])):
+                best = (x, y)
+        if best is None:
+            return None
+
+        x, y = best
+        placed.append(PackedRect(x, y, width, height, rid))
+
+        # Raise the skyline under the new rectangle
+        new_skyline = []
+        for sx, sy, sw in skyline:
+            if sx + sw <= x or sx >= x + width:
+                new_skyline.append([sx, sy, sw])
+                continue
+            if sx < x:
+                new_skyline.append([sx, sy, x - sx])
+            if sx + sw > x + width:
+                new_skyline.append([x + width, sy, sx + sw - x - width])
+        new_skyline.append([x, y + height, width])
+        new_skyline.sort()
+        skyline = []
+        for segment in new_skyline:
+            if skyline and skyline[-1][1] == segment[1]:
+                skyline[-1][2] += segment[2]
+            else:
+                skyline.append(segment)
+    return placed
+
+# Orderings tried when (re)packing the rectangles of one bin
+_PACK_ORDERS = [
+    lambda rects: rects,
+    lambda rects: sorted(rects, key=lambda r: -r[1]),
+    lambda rects: sorted(rects, key=lambda r: -r[0]),
+    lambda rects: sorted(rects, key=lambda r: -r[0] * r[1]),
+]
+
+def pack_bin(rects, bin_width, bin_height):
+    '''
+    Tries every ordering of _PACK_ORDERS, returns the first placement that fits or None.
+    '''
+    for order in _PACK_ORDERS:
+        placed = _skyline_place(order(rects), bin_width, bin_height)
+        if placed is not None:
+            return placed
+    return None
+
+class SequentialWriteCostPacker(object):
+    '''
+    Packer that minimises weight rewrites along the execution order.
+
+    Rectangles are taken in execution order (the order of add_rect, or
+    sequence if given) and packed next-fit: a layer goes into the bin of
+    the previous layer if the bin can be repacked with it by any of the
+    skyline orderings, otherwise it opens a new bin. Each bin then holds
+    a run of consecutive layers, so every bin is written once.
+
+    Drop-in for the rectpack packers given to core.NxModelMapping:
+    add_rect, add_bin, pack, rect_list, bin_list, len() and indexing.
+    Rectangles that do not fit in an empty bin are left out, like rectpack.
+    '''
+
+    def __init__(self, sequence = None, rotation = False):
+        if rotation:
+            raise ValueError('SequentialWriteCostPacker does not rotate rectangles.')
+        self.sequence = sequence
+        self._rects = []
+        self._bins = []  # (width, height, count)
+        self._packed = None
+
+    def add_rect(self, width, height, rid = None):
+        self._rects.append((width, height, rid))
+        self._packed = None
+
+    def add_bin(self, width, height, count = 1, **kwargs):
+        self._bins.append((width, height, count))
+        self._packed = None
+
+    def _bin_sizes(self):
+        for width, height, count in self._bins:
+            opened = 0
+            while opened < count:
+                yield width, height
+                opened += 1
+
+    def pack(self):
+        rects = self._rects
+        if self.sequence is not None:
+            position = {rid: pos for pos, rid in enumerate(self.sequence)}
+            rects = sorted(rects, key=lambda r: position.get(r[2], len(position)))
+
+        packed = []
+        bin_sizes = self._bin_sizes()
+        current = None
+        members = []
+        for rect in rects:
+            if current is not None:
+                placed = pack_bin(members + [rect], current[0], current[1])
+                if placed is not None:
+                    members.append(rect)
+                    packed[-1].rects = placed
+                    continue
+            # Open the next bin, skipping rects that fit in no bin
+            size = next(bin_sizes, None)
+            if size is None:
+                break
+            placed = pack_bin([rect], size[0], size[1])
+            if placed is None:
+                # Too large for an empty bin, give the bin back
+                bin_sizes = _prepend(size, bin_sizes)
+                continue
+            current = size
+            members = [rect]
+            packed.append(PackedBin(size[0], size[1], placed))
+        self._packed = packed
+
+    def _bins_packed(self):
+        if self._packed is None:
+            self.pack()
+        return self._packed
+
+    def rect_list(self):
+        return [
+            (b, rect.x, rect.y, rect.width, rect.height, rect.rid)
+            for b, packed_bin in enumerate(self._bins_packed())
+            for rect in packed_bin
+        ]
+
+    def bin_list(self):
+        return [(packed_bin.width, packed_bin.height) for packed_bin in self._bins_packed()]
+
+    def __iter__(self):
+        return iter(self._bins_packed())
+
+    def __len__(self):
+        return len(self._bins_packed())
+
+    def __getitem__(self, key):
+        return self._bins_packed()[key]
+
+def _prepend(item, iterator):
+    yield item
+    yield from iterator
@@ -17,6 +17,30 @@ def _hex3(n,hexits=8):
 hex_but_no_0x = np.vectorize(_hex3)
 vhex3 = np.vectorize(_hex3)
 
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+def hex_digits(write_array, hexits=8):
+    '''
+    Bulk version of _hex3. Returns an (n, hexits) array of ASCII hex digits,
+    one row per element of write_array.
+    '''
+    words = np.asarray(write_array).reshape(-1).astype(np.int64) & 0xffffffff
+    shifts = 4 * np.arange(hexits - 1, -1, -1)
+    return _HEX_DIGITS[(words[:, None] >> shifts) & 0xF]
+
+def format_hex_lines(write_array, prefix='', hexits=8):
+    '''
+    Formats every element of write_array as a line '<prefix><hex>\\n' in one pass.
+    Returns the whole block as a string.
+    '''
+    digits = hex_digits(write_array, hexits)
+    prefix_bytes = np.frombuffer(prefix.encode('ascii'), dtype=np.uint8)
+    block = np.empty((digits.shape[0], len(prefix_bytes) + hexits + 1), dtype=np.uint8)
+    block[:, :len(prefix_bytes)] = prefix_bytes
+    block[:, len(prefix_bytes):-1] = digits
+    block[:, -1] = ord('\n')
+    return block.tobytes().decode('ascii')
+
 def kernel_to_writes(kernel, channels, hexes=True):
     '''
     Packs every 4 elements of the kernel channel dimension (in HWC) into a single 32-bit integer
@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+import onnxruntime as ort
+
+class IntermediateTensorStore(object):
+    '''
+    Runs an ONNX model once with every intermediate tensor exposed as an
+    output, and keeps the shapes and values of all of them.
+
+    Replaces per-node calls to onnx_utils.get_intermediate_tensor_value,
+    which re-run the model up to the requested tensor each time.
+
+    If cache_dir is given, values are saved there as .npy files and
+    reopened memory-mapped, so large models do not have to stay in RAM.
+    '''
+
+    def __init__(self, nx_model : onnx.ModelProto, input_dict : dict, cache_dir : str = None):
+        self.nx_model = nx_model
+        self.cache_dir = cache_dir
+        self.initializers = {init.name: init for init in nx_model.graph.initializer}
+        self.shapes = {}
+        self._values = {}
+        self._npy_paths = {}
+        self._node_sessions = {}
+
+        for name, value in input_dict.items():
+            self._store(name, np.asarray(value))
+        for name, value in self._run_all(input_dict).items():
+            self._store(name, value)
+
+    def _run_all(self, input_dict):
+        exposed = onnx.ModelProto()
+        exposed.CopyFrom(self.nx_model)
+        graph_outputs = {output.name for output in exposed.graph.output}
+        for node in exposed.graph.node:
+            for output in node.output:
+                if output and output not in graph_outputs:
+                    exposed.graph.output.extend([onnx.ValueInfoProto(name=output)])
+                    graph_outputs.add(output)
+
+        session = ort.InferenceSession(exposed.SerializeToString())
+        output_names = [output.name for output in session.get_outputs()]
+        values = session.run(output_names, input_dict)
+        return dict(zip(output_names, values))
+
+    def _store(self, name, value):
+        self.shapes[name] = value.shape
+        if self.cache_dir is None:
+            self._values[name] = value
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._npy_path(name)
+        np.save(path, value)
+        self._values[name] = np.load(path, mmap_mode='r')
+
+    def add(self, name, value):
+        '''
+        Stores a tensor the model itself does not compute, like the
+        output of one row band of a split node.
+        '''
+        self._store(name, np.asarray(value))
+
+    def overlay(self):
+        '''
+        View of the store that keeps its own added tensors, see TensorStoreOverlay.
+        '''
+        return TensorStoreOverlay(self)
+
+    def _npy_path(self, name):
+        '''
+        Tensor names can sanitize to the same file name, so files are
+        numbered in store order and looked up by the exact name.
+        '''
+        if name not in self._npy_paths:
+            safe_name = ''.join(c if c.isalnum() or c in '_-.' else '_' for c in name)
+            self._npy_paths[name] = os.path.join(self.cache_dir, f'{len(self._npy_paths):05d}_{safe_name}.npy')
+        return self._npy_paths[name]
+
+    def __contains__(self, name):
+        return name in self.shapes
+
+    def shape(self, name):
+        return self.shapes[name]
+
+    def value(self, name):
+        if name in self.initializers:
+            return numpy_helper.to_array(self.initializers[name])
+        return self._values[name]
+
+    def infer_node(self, nx_node : onnx.NodeProto, input_dict : dict):
+        '''
+        Runs a single node with the given (non-initializer) inputs.
+        Other inputs of the node come from the initializers or from the
+        stored intermediate values. Returns the first output.
+        '''
+        key = (nx_node.name, tuple((name, np.shape(value)) for name, value in input_dict.items()))
+        if key not in self._node_sessions:
+            self._node_sessions[key] = self._make_node_session(nx_node, input_dict)
+        session = self._node_sessions[key]
+        return session.run([nx_node.output[0]], input_dict)[0]
+
+    def _make_node_session(self, nx_node, input_dict):
+        graph_inputs = []
+        initializers = []
+        for name in nx_node.input:
+            if not name:
+                continue
+            if name in input_dict:
+                value = np.asarray(input_dict[name])
+                elem_type = helper.np_dtype_to_tensor_dtype(value.dtype)
+                graph_inputs.append(helper.make_tensor_value_info(name, elem_type, value.shape))
+            elif name in self.initializers:
+                initializers.append(self.initializers[name])
+            else:
+                initializers.append(numpy_helper.from_array(np.asarray(self.value(name)), name=name))
+
+        graph = helper.make_graph(
+            nodes       = [nx_node],
+            name        = f'{nx_node.name}_single',
+            inputs      = graph_inputs,
+            outputs     = [onnx.ValueInfoProto(name=output) for output in nx_node.output],
+            initializer = initializers,
+        )
+        single_node_model = helper.make_model(graph, opset_imports=self.nx_model.opset_import)
+        single_node_model.ir_version = self.nx_model.ir_version
+        return ort.InferenceSession(single_node_model.SerializeToString())
+
+class TensorStoreOverlay(object):
+    '''
+    Tensors added on top of a store without changing it. Lookups fall
+    through to the store for everything the overlay does not hold, so a
+    compile can add the outputs of its row bands to a store the caller
+    reuses.
+    '''
+
+    def __init__(self, base):
+        self.base = base
+        self._values = {}
+
+    def add(self, name, value):
+        self._values[name] = np.asarray(value)
+
+    def overlay(self):
+        return TensorStoreOverlay(self)
+
+    def __contains__(self, name):
+        return name in self._values or name in self.base
+
+    def shape(self, name):
+        if name in self._values:
+            return self._values[name].shape
+        return self.base.shape(name)
+
+    def value(self, name):
+        if name in self._values:
+            return self._values[name]
+        return self.base.value(name)
+
+    def infer_node(self, nx_node : onnx.NodeProto, input_dict : dict):
+        return self.base.infer_node(nx_node, input_dict)
@@ -0,0 +1,570 @@
+import json
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+# Output pixels the psum_buffer holds partial sums for (qrAccPsumDepth)
+PSUM_DEPTH = 256
+
+# ACTMEM bytes (sram_32bank_8b, 18-bit address)
+ACTMEM_BYTES = 2**18
+
+# Model metadata keys of the row tiles made by split_deep_nodes, the
+# channel groups made by split_depthwise_nodes and the row bands made by
+# split_row_bands
+ROW_TILES_KEY = 'qracc_row_tiles'
+CHANNEL_GROUPS_KEY = 'qracc_channel_groups'
+ROW_BANDS_KEY = 'qracc_row_bands'
+
+# Output channel axis of the weight, per-channel quantization params and bias
+# inputs of each op, and the channel axis of its output
+_TILED_INPUTS = {
+    'QLinearConv'  : {'weight': (3, 0), 'per_channel': [4, 5], 'bias': 8, 'output_axis': 1},
+    'QLinearMatMul': {'weight': (3, 1), 'per_channel': [4, 5], 'bias': None, 'output_axis': -1},
+}
+
+def output_channel_tiles(num_channels, max_output_channels = 256):
+    '''
+    [start, stop) channels of each tile, every tile but the last is max_output_channels wide.
+    '''
+    return [
+        (start, min(start + max_output_channels, num_channels))
+        for start in range(0, num_channels, max_output_channels)
+    ]
+
+def _num_output_channels(nx_node, initializers):
+    spec = _TILED_INPUTS.get(nx_node.op_type)
+    if spec is None or nx_node.input[spec['weight'][0]] not in initializers:
+        return None
+    if nx_node.op_type == 'QLinearConv':
+        group = next((attr.i for attr in nx_node.attribute if attr.name == 'group'), 1)
+        if group != 1:
+            return None  # Depthwise nodes go to the digital core
+    weight = initializers[nx_node.input[spec['weight'][0]]]
+    return weight.dims[spec['weight'][1]]
+
+def _slice_initializer(initializers, new_initializers, name, axis, start, stop, suffix):
+    '''
+    Name of the [start, stop) slice along axis of an initializer, added to new_initializers.
+    Scalars (per-tensor params) are shared by every tile.
+    '''
+    value = numpy_helper.to_array(initializers[name])
+    if value.ndim == 0 or value.shape[axis] == 1:
+        return name
+    sliced_name = f'{name}_{suffix}'
+    sliced = np.take(value, np.arange(start, stop), axis=axis)
+    new_initializers.append(numpy_helper.from_array(sliced, sliced_name))
+    return sliced_name
+
+def split_wide_nodes(
+    nx_model : onnx.ModelProto,
+    max_output_channels : int = 256
+):
+    '''
+    Output-channel tiling for layers wider than the IMC core.
+
+    Every QLinearConv or QLinearMatMul with more than max_output_channels
+    output channels is replaced by tile nodes {name}_tile<t> that compute
+    channels [t*max_output_channels, (t+1)*max_output_channels) into
+    {output}_tile<t>, and a Concat {name}_concat that merges the tiles
+    back into the original output.
+
+    The tiles share the ifmap, so NxGraphIndex treats the Concat as a merge:
+    the tiles run back to back with preserve_ifmap and write their
+    channels straight into one ofmap in ACTMEM (CSR_REG_OFMAP_LAYOUT).
+    The narrow last tile is put first, so the bank tail it spills past its
+    channels is overwritten by the full tiles after it.
+
+    Returns nx_model itself if no node is too wide, otherwise a copy.
+    '''
+    initializers = {init.name: init for init in nx_model.graph.initializer}
+    wide = [
+        node for node in nx_model.graph.node
+        if (_num_output_channels(node, initializers) or 0) > max_output_channels
+    ]
+    if not wide:
+        return nx_model
+
+    tiled_model = onnx.ModelProto()
+    tiled_model.CopyFrom(nx_model)
+    graph = tiled_model.graph
+
+    nodes = []
+    new_initializers = []
+    for node in graph.node:
+        num_channels = _num_output_channels(node, initializers)
+        if num_channels is None or num_channels <= max_output_channels:
+            nodes.append(node)
+            continue
+
+        spec = _TILED_INPUTS[node.op_type]
+        tiles = output_channel_tiles(num_channels, max_output_channels)
+        tile_nodes = []
+        for t, (start, stop) in enumerate(tiles):
+            suffix = f'tile{t}'
+            inputs = list(node.input)
+            weight_index, weight_axis = spec['weight']
+            inputs[weight_index] = _slice_initializer(initializers, new_initializers, inputs[weight_index], weight_axis, start, stop, suffix)
+            for index in spec['per_channel']:
+                inputs[index] = _slice_initializer(initializers, new_initializers, inputs[index], 0, start, stop, suffix)
+            if spec['bias'] is not None and len(inputs) > spec['bias'] and inputs[spec['bias']]:
+                inputs[spec['bias']] = _slice_initializer(initializers, new_initializers, inputs[spec['bias']], 0, start, stop, suffix)
+
+            tile_node = onnx.NodeProto()
+            tile_node.CopyFrom(node)
+            tile_node.name = f'{node.name}_{suffix}'
+            del tile_node.input[:]
+            tile_node.input.extend(inputs)
+            del tile_node.output[:]
+            tile_node.output.extend([f'{node.output[0]}_{suffix}'])
+            tile_nodes.append(tile_node)
+
+        print(f'Splitting {node.name} ({num_channels} output channels) into {len(tiles)} tiles')
+        nodes += tile_nodes[-1:] + tile_nodes[:-1]
+        nodes.append(helper.make_node(
+            'Concat',
+            inputs  = [tile_node.output[0] for tile_node in tile_nodes],
+            outputs = [node.output[0]],
+            name    = f'{node.name}_concat',
+            axis    = spec['output_axis'],
+        ))
+
+    del graph.node[:]
+    graph.node.extend(nodes)
+    graph.initializer.extend(new_initializers)
+
+    # Drop the initializers only the replaced nodes read
+    used = {tensor for node in graph.node for tensor in node.input}
+    kept = [init for init in graph.initializer if init.name in used]
+    del graph.initializer[:]
+    graph.initializer.extend(kept)
+    return tiled_model
+
+def _window_shape(nx_node, initializers):
+    '''
+    (channels, kernel height, kernel width) of the window of a node, None
+    if it is not an analog node. QLinearMatMul windows are 1x1.
+    '''
+    if _num_output_channels(nx_node, initializers) is None:
+        return None
+    weight = initializers[nx_node.input[_TILED_INPUTS[nx_node.op_type]['weight'][0]]]
+    if nx_node.op_type == 'QLinearConv':
+        return weight.dims[1], weight.dims[2], weight.dims[3]
+    return weight.dims[0], 1, 1
+
+def _num_output_pixels(nx_node, tensor_store):
+    shape = tensor_store.shape(nx_node.output[0])
+    if nx_node.op_type == 'QLinearConv':
+        return int(np.prod(shape[2:]))
+    return int(np.prod(shape[:-1]))
+
+def _tile_metadata(nx_model, key):
+    for prop in nx_model.metadata_props:
+        if prop.key == key:
+            return json.loads(prop.value)
+    return {}
+
+def _set_tile_metadata(nx_model, key, tiles_info):
+    props = {prop.key: prop.value for prop in nx_model.metadata_props}
+    props[key] = json.dumps(tiles_info)
+    helper.set_model_props(nx_model, props)
+
+def row_tiles(nx_model : onnx.ModelProto):
+    '''
+    Row tiles of a model made by split_deep_nodes, keyed by node name.
+    '''
+    return _tile_metadata(nx_model, ROW_TILES_KEY)
+
+def channel_groups(nx_model : onnx.ModelProto):
+    '''
+    Channel groups of a model made by split_depthwise_nodes, keyed by node name.
+    '''
+    return _tile_metadata(nx_model, CHANNEL_GROUPS_KEY)
+
+def row_bands(nx_model : onnx.ModelProto):
+    '''
+    Row bands of a model made by split_row_bands, keyed by node name.
+    '''
+    return _tile_metadata(nx_model, ROW_BANDS_KEY)
+
+def split_deep_nodes(
+    nx_model     : onnx.ModelProto,
+    tensor_store,
+    max_rows     : int = 256,
+    psum_depth   : int = PSUM_DEPTH
+):
+    '''
+    Input-channel (row) tiling for layers whose window C*Fx*Fy is longer
+    than the SRAM rows.
+
+    Every such QLinearConv or QLinearMatMul is replaced by row tiles
+    {name}_rtile<r> over channel ranges of at most max_rows // (Fx*Fy)
+    channels, in order. The tiles run back to back over the same output
+    pixels: the first stores its MAC outputs in the psum_buffer, the
+    middle ones add to them and the last adds them, then scales and
+    writes the ofmap under the original output name (psum_mode in CSR 1).
+    The outputs of the other tiles are never written.
+
+    1x1 windows read their channels out of the full ifmap in ACTMEM
+    (CSR_REG_IFMAP_LAYOUT). Larger windows are not contiguous per channel
+    range, so those tiles load their channel slice from external memory.
+
+    Layers with more output pixels than psum_depth do not fit in the
+    partial sums, split_row_bands cuts them into bands first.
+    The tiles are listed in the model metadata (see row_tiles). The
+    returned model is only for mapping and compiling, ONNX cannot run it,
+    so tensor_store has to come from the model before the split.
+
+    Returns nx_model itself if no node is too long, otherwise a copy.
+    '''
+    initializers = {init.name: init for init in nx_model.graph.initializer}
+    deep = []
+    for node_id, node in enumerate(nx_model.graph.node):
+        window = _window_shape(node, initializers)
+        if window is None or np.prod(window) <= max_rows:
+            continue
+        if _num_output_pixels(node, tensor_store) > psum_depth:
+            raise ValueError(f'{node.name} has {_num_output_pixels(node, tensor_store)} output pixels, more than the {psum_depth} partial sums. Split it with tiling.split_row_bands first.')
+        deep.append(node_id)
+    if not deep:
+        return nx_model
+
+    tiled_model = onnx.ModelProto()
+    tiled_model.CopyFrom(nx_model)
+    graph = tiled_model.graph
+
+    tiles_info = row_tiles(nx_model)
+    nodes = []
+    new_initializers = []
+    for node_id, node in enumerate(graph.node):
+        if node_id not in deep:
+            nodes.append(node)
+            continue
+
+        channels, kernel_h, kernel_w = _window_shape(node, initializers)
+        weight_index = _TILED_INPUTS[node.op_type]['weight'][0]
+        channel_axis = 1 if node.op_type == 'QLinearConv' else 0
+        tiles = output_channel_tiles(channels, max_rows // (kernel_h * kernel_w))
+        for r, (start, stop) in enumerate(tiles):
+            suffix = f'rtile{r}'
+            tile_node = onnx.NodeProto()
+            tile_node.CopyFrom(node)
+            tile_node.name = f'{node.name}_{suffix}'
+            tile_node.input[weight_index] = _slice_initializer(initializers, new_initializers, node.input[weight_index], channel_axis, start, stop, suffix)
+            if r < len(tiles) - 1:
+                tile_node.output[0] = f'{node.output[0]}_{suffix}'
+            nodes.append(tile_node)
+            tiles_info[tile_node.name] = {
+                'node'     : node.name,
+                'tile'     : r,
+                'tiles'    : len(tiles),
+                'channels' : [start, stop, channels],
+                'in_place' : bool(kernel_h == 1 and kernel_w == 1),
+            }
+        print(f'Splitting {node.name} (window of {channels}x{kernel_h}x{kernel_w}) into {len(tiles)} row tiles')
+
+    del graph.node[:]
+    graph.node.extend(nodes)
+    graph.initializer.extend(new_initializers)
+
+    used = {tensor for node in graph.node for tensor in node.input}
+    kept = [init for init in graph.initializer if init.name in used]
+    del graph.initializer[:]
+    graph.initializer.extend(kept)
+
+    _set_tile_metadata(tiled_model, ROW_TILES_KEY, tiles_info)
+    return tiled_model
+
+def _depthwise_channels(nx_node, initializers):
+    if nx_node.op_type != 'QLinearConv' or nx_node.input[3] not in initializers:
+        return None
+    group = next((attr.i for attr in nx_node.attribute if attr.name == 'group'), 1)
+    weight = initializers[nx_node.input[3]]
+    if group == 1 or weight.dims[0] != group or weight.dims[1] != 1:
+        return None
+    return group
+
+def depthwise_channel_groups(num_channels, ws_core_size = 32):
+    '''
+    [start, stop) channels of each group, all ws_core_size wide. The last
+    group ends at num_channels and overlaps the one before it if
+    num_channels is not a multiple of ws_core_size.
+    '''
+    starts = list(range(0, num_channels - ws_core_size, ws_core_size)) + [num_channels - ws_core_size]
+    return [(start, start + ws_core_size) for start in starts]
+
+def split_depthwise_nodes(
+    nx_model     : onnx.ModelProto,
+    ws_core_size : int = 32
+):
+    '''
+    Channel tiling for depthwise layers wider than the WSAcc PEs.
+
+    Every depthwise QLinearConv with more than ws_core_size channels is
+    replaced by channel groups {name}_dwtile<g> of ws_core_size channels
+    (see depthwise_channel_groups), each with its own digital weights,
+    scalers and biases. The groups run back to back on the same ifmap:
+    each reads its channels out of the ifmap in ACTMEM
+    (CSR_REG_IFMAP_LAYOUT) and writes them into one ofmap
+    (CSR_REG_OFMAP_LAYOUT), so the ifmap is preserved across groups and
+    only the last group reads the ofmap out. The channels the last group
+    shares with the one before it are written twice with the same values.
+
+    The last group writes the original output, the outputs of the others
+    are never read. The groups are listed in the model metadata (see
+    channel_groups). ONNX cannot run the returned model.
+
+    Returns nx_model itself if no node is too wide, otherwise a copy.
+    '''
+    initializers = {init.name: init for init in nx_model.graph.initializer}
+    wide = [
+        node_id for node_id, node in enumerate(nx_model.graph.node)
+        if (_depthwise_channels(node, initializers) or 0) > ws_core_size
+    ]
+    if not wide:
+        return nx_model
+
+    tiled_model = onnx.ModelProto()
+    tiled_model.CopyFrom(nx_model)
+    graph = tiled_model.graph
+
+    spec = _TILED_INPUTS['QLinearConv']
+    groups_info = channel_groups(nx_model)
+    nodes = []
+    new_initializers = []
+    for node_id, node in enumerate(graph.node):
+        if node_id not in wide:
+            nodes.append(node)
+            continue
+
+        num_channels = _depthwise_channels(node, initializers)
+        groups = depthwise_channel_groups(num_channels, ws_core_size)
+        for g, (start, stop) in enumerate(groups):
+            suffix = f'dwtile{g}'
+            inputs = list(node.input)
+            for index in [spec['weight'][0]] + spec['per_channel']:
+                inputs[index] = _slice_initializer(initializers, new_initializers, inputs[index], 0, start, stop, suffix)
+            if len(inputs) > spec['bias'] and inputs[spec['bias']]:
+                inputs[spec['bias']] = _slice_initializer(initializers, new_initializers, inputs[spec['bias']], 0, start, stop, suffix)
+
+            tile_node = onnx.NodeProto()
+            tile_node.CopyFrom(node)
+            tile_node.name = f'{node.name}_{suffix}'
+            del tile_node.input[:]
+            tile_node.input.extend(inputs)
+            for attr in tile_node.attribute:
+                if attr.name == 'group':
+                    attr.i = stop - start
+            if g < len(groups) - 1:
+                tile_node.output[0] = f'{node.output[0]}_{suffix}'
+            nodes.append(tile_node)
+            groups_info[tile_node.name] = {
+                'node'     : node.name,
+                'tile'     : g,
+                'tiles'    : len(groups),
+                'channels' : [start, stop, num_channels],
+            }
+        print(f'Splitting depthwise {node.name} ({num_channels} channels) into {len(groups)} channel groups')
+
+    del graph.node[:]
+    graph.node.extend(nodes)
+    graph.initializer.extend(new_initializers)
+
+    used = {tensor for node in graph.node for tensor in node.input}
+    kept = [init for init in graph.initializer if init.name in used]
+    del graph.initializer[:]
+    graph.initializer.extend(kept)
+
+    _set_tile_metadata(tiled_model, CHANNEL_GROUPS_KEY, groups_info)
+    return tiled_model
+
+def actmem_footprint(ifmap_shape, num_output_pixels, num_output_channels, num_cols_per_bank = 32):
+    '''
+    ACTMEM bytes a node uses right after its ifmap is loaded: the ifmap
+    (NCHW, rounded up to 32-bit words) and the ofmap behind it, including
+    the bank tail the write queue spills past the last pixel.
+    '''
+    ifmap_bytes = -(-int(np.prod(ifmap_shape)) // 4) * 4
+    tail = -(-num_output_channels // num_cols_per_bank) * num_cols_per_bank - num_output_channels
+    return ifmap_bytes + num_output_pixels * num_output_channels + tail
+
+def _conv_attributes(nx_node):
+    attrs = {attr.name: helper.get_attribute_value(attr) for attr in nx_node.attribute}
+    return list(attrs.get('pads', [0, 0, 0, 0])), list(attrs.get('strides', [1, 1]))
+
+def band_ifmap(tensor, band):
+    '''
+    Ifmap a row band loads: tensor (NCHW) padded by band['pads'] with
+    band['zero_point'], rows band['rows'] of the padded tensor.
+    '''
+    top, left, bottom, right = band['pads']
+    padded = np.pad(
+        tensor, ((0, 0), (0, 0), (top, bottom), (left, right)),
+        constant_values = band['zero_point']
+    )
+    return padded[:, :, band['rows'][0]:band['rows'][1]]
+
+def split_row_bands(
+    nx_model     : onnx.ModelProto,
+    tensor_store,
+    actmem_bytes : int = ACTMEM_BYTES,
+    max_rows     : int = 256,
+    psum_depth   : int = PSUM_DEPTH
+):
+    '''
+    Spatial tiling for convolutions whose ifmap and ofmap do not fit in
+    ACTMEM together (see actmem_footprint), and for convolutions with
+    windows longer than max_rows SRAM rows and more output pixels than
+    psum_depth, so split_deep_nodes can row-tile every band.
+
+    Every such QLinearConv is replaced by row bands {name}_band<b> of as
+    many output rows as fit, and a Concat {name}_bands that merges the
+    band outputs {output}_band<b> along H in external memory. Each band
+    loads its own ifmap rows from external memory, including the halo
+    rows the kernel reads past the band. The padding is done there too,
+    so the band nodes have no pads and stay in the core's symmetric
+    padding.
+
+    The bands are listed in the model metadata (see row_bands, band_ifmap).
+    ONNX cannot run the returned model, tensor_store has to come from the
+    model before the split. The band outputs are added to tensor_store, so
+    pass tensor_store.overlay() to keep a store unchanged. Layers that do
+    not fit even one output row per band are left as they are.
+
+    Returns nx_model itself if every node fits, otherwise a copy.
+    '''
+    initializers = {init.name: init for init in nx_model.graph.initializer}
+    bands_per_node = {}
+    for node_id, node in enumerate(nx_model.graph.node):
+        if node.op_type != 'QLinearConv' or node.input[3] not in initializers:
+            continue
+        ifmap_shape = tensor_store.shape(node.input[0])
+        ofmap_shape = tensor_store.shape(node.output[0])
+        _, channels, height, width = ifmap_shape
+        _, num_output_channels, out_height, out_width = ofmap_shape
+        # Row tiles of deep layers accumulate at most psum_depth pixels
+        window = _window_shape(node, initializers)
+        deep = window is not None and np.prod(window) > max_rows
+        max_band_rows = min(out_height, psum_depth // out_width) if deep else out_height
+        if max_band_rows == out_height and actmem_footprint(ifmap_shape, out_height * out_width, num_output_channels) <= actmem_bytes:
+            continue
+
+        pads, strides = _conv_attributes(node)
+        kernel_h = initializers[node.input[3]].dims[2]
+        padded_width = width + pads[1] + pads[3]
+
+        def band_footprint(rows):
+            in_rows = (rows - 1) * strides[0] + kernel_h
+            return actmem_footprint((1, channels, in_rows, padded_width), rows * out_width, num_output_channels)
+
+        rows = max_band_rows
+        while rows > 0 and band_footprint(rows) > actmem_bytes:
+            rows -= 1
+        if rows == 0:
+            print(f'Not splitting {node.name}: one output row does not fit in {actmem_bytes} bytes of ACTMEM or {psum_depth} partial sums')
+            continue
+        bands_per_node[node_id] = [
+            (start, min(start + rows, out_height)) for start in range(0, out_height, rows)
+        ]
+    if not bands_per_node:
+        return nx_model
+
+    tiled_model = onnx.ModelProto()
+    tiled_model.CopyFrom(nx_model)
+    graph = tiled_model.graph
+
+    bands_info = row_bands(nx_model)
+    nodes = []
+    for node_id, node in enumerate(graph.node):
+        if node_id not in bands_per_node:
+            nodes.append(node)
+            continue
+
+        pads, strides = _conv_attributes(node)
+        kernel_h = initializers[node.input[3]].dims[2]
+        zero_point = int(numpy_helper.to_array(initializers[node.input[2]]).flatten()[0]) if node.input[2] in initializers else 0
+        out_height = tensor_store.shape(node.output[0])[2]
+        bands = bands_per_node[node_id]
+        band_nodes = []
+        for b, (start, stop) in enumerate(bands):
+            band_node = onnx.NodeProto()
+            band_node.CopyFrom(node)
+            band_node.name = f'{node.name}_band{b}'
+            band_node.output[0] = f'{node.output[0]}_band{b}'
+            for attr in band_node.attribute:
+                if attr.name == 'pads':
+                    del attr.ints[:]
+                    attr.ints.extend([0, 0, 0, 0])
+            band_nodes.append(band_node)
+            tensor_store.add(band_node.output[0], tensor_store.value(node.output[0])[:, :, start:stop])
+            bands_info[band_node.name] = {
+                'node'        : node.name,
+                'tile'        : b,
+                'tiles'       : len(bands),
+                'rows'        : [start * strides[0], (stop - 1) * strides[0] + kernel_h],
+                'output_rows' : [start, stop, out_height],
+                'pads'        : pads,
+                'zero_point'  : zero_point,
+            }
+
+        print(f'Splitting {node.name} ({out_height} output rows) into {len(bands)} row bands')
+        nodes += band_nodes
+        nodes.append(helper.make_node(
+            'Concat',
+            inputs  = [band_node.output[0] for band_node in band_nodes],
+            outputs = [node.output[0]],
+            name    = f'{node.name}_bands',
+            axis    = 2,
+        ))
+
+    del graph.node[:]
+    graph.node.extend(nodes)
+    _set_tile_metadata(tiled_model, ROW_BANDS_KEY, bands_info)
+    return tiled_model
+
+def ifmap_view_label(tensor_name, channels = None, band = None):
+    '''
+    Placeholder label of a partial ifmap load: tensor[start:stop] for a
+    channel slice, #rows=..,pads=..,zp=.. for a row band. Parsed back by
+    parse_ifmap_view_label.
+    '''
+    label = tensor_name
+    if channels is not None:
+        label += f'[{channels[0]}:{channels[1]}]'
+    if band is not None:
+        pads = ':'.join(str(pad) for pad in band['pads'])
+        label += f"#rows={band['rows'][0]}:{band['rows'][1]},pads={pads},zp={band['zero_point']}"
+    return label
+
+def parse_ifmap_view_label(label):
+    '''
+    (tensor name, channels or None, band or None) of a label made by ifmap_view_label.
+    '''
+    band = None
+    if '#' in label:
+        label, spec = label.split('#', 1)
+        fields = dict(field.split('=') for field in spec.split(','))
+        band = {
+            'rows'       : [int(row) for row in fields['rows'].split(':')],
+            'pads'       : [int(pad) for pad in fields['pads'].split(':')],
+            'zero_point' : int(fields['zp']),
+        }
+    channels = None
+    if label.endswith(']') and '[' in label:
+        label, channels = label[:-1].rsplit('[', 1)
+        channels = [int(channel) for channel in channels.split(':')]
+    return label, channels, band
+
+def apply_ifmap_view(tensor, channels = None, band = None):
+    '''
+    Part of tensor (NCHW, or a vector for MatMul) a partial ifmap load
+    writes: the row band first, then the channel slice.
+    '''
+    tensor = np.asarray(tensor)
+    if tensor.ndim != 4:
+        tensor = tensor.reshape((1, -1, 1, 1))
+    if band is not None:
+        tensor = band_ifmap(tensor, band)
+    if channels is not None:
+        tensor = tensor[:, channels[0]:channels[1]]
+    return tensor
@@ -0,0 +1,782 @@
+import numpy as np
+import pathlib
+from tests.stim_lib.stimulus_gen import *
+from tests.stim_lib.compile import *
+from tests.stim_lib.program import QrAccProgram, compile_nx_graph_to_program
+from tests.stim_lib.tiling import split_wide_nodes, split_deep_nodes, split_depthwise_nodes, split_row_bands, depthwise_channel_groups, row_bands, row_tiles, parse_ifmap_view_label
+from hw_model.qracc_iss import QrAccIss
+from hw_model.qracc_model import qracc_mac, ideal_mac, adc_comparators, adc_encode
+from hw_model.qracc_perf_model import QrAccPerfModel, STATS_COLUMNS, STATE_CYCLE_COLUMNS
+import pytest
+from .utils import *
+
+@pytest.mark.parametrize(
+    "test_name,         ifmap_shape,   kernel_shape,   core_shape, padding,    stride, mm_offset_x,mm_offset_y, depthwise",[
+    ('singlebank',      (1,3,16,16),   (32,3,3,3),     (256,32),   1,          1,      0,          0,          False),
+    ('offsetxy',        (1,3,16,16),   (32,3,3,3),     (256,256),  1,          1,      69,         38,         False),
+    ('fc_fullload',     (1,27,16,16),  (256,27,3,3),   (256,256),  1,          1,      0,          0,          False),
+    ('fc_wide_2s',      (1,3,16,16),   (256,3,3,3),    (256,256),  1,          2,      0,          0,          False),
+    ('fc_pw_long',      (1,40,16,16),  (32,40,1,1),    (256,256),  0,          1,      0,          0,          False),
+    ('depthwise',       (1,32,16,16),  (32,1,3,3),     (256,256),  1,          1,      0,          0,          True),
+    ('dw_short',        (1,16,16,16),  (16,1,3,3),     (256,256),  1,          1,      0,          0,          True),
+    ('nonsquare',       (1,3,12,20),   (32,3,3,3),     (256,256),  1,          1,      0,          0,          False),
+    ('nonsquare_2s',    (1,8,10,18),   (32,8,3,3),     (256,256),  1,          2,      0,          0,          False),
+    ('dw_nonsquare',    (1,32,12,20),  (32,1,3,3),     (256,256),  1,          1,      0,          0,          True),
+])
+def test_iss_single_node(
+    test_name,
+    ifmap_shape,
+    kernel_shape,
+    core_shape,
+    padding,
+    stride,
+    mm_offset_x,
+    mm_offset_y,
+    depthwise,
+    snr_limit = 1, # Same limit as the RTL test, MBL clipping dominates the error
+):
+    u_code = QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = ifmap_shape,
+        kernel_shape = kernel_shape,
+        offset_x     = mm_offset_x,
+        offset_y     = mm_offset_y,
+        core_size    = core_shape,
+        ws_core_size = 32,
+        pads         = (padding, padding, padding, padding),
+        stride       = (stride, stride),
+        depthwise    = depthwise,
+    )
+
+    iss = QrAccIss(sram_rows=core_shape[0], sram_cols=core_shape[1])
+    iss.run(u_code.compile())
+
+    assert len(iss.readouts) == 1
+    acc_result = iss.readouts[0][1].reshape(u_code.reference_output.shape)
+
+    rmse, snr = rmse_snr(u_code.reference_output, acc_result)
+    assert snr > snr_limit, f'SNR: {snr}'
+
+def test_binary_command_roundtrip(tmp_path):
+    u_code = QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = (1,3,16,16),
+        kernel_shape = (32,3,3,3),
+        offset_x     = 69,
+        offset_y     = 38,
+        core_size    = (256,256),
+        ws_core_size = 32,
+        pads         = (1,1,1,1),
+        stride       = (1,1),
+        depthwise    = False,
+    )
+    commands = u_code.compile()
+    txt_path = write_commands_file(commands, tmp_path, command_format='txt')
+    bin_path = write_commands_file(commands, tmp_path, command_format='bin')
+
+    assert os.path.getsize(bin_path) * 2 < os.path.getsize(txt_path)
+    assert read_commands_file(bin_path) == read_commands_file(txt_path)
+
+    iss_txt = QrAccIss().run(read_commands_file(txt_path))
+    iss_bin = QrAccIss().run(read_commands_file(bin_path))
+    assert np.array_equal(iss_txt.readouts[0][1], iss_bin.readouts[0][1])
+
+def test_binary_commands_drop_ifmap_placeholders(
+    tmp_path,
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+):
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    bin_path = compile_nx_graph_to_file(tmp_path, nx_model, input_dict, command_format='bin', ifmap_placeholders=True, until=5)
+    # Paths are accepted as well as strings
+    placeholder_commands = read_commands_file(pathlib.Path(bin_path))
+
+    # The loads are kept, so the stream is the one compiled without placeholders
+    commands = traverse_and_compile_nx_graph(nx_model, input_dict, until=5)
+    assert placeholder_commands == bin_to_commands(commands_to_bin(commands))
+
+def test_burst_commands_match_single_loads():
+    u_code = QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = (1,32,16,16),
+        kernel_shape = (32,1,3,3),
+        offset_x     = 0,
+        offset_y     = 0,
+        core_size    = (256,256),
+        ws_core_size = 32,
+        pads         = (1,1,1,1),
+        stride       = (1,1),
+        depthwise    = True,
+    )
+    commands = u_code.compile()
+    burst_commands = u_code.compile(burst=True)
+
+    assert sum(len(c) + 1 for c in burst_commands) * 2 < sum(len(c) + 1 for c in commands)
+    iss = QrAccIss().run(commands)
+    iss_burst = QrAccIss().run(burst_commands)
+    assert np.array_equal(iss.readouts[0][1], iss_burst.readouts[0][1])
+
+def test_delta_weight_load_matches_full_load():
+    first, second = [QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = (1,3,16,16),
+        kernel_shape = (32,3,3,3),
+        offset_x     = offset_x,
+        offset_y     = offset_y,
+        core_size    = (256,256),
+        ws_core_size = 32,
+        pads         = (1,1,1,1),
+        stride       = (1,1),
+        depthwise    = False,
+    ) for offset_x, offset_y in [(0, 0), (69, 38)]]
+
+    iss_full = QrAccIss().run(second.compile())
+    delta_commands = second.compile(loaded_weight_data=first.weight_data)
+    iss_delta = QrAccIss().run(first.compile(end=False) + delta_commands)
+
+    stats = second.compile_stats
+    assert stats['weight_words'] + stats['weight_words_skipped'] == len(second.weight_data)
+    assert stats['weight_words'] < len(second.weight_data) // 4
+    assert np.array_equal(iss_delta.weights, iss_full.weights)
+    assert np.array_equal(iss_delta.readouts[-1][1], iss_full.readouts[0][1])
+
+    # Nothing changed, nothing is written
+    second.compile(loaded_weight_data=second.weight_data)
+    assert second.compile_stats['weight_words'] == 0
+
+def test_delta_scaler_load_matches_full_load():
+    first, second = [QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = (1,3,16,16),
+        kernel_shape = (32,3,3,3),
+        offset_x     = offset_x,
+        offset_y     = 0,
+        core_size    = (256,256),
+        ws_core_size = 32,
+        pads         = (1,1,1,1),
+        stride       = (1,1),
+        depthwise    = False,
+    ) for offset_x in [0, 69]]
+
+    iss_full = QrAccIss().run(second.compile())
+    delta_commands = second.compile(
+        loaded_weight_data = first.weight_data,
+        loaded_scaler_data = first.scaler_data,
+        loaded_bias_data   = first.bias_data,
+    )
+    iss_delta = QrAccIss().run(first.compile(end=False) + delta_commands)
+
+    stats = second.compile_stats
+    assert stats['scaler_words'] <= 32 and stats['scaler_words'] + stats['scaler_words_skipped'] == 256
+    assert np.array_equal(iss_delta.readouts[-1][1], iss_full.readouts[0][1])
+
+    # Same scalers already loaded, no scaler load at all
+    second.compile(loaded_scaler_data=second.scaler_data, loaded_bias_data=second.bias_data)
+    assert second.compile_stats['scaler_words'] == 0 and second.compile_stats['bias_words_skipped'] == 256
+
+def test_tensor_store_cache_keeps_colliding_names_apart(tmp_path):
+    _, nx_model, ifmap = sample_onnx_qlinearconv(
+        ifmap_shape  = (1, 3, 8, 8),
+        ifmap_bits   = 8,
+        kernel_shape = (8, 3, 3, 3),
+        kernel_bits  = 1,
+        kernel_dtype = np.int8,
+        pads         = (1, 1, 1, 1),
+        stride       = (1, 1),
+    )
+    tensor_store = IntermediateTensorStore(nx_model, {'x': ifmap}, cache_dir=tmp_path)
+    expected = np.array(tensor_store.value('y'))
+
+    # Both names sanitize to onnx__Conv_12
+    tensor_store.add('onnx::Conv_12', np.zeros((2, 2)))
+    tensor_store.add('onnx__Conv_12', np.ones((3, 3)))
+    assert np.array_equal(tensor_store.value('onnx::Conv_12'), np.zeros((2, 2)))
+    assert np.array_equal(tensor_store.value('onnx__Conv_12'), np.ones((3, 3)))
+    assert np.array_equal(tensor_store.value('y'), expected)
+
+def test_iss_run_entire_mbv2(
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+    imc_core_size = (256, 256),
+    dwc_core_size = 32,
+    snr_limit = 1,
+):
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    # The compiler tiles wide layers first, the store needs their outputs too
+    tensor_store = IntermediateTensorStore(split_wide_nodes(nx_model, imc_core_size[1]), input_dict)
+
+    program = compile_nx_graph_to_program(
+        nx_model,
+        input_dict,
+        imc_core_size = imc_core_size,
+        dwc_core_size = dwc_core_size,
+        tensor_store  = tensor_store,
+    )
+    # Every ifmap loaded from external memory gets its reference value
+    tensors = {}
+    for label, _, _ in program.placeholders():
+        name = parse_ifmap_view_label(label)[0]
+        tensors[name] = tensor_store.value(name)
+    commands = program.link(tensors)
+
+    iss = QrAccIss().run(commands)
+
+    # Tiles, row tiles, channel groups and row bands are nodes of their own
+    compiled_nodes = [node for node in nx_model.graph.node if is_nx_node_compilable(node)]
+    assert len(iss.ofmaps) == commands.count('INFO') > len(compiled_nodes)
+    assert iss.state == 'S_IDLE'
+
+    # The last readout is the quantized graph output
+    output_name = nx_model.graph.output[0].name
+    producer = next(node for node in nx_model.graph.node if output_name in node.output)
+    expected = tensor_store.value(producer.input[0] if producer.op_type == 'DequantizeLinear' else output_name)
+    # ACTMEM bytes, read as the dtype of the output
+    acc_result = iss.readouts[-1][1].view(expected.dtype).reshape(expected.shape)
+
+    rmse, snr = rmse_snr(expected.astype(np.float64), acc_result.astype(np.float64))
+    assert snr > snr_limit, f'SNR: {snr}'
+
+def test_streamed_compilation_matches_list(
+    tmp_path,
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+):
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+
+    commands = traverse_and_compile_nx_graph(nx_model, input_dict, until=10)
+    path = compile_nx_graph_to_file(tmp_path, nx_model, input_dict, until=10)
+
+    assert read_commands_file(path) == commands
+
+def test_parallel_compilation_matches_serial(
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+    n_workers = 4
+):
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+
+    serial = traverse_and_compile_nx_graph(nx_model, input_dict, tensor_store=tensor_store, seed=3)
+    parallel = traverse_and_compile_nx_graph(nx_model, input_dict, tensor_store=tensor_store, seed=3, n_workers=n_workers)
+    reseeded = traverse_and_compile_nx_graph(nx_model, input_dict, tensor_store=tensor_store, seed=4, until=10)
+
+    assert parallel == serial
+    assert reseeded != serial[:len(reseeded)]
+
+def test_compile_cache_hits_and_evicts(tmp_path):
+    u_code = QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = (1,3,16,16),
+        kernel_shape = (32,3,3,3),
+        offset_x     = 69,
+        offset_y     = 38,
+        core_size    = (256,256),
+        ws_core_size = 32,
+        pads         = (1,1,1,1),
+        stride       = (1,1),
+        depthwise    = False,
+    )
+    cache = CompileCache(tmp_path)
+    commands = cache.compile(u_code)
+    assert cache.compile(u_code) == commands
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    burst_commands = cache.compile(u_code, burst=True)
+    assert burst_commands == u_code.compile(burst=True)
+    assert cache.misses == 2
+
+    u_code.ifmap = u_code.ifmap ^ 1
+    cache.compile(u_code)
+    assert cache.misses == 3
+
+    cache.max_bytes = cache.size() // 2
+    cache.evict()
+    assert cache.size() <= cache.max_bytes
+
+def test_perf_model_matches_iss_word_counts(
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+):
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    commands = traverse_and_compile_nx_graph(nx_model, input_dict, until=20)
+
+    model = QrAccPerfModel()
+    nodes = model.node_features(commands)
+    rows = model.estimate(commands)
+    iss = QrAccIss().run(commands)
+
+    assert [row['EventName'] for row in rows] == list(iss.ofmaps.keys())
+    assert all(list(row.keys()) == STATS_COLUMNS for row in rows)
+    for state, words in iss.word_counts.items():
+        if state == 'S_IDLE':
+            continue
+        assert sum(node['features'][state]['words'] for node in nodes) == words
+    assert model.total_cycles(rows) == sum(row[column] for row in rows for column in STATE_CYCLE_COLUMNS.values())
+    assert rows[-1]['Time'] == model.total_cycles(rows) * model.clk_period_ns
+
+def test_perf_model_names_every_node_of_a_file(
+    tmp_path,
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+):
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    commands_path = compile_nx_graph_to_file(tmp_path, nx_model, input_dict, until=30)
+    rows = QrAccPerfModel().estimate_file(commands_path)
+    QrAccPerfModel().write_csv(rows, tmp_path / 'statistics.csv')
+
+    # One row per INFO block, each under its own name
+    num_nodes = read_commands_file(commands_path).count('INFO')
+    names = [row['EventName'] for row in rows]
+    assert len(names) == num_nodes > 1
+    assert len(set(names)) == len(names)
+    with open(tmp_path / 'statistics.csv', 'r') as f:
+        assert [line.split(',')[0] for line in f.read().splitlines()[1:]] == names
+
+    # Standalone nodes name themselves on the first INFO line, before the QrAccNodeCode repr
+    u_code = QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = (1, 3, 8, 8),
+        kernel_shape = (8, 3, 3, 3),
+        offset_x     = 0,
+        offset_y     = 0,
+        core_size    = (256, 256),
+        ws_core_size = 32,
+        pads         = (1, 1, 1, 1),
+        stride       = (1, 1),
+        depthwise    = False,
+    )
+    commands = get_info_command(u_code) + u_code.compile()
+    assert [row['EventName'] for row in QrAccPerfModel().estimate(commands)] == [sanitize_name(u_code.mapped_node.name)]
+
+def test_batched_compilation_loads_bins_once_per_batch(
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+    batch_size = 4,
+):
+    nx_model = onnx.load(modelpath)
+    images = np.random.rand(batch_size, 3, 32, 32).astype(np.float32)
+    tensor_store = IntermediateTensorStore(nx_model, {'input.1': images[:1]})
+
+    single_report, batch_report = CompileReport(), CompileReport()
+    single = traverse_and_compile_nx_graph(nx_model, {'input.1': images[:1]}, until=20, tensor_store=tensor_store, report=single_report)
+    batched = traverse_and_compile_nx_graph(nx_model, {'input.1': images}, until=20, tensor_store=tensor_store, report=batch_report)
+    batch_report.print_report('batched')
+
+    assert batch_report.batch_size == batch_size
+    assert len(batch_report.nodes) == batch_size * len(single_report.nodes)
+    # Same bin loads for the whole batch as for a single image, not batch_size times them
+    assert single_report.totals()['weight_words'] > 0
+    for key in ['weight_words', 'weight_windows']:
+        assert batch_report.totals()[key] == single_report.totals()[key]
+
+    iss = QrAccIss().run(batched)
+    assert len(iss.ofmaps) == batch_size * len(single_report.nodes)
+    assert iss.state == 'S_IDLE'
+
+    model = QrAccPerfModel()
+    single_rate = model.images_per_million_cycles(model.estimate(single))
+    batch_rate = model.images_per_million_cycles(model.estimate(batched), batch_size)
+    print(f'Images per million cycles: single {single_rate:.2f}, batch of {batch_size} {batch_rate:.2f}')
+    # Weight-stationary batching amortises the bin loads over the images
+    assert batch_rate > single_rate
+
+def test_program_relinks_new_inputs(
+    tmp_path,
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+):
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+    commands = traverse_and_compile_nx_graph(nx_model, input_dict, until=10, tensor_store=tensor_store)
+    program = compile_nx_graph_to_program(nx_model, input_dict, until=10, tensor_store=tensor_store)
+
+    # Without new tensors the program links back into the compiled stream
+    assert program.link() == commands
+
+    program.save(tmp_path / 'program.json')
+    program = QrAccProgram.load(tmp_path / 'program.json')
+    name, image, shape = program.placeholders()[0]
+    new_ifmap = np.random.randint(0, 256, shape).astype(np.uint8)
+    linked = program.link({name: new_ifmap})
+
+    assert len(linked) == len(commands) and linked != commands
+    iss_linked = QrAccIss().run(linked)
+    iss_compiled = QrAccIss().run(commands)
+    first_node = next(iter(iss_linked.ofmaps))
+    assert not np.array_equal(iss_linked.ofmaps[first_node], iss_compiled.ofmaps[first_node])
+
+    path = program.link_to_file(tmp_path, {name: new_ifmap})
+    assert read_commands_file(path) == linked
+
+def test_output_channel_tiles_merge_in_actmem(
+    kernel_shape = (300, 3, 3, 3),
+    snr_limit = 1,
+):
+    _, nx_model, ifmap = sample_onnx_qlinearconv(
+        ifmap_shape  = (1, 3, 16, 16),
+        ifmap_bits   = 8,
+        kernel_shape = kernel_shape,
+        kernel_bits  = 1,
+        kernel_dtype = np.int8,
+        pads         = (1, 1, 1, 1),
+        stride       = (1, 1),
+    )
+    input_dict = {'x': ifmap}
+    tiled_model = split_wide_nodes(nx_model, 256)
+    assert [node.op_type for node in tiled_model.graph.node] == ['QLinearConv', 'QLinearConv', 'Concat']
+
+    # Tiling does not change what the model computes
+    expected = IntermediateTensorStore(nx_model, input_dict).value('y')
+    assert np.array_equal(IntermediateTensorStore(tiled_model, input_dict).value('y'), expected)
+
+    # Compiled ifmaps are random, the real one is linked in
+    commands = compile_nx_graph_to_program(nx_model, input_dict).link(input_dict)
+    # The ifmap is loaded once for both tiles
+    assert commands.count(make_trigger_write('TRIGGER_LOAD_ACTIVATION')[0]) == 1
+
+    iss = QrAccIss().run(commands)
+    assert len(iss.readouts) == 1
+    acc_result = iss.readouts[0][1].reshape(expected.shape[2], expected.shape[3], kernel_shape[0])
+
+    rmse, snr = rmse_snr(expected[0].transpose(1, 2, 0), acc_result)
+    assert snr > snr_limit, f'SNR: {snr}'
+
+@pytest.mark.parametrize('kernel_shape, pads, num_ifmap_loads', [
+    ((32, 320, 1, 1), (0, 0, 0, 0), 1),  # Tiles read their channels out of ACTMEM
+    ((32, 40, 3, 3), (1, 1, 1, 1), 2),   # Tiles load their channel slices
+])
+def test_row_tiles_accumulate_partial_sums(
+    kernel_shape,
+    pads,
+    num_ifmap_loads,
+    snr_limit = 1,
+):
+    _, nx_model, ifmap = sample_onnx_qlinearconv(
+        ifmap_shape  = (1, kernel_shape[1], 8, 8),
+        ifmap_bits   = 8,
+        kernel_shape = kernel_shape,
+        kernel_bits  = 1,
+        kernel_dtype = np.int8,
+        pads         = pads,
+        stride       = (1, 1),
+    )
+    input_dict = {'x': ifmap}
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+    tiled_model = split_deep_nodes(nx_model, tensor_store, 256)
+    assert [node.name for node in tiled_model.graph.node] == [f'{nx_model.graph.node[0].name}_rtile{r}' for r in range(2)]
+    assert tiled_model.graph.node[-1].output[0] == 'y'
+
+    commands = compile_nx_graph_to_program(nx_model, input_dict, tensor_store=tensor_store).link(input_dict)
+    assert commands.count(make_trigger_write('TRIGGER_LOAD_ACTIVATION')[0]) == num_ifmap_loads
+
+    iss = QrAccIss().run(commands)
+    assert len(iss.readouts) == 1
+    expected = tensor_store.value('y')
+    acc_result = iss.readouts[0][1].reshape(expected.shape[2], expected.shape[3], kernel_shape[0])
+
+    rmse, snr = rmse_snr(expected[0].transpose(1, 2, 0), acc_result)
+    assert snr > snr_limit, f'SNR: {snr}'
+
+def test_deep_layers_with_many_pixels_tile_per_band(
+    ifmap_shape = (1, 32, 32, 32),
+    kernel_shape = (32, 32, 3, 3),
+    snr_limit = 1,
+):
+    _, nx_model, ifmap = sample_onnx_qlinearconv(
+        ifmap_shape  = ifmap_shape,
+        ifmap_bits   = 8,
+        kernel_shape = kernel_shape,
+        kernel_bits  = 1,
+        kernel_dtype = np.int8,
+        pads         = (1, 1, 1, 1),
+        stride       = (1, 1),
+    )
+    input_dict = {'x': ifmap}
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+    expected = tensor_store.value('y')
+
+    # 1024 output pixels do not fit in the partial sums, bands of 8 rows do
+    band_store = tensor_store.overlay()
+    banded_model = split_row_bands(nx_model, band_store)
+    bands = row_bands(banded_model)
+    assert len(bands) == 4
+    tiled_model = split_deep_nodes(banded_model, band_store, 256)
+    assert len(row_tiles(tiled_model)) == 2 * len(bands)
+
+    commands = compile_nx_graph_to_program(nx_model, input_dict, tensor_store=tensor_store).link(input_dict)
+    iss = QrAccIss().run(commands)
+    assert len(iss.readouts) == len(bands)
+    band_results = []
+    for band, (_, readout) in zip(sorted(bands.values(), key=lambda band: band['tile']), iss.readouts):
+        start, stop, _ = band['output_rows']
+        band_results.append(readout.reshape(stop - start, expected.shape[3], kernel_shape[0]))
+    acc_result = np.concatenate(band_results, axis=0)
+
+    rmse, snr = rmse_snr(expected[0].transpose(1, 2, 0), acc_result)
+    assert snr > snr_limit, f'SNR: {snr}'
+
+@pytest.mark.parametrize('num_channels', [96, 80])
+def test_depthwise_channel_groups_share_the_ifmap(
+    num_channels,
+    snr_limit = 1,
+):
+    _, nx_model, ifmap = sample_onnx_qlinearconv(
+        ifmap_shape  = (1, num_channels, 16, 16),
+        ifmap_bits   = 8,
+        kernel_shape = (num_channels, 1, 3, 3),
+        kernel_bits  = 7,
+        kernel_dtype = np.int8,
+        pads         = (1, 1, 1, 1),
+        stride       = (1, 1),
+        depthwise    = True,
+    )
+    input_dict = {'x': ifmap}
+    groups = depthwise_channel_groups(num_channels, 32)
+    assert all(stop - start == 32 for start, stop in groups) and groups[-1][1] == num_channels
+    assert len(split_depthwise_nodes(nx_model, 32).graph.node) == len(groups)
+
+    commands = compile_nx_graph_to_program(nx_model, input_dict).link(input_dict)
+    # Every group loads its own weights, the ifmap is loaded once
+    assert commands.count(make_trigger_write('TRIGGER_LOAD_ACTIVATION')[0]) == 1
+    assert commands.count(make_trigger_write('TRIGGER_LOADWEIGHTS_DIGITAL')[0]) == len(groups)
+
+    iss = QrAccIss().run(commands)
+    assert len(iss.readouts) == 1
+    expected = IntermediateTensorStore(nx_model, input_dict).value('y')
+    acc_result = iss.readouts[0][1].reshape(expected.shape[2], expected.shape[3], num_channels)
+
+    rmse, snr = rmse_snr(expected[0].transpose(1, 2, 0), acc_result)
+    assert snr > snr_limit, f'SNR: {snr}'
+
+def test_row_bands_fit_actmem(
+    ifmap_shape = (1, 16, 128, 96),
+    kernel_shape = (16, 16, 3, 3),
+    snr_limit = 1,
+):
+    _, nx_model, ifmap = sample_onnx_qlinearconv(
+        ifmap_shape  = ifmap_shape,
+        ifmap_bits   = 8,
+        kernel_shape = kernel_shape,
+        kernel_bits  = 1,
+        kernel_dtype = np.int8,
+        pads         = (1, 1, 1, 1),
+        stride       = (1, 1),
+    )
+    input_dict = {'x': ifmap}
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+    expected = tensor_store.value('y')
+
+    # The ifmap and ofmap do not fit in ACTMEM together
+    banded_model = split_row_bands(nx_model, tensor_store.overlay())
+    bands = row_bands(banded_model)
+    assert len(bands) == 2
+    assert [node.op_type for node in banded_model.graph.node] == ['QLinearConv'] * len(bands) + ['Concat']
+    assert banded_model.graph.node[-1].output[0] == 'y'
+
+    commands = compile_nx_graph_to_program(nx_model, input_dict, tensor_store=tensor_store).link(input_dict)
+    # The band outputs stay out of the caller's store, a second compile gives the same stream
+    assert not any(band_node.output[0] in tensor_store for band_node in banded_model.graph.node[:-1])
+    assert compile_nx_graph_to_program(nx_model, input_dict, tensor_store=tensor_store).link(input_dict) == commands
+    # Every band loads its own rows and writes its own ofmap
+    assert commands.count(make_trigger_write('TRIGGER_LOAD_ACTIVATION')[0]) == len(bands)
+
+    iss = QrAccIss().run(commands)
+    assert len(iss.readouts) == len(bands)
+    band_results = []
+    for band, (_, readout) in zip(sorted(bands.values(), key=lambda band: band['tile']), iss.readouts):
+        start, stop, _ = band['output_rows']
+        band_results.append(readout.reshape(stop - start, expected.shape[3], kernel_shape[0]))
+    acc_result = np.concatenate(band_results, axis=0)
+
+    rmse, snr = rmse_snr(expected[0].transpose(1, 2, 0), acc_result)
+    assert snr > snr_limit, f'SNR: {snr}'
+
+def sample_branch_model(channels = 16, size = 8):
+    '''
+    1x1 QLinearConvs x -> a -> b -> d, then a -> c, so c reads a after
+    two other nodes ran. c and d are the graph outputs.
+    '''
+    nodes, initializers, ifmap = [], [], None
+    for name, input_name in [('a', 'x'), ('b', 'a'), ('d', 'b'), ('c', 'a')]:
+        nx_node, single_model, node_ifmap = sample_onnx_qlinearconv(
+            ifmap_shape  = (1, channels, size, size),
+            ifmap_bits   = 8,
+            kernel_shape = (channels, channels, 1, 1),
+            kernel_bits  = 1,
+            kernel_dtype = np.int8,
+            pads         = (0, 0, 0, 0),
+            stride       = (1, 1),
+            seed         = len(nodes),
+        )
+        ifmap = node_ifmap if ifmap is None else ifmap
+        renamed = {init.name: f'{name}_{init.name}' for init in single_model.graph.initializer}
+        for init in single_model.graph.initializer:
+            init.name = renamed[init.name]
+            initializers.append(init)
+        nx_node.name = name
+        nx_node.input[0] = input_name
+        for i in range(1, len(nx_node.input)):
+            nx_node.input[i] = renamed[nx_node.input[i]]
+        nx_node.output[0] = name
+        nodes.append(nx_node)
+
+    graph = onnx.helper.make_graph(
+        nodes, 'branch',
+        inputs  = [onnx.helper.make_tensor_value_info('x', onnx.TensorProto.UINT8, ifmap.shape)],
+        outputs = [onnx.helper.make_tensor_value_info(name, onnx.TensorProto.UINT8, None) for name in ['d', 'c']],
+        initializer = initializers,
+    )
+    nx_model = onnx.helper.make_model(graph, opset_imports=single_model.opset_import)
+    return nx_model, ifmap
+
+def test_actmem_allocator_keeps_branch_tensors_resident():
+    nx_model, ifmap = sample_branch_model()
+    input_dict = {'x': ifmap}
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+
+    running_report, allocated_report = CompileReport(), CompileReport()
+    running = compile_nx_graph_to_program(nx_model, input_dict, tensor_store=tensor_store, report=running_report)
+    allocated = compile_nx_graph_to_program(nx_model, input_dict, tensor_store=tensor_store, report=allocated_report, allocate_actmem=True)
+    running_report.print_report('running addresses')
+    allocated_report.print_report('allocated')
+
+    # a stays in ACTMEM for c instead of being loaded again
+    assert [name for name, _, _ in running.placeholders()] == ['x', 'a']
+    assert [name for name, _, _ in allocated.placeholders()] == ['x']
+    assert allocated_report.external_bytes() < running_report.external_bytes()
+
+    iss = QrAccIss().run(allocated.link(input_dict))
+    assert [name for name, _ in iss.readouts] == ['d', 'c']
+
+    # Same outputs as the running addresses, given the a that ISS computed
+    a = iss.ofmaps['a'].transpose(2, 0, 1)[None]
+    running_iss = QrAccIss().run(running.link({'x': ifmap, 'a': a}))
+    for (_, expected), (_, actual) in zip(running_iss.readouts, iss.readouts):
+        assert np.array_equal(expected, actual)
+
+def qracc_mac_reference(x, weights, adc_ref_range_shifts, n_input_bits, binary):
+    '''
+    One vector and column at a time, as ts_qracc and seq_acc compute them.
+    '''
+    s = adc_ref_range_shifts
+    out = np.zeros((x.shape[0], weights.shape[1]), dtype=np.int64)
+    for b, vector in enumerate(x):
+        for col in range(weights.shape[1]):
+            acc = 0
+            for plane in range(n_input_bits - 1):
+                mbl = 0
+                for row, value in enumerate(vector):
+                    trit = (abs(int(value)) >> plane & 1) * (1 if value >= 0 else -1)
+                    if weights[row, col]:
+                        mbl += trit
+                    elif not binary:
+                        mbl -= trit
+                if mbl > (1 << (3 + s)) - 1:
+                    level = 7
+                elif mbl < -(1 << (3 + s)):
+                    level = -8
+                else:
+                    level = (mbl >> s) & 0xF
+                    if s > 1:
+                        level += (mbl >> (s - 1)) & 1
+                    level = (level & 0xF) - 16 * ((level >> 3) & 1)
+                acc += level << plane
+            acc = ((acc + 2**15) % 2**16) - 2**15
+            out[b, col] = ((acc << s) + 2**15) % 2**16 - 2**15
+    return out
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_qracc_model_matches_rtl_reference(
+    binary,
+    n_input_bits = 4,
+    snr_limit = 1,
+):
+    rng = np.random.default_rng(0)
+    weights = rng.integers(0, 2, (64, 16)).astype(np.int8)
+    x = rng.integers(-(2**(n_input_bits-1)) + 1, 2**(n_input_bits-1), (8, 64))
+
+    for shifts in range(5):
+        expected = qracc_mac_reference(x, weights, shifts, n_input_bits, binary)
+        actual = qracc_mac(x, weights, shifts, n_input_bits=n_input_bits, binary=binary, batch_chunk=3)
+        assert np.array_equal(expected, actual)
+
+    # Every level survives the comparators and qr_acc_wrapper's encoder
+    levels = np.arange(-8, 8)
+    assert np.array_equal(adc_encode(adc_comparators(levels)), levels)
+
+    # Batches large enough for SNR sweeps
+    x = rng.integers(-127, 128, (4096, 256))
+    weights = rng.integers(0, 2, (256, 64)).astype(np.int8)
+    rmse, snr = rmse_snr(ideal_mac(x, weights, binary), qracc_mac(x, weights, 3, binary=binary))
+    assert snr > snr_limit, f'SNR: {snr}'
+
+def test_perf_model_calibration_recovers_coefficients(
+    tmp_path,
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+):
+    from results.calibrate_perf_model import load_runs, fit_coefficients, residual_report
+
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    commands_path = compile_nx_graph_to_file(tmp_path, nx_model, input_dict, until=30)
+    os.rename(commands_path, tmp_path / 'qracc_commands_mbv2_test.txt')
+
+    # Statistics generated by a model with known coefficients stand in for an RTL run
+    true_model = QrAccPerfModel()
+    true_model.coefficients = {state: {name: 3 * value + 1 for name, value in features.items()}
+                               for state, features in true_model.coefficients.items()}
+    rows = true_model.estimate_file(tmp_path / 'qracc_commands_mbv2_test.txt')
+    true_model.write_csv(rows, tmp_path / 'qracc_statistics_mbv2_test.csv')
+
+    runs = load_runs(tmp_path)
+    report = residual_report(runs, fit_coefficients(runs))
+    assert len(runs) == len(rows)
+    assert runs['EventName'].tolist() == [row['EventName'] for row in rows]
+    assert np.all(report['max_abs_error'] < 1)
+
+def test_perf_model_calibration_pairs_nodes_by_position(
+    tmp_path,
+    layer_shapes = [((1, 3, 16, 16), (32, 3, 3, 3)), ((1, 16, 8, 8), (64, 16, 1, 1)), ((1, 27, 12, 12), (128, 27, 3, 3))],
+):
+    from results.calibrate_perf_model import load_runs, fit_coefficients, residual_report
+
+    # Single-node tests all sanitize to the same name, only their order tells them apart
+    commands = []
+    for ifmap_shape, kernel_shape in layer_shapes:
+        u_code = QrAccNodeCode.produce_single_node_test(
+            ifmap_shape  = ifmap_shape,
+            kernel_shape = kernel_shape,
+            offset_x     = 0,
+            offset_y     = 0,
+            core_size    = (256, 256),
+            ws_core_size = 32,
+            pads         = (1, 1, 1, 1) if kernel_shape[2] > 1 else (0, 0, 0, 0),
+            stride       = (1, 1),
+            depthwise    = False,
+        )
+        commands += get_info_command(u_code) + u_code.compile()
+    os.rename(write_commands_file(commands, tmp_path), tmp_path / 'qracc_commands_single_test.txt')
+
+    rng = np.random.default_rng(0)
+    true_model = QrAccPerfModel()
+    true_model.coefficients = {state: {name: int(rng.integers(1, 50)) for name in features}
+                               for state, features in true_model.coefficients.items()}
+    rows = true_model.estimate(commands)
+    true_model.write_csv(rows, tmp_path / 'qracc_statistics_single_test.csv')
+    assert len({row['EventName'] for row in rows}) == 1
+
+    # Every node keeps its own cycles next to its own features
+    runs = load_runs(tmp_path)
+    assert len(runs) == len(layer_shapes)
+    for (_, run), row in zip(runs.iterrows(), rows):
+        assert all(run[column] == row[column] for column in STATE_CYCLE_COLUMNS.values())
+    report = residual_report(runs, fit_coefficients(runs))
+    assert np.all(report['max_abs_error'] < 1)
@@ -1,7 +1,10 @@
 import numpy as np
 from tests.stim_lib.stimulus_gen import *
 from tests.stim_lib.compile import *
-from hwacctools.comp_graph import compute, cgraph, cnodes, core
+from hwacctools.comp_graph import compute, cgraph, cnodes, core, packer_utils as pu
+from tests.stim_lib.schedule import schedule_cost, schedule_report
+from tests.stim_lib.packers import make_packers
+from tests.stim_lib.sequential_packer import SequentialWriteCostPacker
 from hwacctools.onnx_tools import onnx_splitter
 import hwacctools.onnx_utils as onnx_utils
 import hwacctools.quantization.quant as quant
@@ -71,14 +74,15 @@ def test_marp_compilation_all_nodes_in_onnx(
         'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
     }
 
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+
     commands = []
     for mnode_index in range(len(u_nx_mapping.mapped_nodes)):
         node = u_nx_mapping.mapped_nodes[mnode_index]
         node_id = node.node_id
         bin = u_nx_mapping.mapped_bins[node.bin_id] if not node.depthwise else None
 
-        input_tensor_shape = onnx_utils.get_intermediate_tensor_value(
-            nx_model, nx_model.graph.node[node_id].input[0], input_dict=input_dict).shape
+        input_tensor_shape = tensor_store.shape(nx_model.graph.node[node_id].input[0])
         input_tensor = np.random.randint(0, 256, input_tensor_shape).astype(np.uint8)
 
         u_code = QrAccNodeCode(
@@ -87,7 +91,9 @@ def test_marp_compilation_all_nodes_in_onnx(
             ifmap = input_tensor,
             imc_core_size = imc_core_size,
             ws_core_size = dwc_core_size,
-            nx_model = nx_model
+            nx_model = nx_model,
+            tensor_store = tensor_store,
+            compile_only = True
         )
 
         if mnode_index == 0: 
@@ -115,6 +121,8 @@ def test_marp_run_entire_mbv2(
         'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
     }
 
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+
     prev_node = None
     next_node = None
     prev_bin_id = None
@@ -124,7 +132,7 @@ def test_marp_run_entire_mbv2(
 
         if is_nx_node_compilable(nx_node):
             input_tensor = generate_random_intermediate_tensor(
-                nx_model, node_id, input_dict
+                nx_model, node_id, input_dict, tensor_store
             )
             u_code = QrAccNodeCode(
                 mapped_node = u_nx_mapping.get_mapped_node_by_id(node_id),
@@ -132,7 +140,8 @@ def test_marp_run_entire_mbv2(
                 ifmap = input_tensor,
                 imc_core_size = imc_core_size,
                 ws_core_size = dwc_core_size,
-                nx_model = nx_model
+                nx_model = nx_model,
+                tensor_store = tensor_store
             )
 
             print('============ Compiling Node ============')
@@ -158,3 +167,131 @@ def test_marp_run_entire_mbv2(
             print(f'Skipping {nx_node.name} as it is not compilable...')
 
         prev_node = nx_node
+
+def test_graph_index_consumers(
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx'
+):
+    nx_model = onnx.load(modelpath)
+    graph_index = NxGraphIndex(nx_model)
+
+    assert sorted(graph_index.order) == list(range(len(nx_model.graph.node)))
+    for node_id, nx_node in enumerate(nx_model.graph.node):
+        for tensor in nx_node.input:
+            for producer in graph_index.producers_of(tensor):
+                assert graph_index.position[producer] < graph_index.position[node_id]
+        if nx_node.output[0] in graph_index.graph_outputs:
+            continue
+        assert graph_index.has_noncompilable_consumer(node_id) == check_if_any_consumers_are_noncompilable(nx_model, nx_node)
+
+def test_hex_formatting_throughput(
+    nwords = 2**16
+):
+    '''
+    Micro-benchmark of the bulk hex formatter against the per-element vhex3 loop.
+    '''
+    import time
+
+    write_array = np.random.randint(0, 2**32, nwords, dtype=np.uint64)
+
+    start = time.perf_counter()
+    reference = [f"LOAD 00000100 {vhex3(element)}" for element in write_array]
+    elapsed_vhex3 = time.perf_counter() - start
+
+    start = time.perf_counter()
+    asm = write_array_to_asm(write_array)
+    elapsed_bulk = time.perf_counter() - start
+
+    print(f'vhex3 loop:     {nwords/elapsed_vhex3:12.0f} words/s')
+    print(f'bulk formatter: {nwords/elapsed_bulk:12.0f} words/s')
+
+    assert asm == reference
+    assert elapsed_bulk < elapsed_vhex3
+
+@pytest.mark.parametrize("ifmap_shape,kernel_shape,padding,stride,depthwise",[
+    ((1,3,16,16),   (32,3,3,3),   1, 1, False),
+    ((1,3,16,16),   (32,3,3,3),   1, 2, False),
+    ((1,40,16,16),  (32,40,1,1),  0, 1, False),
+    ((1,32,16,16),  (32,1,3,3),   1, 1, True),
+])
+def test_lazy_first_window_matches_toeplitz(ifmap_shape, kernel_shape, padding, stride, depthwise):
+    u_code = QrAccNodeCode.produce_single_node_test(
+        ifmap_shape  = ifmap_shape,
+        kernel_shape = kernel_shape,
+        offset_x     = 0,
+        offset_y     = 0,
+        core_size    = (256,256),
+        ws_core_size = 32,
+        pads         = (padding, padding, padding, padding),
+        stride       = (stride, stride),
+        depthwise    = depthwise,
+    )
+    first_window = u_code.first_toeplitz_window
+    assert 'toeplitz' not in vars(u_code)
+    assert np.array_equal(first_window, u_code.toeplitz[0])
+
+@pytest.mark.parametrize(
+    "packer_and_name",
+    [
+        ("Default", None),
+        ("Naive", pu.NaiveRectpackPacker(256,256, rotation=False)),
+    ]
+)
+def test_bin_reuse_schedule(
+    packer_and_name,
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
+    imc_core_size = (256, 256),
+    dwc_core_size = 32,
+):
+    packername, packer = packer_and_name
+    nx_model = onnx.load(modelpath)
+    input_dict = {
+        'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)
+    }
+    tensor_store = IntermediateTensorStore(nx_model, input_dict)
+    u_nx_mapping = core.NxModelMapping(nx_model, imc_core_size=imc_core_size, dwc_core_size=dwc_core_size, packer=packer)
+    graph_index = NxGraphIndex(nx_model)
+
+    report = schedule_report(graph_index, u_nx_mapping, tensor_store, imc_core_size, name=packername)
+    scheduled_index = graph_index.with_order(report['order'])  # Raises if dependencies are broken
+
+    total_saved = report['saved']['weight_words'] + report['saved']['digital_weight_words'] + report['saved']['ifmap_words']
+    assert total_saved >= 0
+
+    # The cost model has to agree with what the compiler plans for the same order
+    plans = plan_nx_graph(u_nx_mapping, scheduled_index)
+    assert report['scheduled']['ifmap_loads'] == sum(plan.include_ifmap_writes for plan in plans)
+    assert report['scheduled']['preserved_ifmaps'] == sum(plan.preserve_ifmap for plan in plans)
+    assert report['scheduled']['weight_rewrites'] == sum(
+        plan.write_weights and not u_nx_mapping.get_mapped_node_by_id(plan.node_id).depthwise for plan in plans
+    )
+
+def test_packer_benchmark(
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx'
+):
+    from results.benchmark_packers import benchmark_packers
+
+    table = benchmark_packers([modelpath])
+
+    assert len(table) == len(make_packers())
+    assert 'error' not in table.columns
+    assert (table['weight_write_words'] >= table['scheduled_weight_write_words']).all()
+    assert ((table['utilisation'] > 0) & (table['utilisation'] <= 1)).all()
+
+def test_sequential_packer_minimises_bin_switches(
+    modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx'
+):
+    from results.benchmark_packers import benchmark_packers
+
+    table = benchmark_packers([modelpath]).set_index('packer')
+    sequential = table.loc['Sequential']
+
+    assert sequential['bin_switches'] == sequential['bins'] # Every bin is written once
+    assert sequential['bin_switches'] <= table['bin_switches'].min()
+    assert sequential['pack_time_s'] < 1
+
+    commands = traverse_and_compile_nx_graph(
+        onnx.load(modelpath),
+        {'input.1': np.random.rand(1, 3, 32, 32).astype(np.float32)},
+        packer = SequentialWriteCostPacker()
+    )
+    assert commands[-1] == 'END'
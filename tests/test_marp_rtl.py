@@ -1,6 +1,7 @@
 import numpy as np
 from tests.stim_lib.stimulus_gen import *
 from tests.stim_lib.compile import *
+from tests.stim_lib.packers import make_packers
 from hwacctools.comp_graph import compute, cgraph, cnodes, core, packer_utils as pu
 from hwacctools.onnx_tools import onnx_splitter
 import hwacctools.onnx_utils as onnx_utils
@@ -57,6 +58,7 @@ def test_qracc_with_onnx_single_node(
     modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
     imc_core_size = (256, 256),
     dwc_core_size = 32,
+    compile_cache_dir = 'tests/.compile_cache', # None to always recompile
 ):    
     
     package_list = ['../rtl/qracc_params.svh','../rtl/qracc_pkg.svh']
@@ -72,6 +74,7 @@ def test_qracc_with_onnx_single_node(
         '../rtl/twos_to_bipolar.sv',
         '../rtl/ts_qracc_multibank.sv',
         '../rtl/qr_acc_top.sv',
+        '../rtl/psum_buffer.sv',
         '../rtl/output_scaler/output_scaler_set.sv',
         '../rtl/output_scaler/output_scaler.sv',
         '../rtl/memory/ram_2w2r.sv',
@@ -111,7 +114,8 @@ def test_qracc_with_onnx_single_node(
         dwc_core_size = dwc_core_size
     )
 
-    commands = u_code.compile()
+    compile_cache = CompileCache(compile_cache_dir) if compile_cache_dir is not None else None
+    commands = compile_cache.compile(u_code) if compile_cache is not None else u_code.compile()
     with open(f'{stimulus_output_path}/commands.txt', 'w') as f:
         for write in commands:
             f.write(write + '\n')
@@ -146,6 +150,7 @@ def test_qracc_with_all_onnx_single_node(
     modelpath = 'onnx_models/mbv2_cifar10_int8_binary.onnx',
     imc_core_size = (256, 256),
     dwc_core_size = 32,
+    compile_cache_dir = 'tests/.compile_cache', # None to always recompile
 ):  
     '''
     Runs all nodes in the model and compares the output to the expected output.
@@ -165,6 +170,7 @@ def test_qracc_with_all_onnx_single_node(
         '../rtl/twos_to_bipolar.sv',
         '../rtl/ts_qracc_multibank.sv',
         '../rtl/qr_acc_top.sv',
+        '../rtl/psum_buffer.sv',
         '../rtl/output_scaler/output_scaler_set.sv',
         '../rtl/output_scaler/output_scaler.sv',
         '../rtl/memory/ram_2w2r.sv',
@@ -201,6 +207,7 @@ def test_qracc_with_all_onnx_single_node(
 
     snrs = np.zeros(len(u_code.mapped_nodes))
     rmses = np.zeros(len(u_code.mapped_nodes))
+    compile_cache = CompileCache(compile_cache_dir) if compile_cache_dir is not None else None
     for mnode_index in range(len(u_code.mapped_nodes)):
 
         u_code = get_single_node_marp_code(
@@ -210,7 +217,7 @@ def test_qracc_with_all_onnx_single_node(
             dwc_core_size = dwc_core_size
         )
 
-        commands = u_code.compile()
+        commands = compile_cache.compile(u_code) if compile_cache is not None else u_code.compile()
         with open(f'{stimulus_output_path}/commands.txt', 'w') as f:
             for write in commands:
                 f.write(write + '\n')
@@ -250,27 +257,7 @@ def test_qracc_with_all_onnx_single_node(
 )
 @pytest.mark.parametrize(
     "packer_and_name",
-    [
-        ("Dense",rectpack.newPacker(
-            mode=rectpack.PackingMode.Offline,
-            # bin_algo=rectpack.PackingBin.BBF, 
-            rotation=False, 
-            pack_algo=rectpack.MaxRectsBssf
-        )),
-        ("Naive",pu.NaiveRectpackPacker(256,256, rotation=False)),
-        ("Tradeoff",rectpack.newPacker(
-            mode=rectpack.PackingMode.Online,
-            bin_algo=rectpack.PackingBin.BBF, 
-            rotation=False, 
-            pack_algo=rectpack.MaxRectsBssf
-        )),
-        ("Write Optimized",rectpack.newPacker(
-            mode=rectpack.PackingMode.Online,
-            bin_algo=rectpack.PackingBin.BNF, 
-            rotation=False, 
-            pack_algo=rectpack.MaxRectsBssf
-        )),
-    ]
+    make_packers()
 )
 def test_qracc_run_nx_model(
     simulator,
@@ -280,6 +267,10 @@ def test_qracc_run_nx_model(
     dwc_core_size = 32,
     until = None,
     starting = 0,
+    command_format = 'txt', # 'bin' for fixed-width binary records
+    burst = False,          # LOADBURST for contiguous data writes
+    compile_cache_dir = 'tests/.compile_cache', # None to always recompile
+    batch_size = 1,         # Images in one weight-stationary stream
 ):    
     model_name, nx_model = nx_model_and_name
     packername, packer = packer_and_name
@@ -305,6 +296,7 @@ def test_qracc_run_nx_model(
         '../rtl/twos_to_bipolar.sv',
         '../rtl/ts_qracc_multibank.sv',
         '../rtl/qr_acc_top.sv',
+        '../rtl/psum_buffer.sv',
         '../rtl/output_scaler/output_scaler_set.sv',
         '../rtl/output_scaler/output_scaler.sv',
         '../rtl/memory/ram_2w2r.sv',
@@ -341,6 +333,8 @@ def test_qracc_run_nx_model(
         "TRACK_STATISTICS": 1, # Enable tracking of statistics
         "MODEL_MEM": 1, # This only works with the model memory :D
     }
+    if command_format == 'bin':
+        parameter_list["BINARY_COMMANDS"] = 1
     print(f'Parameter list: {parameter_list}')
     write_parameter_definition_file(parameter_list,param_file_path)
 
@@ -358,19 +352,20 @@ def test_qracc_run_nx_model(
         input_name: np.random.rand(*input_shape).astype(np.float32)
     }
 
-    commands = traverse_and_compile_nx_graph(
-        nx_model      = nx_model,
-        input_dict    = input_dict,
-        imc_core_size = imc_core_size,
-        dwc_core_size = dwc_core_size,
-        until         = until,
-        starting      = starting,
-        packer        = packer
-    )  
-
-    with open(f'{stimulus_output_path}/commands.txt', 'w') as f:
-        for write in commands:
-            f.write(write + '\n')
+    commands_path = compile_nx_graph_to_file(
+        stimulus_output_path,
+        nx_model       = nx_model,
+        input_dict     = input_dict,
+        command_format = command_format,
+        imc_core_size  = imc_core_size,
+        dwc_core_size  = dwc_core_size,
+        until          = until,
+        starting       = starting,
+        packer         = packer,
+        burst          = burst,
+        cache          = CompileCache(compile_cache_dir) if compile_cache_dir is not None else None,
+        batch_size     = batch_size,
+    )
 
     # Simulation
     run_simulation(simulator,{},package_list,tb_file,sim_args,rtl_file_list,log_file,run=True)
@@ -381,4 +376,6 @@ def test_qracc_run_nx_model(
     stats_dest_name = f'results/qracc_statistics_{model_name}_{packername}.csv'
     import shutil
     shutil.copy(stats_file, stats_dest_name)
+    # Kept next to the statistics so results/calibrate_perf_model.py can join them
+    shutil.copy(commands_path, f'results/qracc_commands_{model_name}_{packername}.{command_format}')
         
\ No newline at end of file
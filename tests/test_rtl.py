@@ -84,6 +84,7 @@ def test_qr_acc_top_single_load(
         '../rtl/twos_to_bipolar.sv',
         '../rtl/ts_qracc_multibank.sv',
         '../rtl/qr_acc_top.sv',
+        '../rtl/psum_buffer.sv',
         '../rtl/output_scaler/output_scaler_set.sv',
         '../rtl/output_scaler/output_scaler.sv',
         '../rtl/memory/ram_2w2r.sv',